@@ -0,0 +1,18 @@
+# Настройки gunicorn для сбора метрик Prometheus со всех воркеров (PROMETHEUS_MULTIPROC_DIR)
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Файлы метрик от предыдущего запуска исказили бы счётчики
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,274 @@
+"""
+Нагрузочный стенд для чатов: N вебсокет-клиентов в M чатах на /ws/chat/{chat_id}.
+
+Скрипт создаёт в базе временных пользователей и групповые чаты (chat_participants),
+подключает клиентов с JWT в cookie "Messager", каждый клиент отправляет сообщения
+с заданной частотой, а все участники чата замеряют задержку доставки.
+
+В отчёте: перцентили задержки доставки, сообщений в секунду (отправлено и доставлено),
+запросов к БД на сообщение (pg_stat_statements, иначе транзакций из pg_stat_database),
+прирост памяти процессов сервера на одно соединение (/proc/<pid>/status) и процессорное
+время сервера на одно доставленное сообщение (/proc/<pid>/stat).
+
+--encoding выбирает протокол клиентов: legacy (без подпротокола), json или msgpack
+(подпротоколы chat.v2.*) — для сравнения затрат на сериализацию кадров.
+
+Запуск (приложение уже работает с локальными Postgres и Redis, переменные окружения те же):
+
+    python -m loadtest.chat_load --url ws://localhost:8080 --clients 200 --chats 20 \\
+        --rate 1 --duration 30 --server-pid $(pgrep -d, -f "gunicorn src.app")
+
+--max-p99 и --min-delivery завершают скрипт с кодом 1, если порог нарушен (для проверки регрессий).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import msgpack
+import websockets
+from sqlalchemy import delete, insert, select, text
+
+from src.auth.auth_cookie import cookie_transport, get_jwt_strategy
+from src.auth.models import User
+from src.Chat.models import Chat, ChatParticipant, Message
+from src.database import async_session_maker, engine
+
+# Префикс текста сообщений стенда: "lt:<время отправки>:<клиент>:<номер>"
+MESSAGE_PREFIX = "lt"
+SUBPROTOCOLS = {"legacy": None, "json": "chat.v2.json", "msgpack": "chat.v2.msgpack"}
+
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.delivered = 0
+        self.latencies: List[float] = []
+        self.errors = 0
+
+
+async def create_fixtures(clients: int, chats: int) -> Dict[str, list]:
+    # Пользователи и чаты создаются напрямую в БД: регистрация и подтверждение почты не нагружаются
+    run_id = uuid.uuid4().hex[:8]
+    async with async_session_maker() as session:
+        user_ids = (await session.execute(
+            insert(User).returning(User.id),
+            [
+                {"email": f"loadtest-{run_id}-{i}@example.com", "username": f"loadtest_{run_id}_{i}",
+                 "hashed_password": "!", "is_active": True, "is_superuser": False, "is_verified": True}
+                for i in range(clients)
+            ],
+        )).scalars().all()
+        chat_ids = (await session.execute(
+            insert(Chat).returning(Chat.id), [{"participants": []} for _ in range(chats)]
+        )).scalars().all()
+        await session.execute(insert(ChatParticipant), [
+            {"chat_id": chat_ids[i % chats], "user_id": user_id} for i, user_id in enumerate(user_ids)
+        ])
+        await session.commit()
+    return {"users": list(user_ids), "chats": list(chat_ids)}
+
+
+async def drop_fixtures(fixtures: Dict[str, list]):
+    async with async_session_maker() as session:
+        await session.execute(delete(Message).where(Message.chat_id.in_(fixtures["chats"])))
+        await session.execute(delete(ChatParticipant).where(ChatParticipant.chat_id.in_(fixtures["chats"])))
+        await session.execute(delete(Chat).where(Chat.id.in_(fixtures["chats"])))
+        await session.execute(delete(User).where(User.id.in_(fixtures["users"])))
+        await session.commit()
+
+
+async def query_counter() -> Optional[int]:
+    # Число выполненных запросов: pg_stat_statements точнее, pg_stat_database есть всегда
+    async with async_session_maker() as session:
+        try:
+            return (await session.execute(text("SELECT sum(calls)::bigint FROM pg_stat_statements"))).scalar()
+        except Exception:
+            await session.rollback()
+        return (await session.execute(text(
+            "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()"
+        ))).scalar()
+
+
+def server_rss(pids: List[int]) -> Optional[int]:
+    # Суммарный VmRSS процессов сервера в байтах
+    if not pids:
+        return None
+    total = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+    return total
+
+
+def server_cpu(pids: List[int]) -> Optional[float]:
+    # Суммарное процессорное время (utime + stime) процессов сервера в секундах
+    if not pids:
+        return None
+    ticks = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/stat") as stat:
+            # Поля после имени процесса в скобках: utime и stime — 14-е и 15-е поля строки
+            fields = stat.read().rsplit(")", 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+    return ticks / os.sysconf("SC_CLK_TCK")
+
+
+async def run_client(url: str, chat_id: int, token: str, index: int, rate: float, duration: float,
+                     start: asyncio.Event, stop: asyncio.Event, connected: List[int], stats: Stats,
+                     encoding: str = "legacy"):
+    headers = {"Cookie": f"{cookie_transport.cookie_name}={token}"}
+    subprotocol = SUBPROTOCOLS[encoding]
+    async with websockets.connect(f"{url}/ws/chat/{chat_id}", extra_headers=headers, max_size=None,
+                                  subprotocols=[subprotocol] if subprotocol else None) as ws:
+        connected.append(index)
+
+        async def receive():
+            async for raw in ws:
+                received_at = time.time()
+                try:
+                    frame = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+                except ValueError:
+                    continue
+                if "error" in frame:
+                    stats.errors += 1
+                    continue
+                parts = str(frame.get("text", "")).split(":")
+                if len(parts) == 4 and parts[0] == MESSAGE_PREFIX:
+                    stats.delivered += 1
+                    stats.latencies.append(received_at - float(parts[1]))
+
+        receiver = asyncio.create_task(receive())
+        await start.wait()
+        seq = 0
+        if rate > 0:
+            # Случайный сдвиг, чтобы клиенты не отправляли сообщения одновременно
+            await asyncio.sleep((index % 100) / 100 / rate)
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                await ws.send(json.dumps({"text": f"{MESSAGE_PREFIX}:{time.time()}:{index}:{seq}"}))
+                stats.sent += 1
+                seq += 1
+                await asyncio.sleep(1 / rate)
+        await stop.wait()
+        receiver.cancel()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main(args) -> int:
+    fixtures = await create_fixtures(args.clients, args.chats)
+    strategy = get_jwt_strategy()
+    tokens = [await strategy.write_token(User(id=user_id)) for user_id in fixtures["users"]]
+    pids = [int(pid) for pid in args.server_pid.split(",") if pid] if args.server_pid else []
+
+    stats = Stats()
+    start, stop = asyncio.Event(), asyncio.Event()
+    connected: List[int] = []
+    rss_before = server_rss(pids)
+    tasks = []
+    try:
+        for index, token in enumerate(tokens):
+            chat_id = fixtures["chats"][index % args.chats]
+            tasks.append(asyncio.create_task(run_client(
+                args.url, chat_id, token, index, args.rate, args.duration, start, stop, connected, stats,
+                args.encoding
+            )))
+            if args.connect_rate:
+                await asyncio.sleep(1 / args.connect_rate)
+        while len(connected) < len(tokens):
+            failed = [task for task in tasks if task.done() and task.exception()]
+            if failed:
+                raise failed[0].exception()
+            await asyncio.sleep(0.1)
+        rss_connected = server_rss(pids)
+
+        queries_before = await query_counter()
+        cpu_before = server_cpu(pids)
+        started = time.monotonic()
+        start.set()
+        await asyncio.sleep(args.duration + args.drain)
+        elapsed = time.monotonic() - started
+        cpu_after = server_cpu(pids)
+        queries_after = await query_counter()
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        if not args.keep:
+            await drop_fixtures(fixtures)
+        await engine.dispose()
+
+    # Каждое сообщение доставляется всем участникам чата, включая отправителя
+    members_per_chat = args.clients / args.chats
+    expected = stats.sent * members_per_chat
+    report = {
+        "clients": args.clients,
+        "chats": args.chats,
+        "encoding": args.encoding,
+        "sent": stats.sent,
+        "delivered": stats.delivered,
+        "delivery_ratio": stats.delivered / expected if expected else None,
+        "errors": stats.errors,
+        "sent_per_sec": stats.sent / elapsed,
+        "delivered_per_sec": stats.delivered / elapsed,
+        "latency_ms": {
+            "p50": percentile(stats.latencies, 0.50) * 1000,
+            "p90": percentile(stats.latencies, 0.90) * 1000,
+            "p99": percentile(stats.latencies, 0.99) * 1000,
+            "max": max(stats.latencies) * 1000 if stats.latencies else None,
+            "mean": statistics.fmean(stats.latencies) * 1000 if stats.latencies else None,
+        },
+        "db_queries_per_message": (queries_after - queries_before) / stats.sent
+        if stats.sent and queries_before is not None else None,
+        "memory_per_connection_bytes": (rss_connected - rss_before) / args.clients
+        if rss_before is not None else None,
+        "server_cpu_us_per_delivered_message": (cpu_after - cpu_before) * 1e6 / stats.delivered
+        if stats.delivered and cpu_before is not None else None,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failed = False
+    if args.max_p99 is not None and not report["latency_ms"]["p99"] <= args.max_p99:
+        print(f"p99 {report['latency_ms']['p99']:.1f} мс больше порога {args.max_p99} мс")
+        failed = True
+    if args.min_delivery is not None and (report["delivery_ratio"] or 0) < args.min_delivery:
+        print(f"Доставлено {report['delivery_ratio']} сообщений, порог {args.min_delivery}")
+        failed = True
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /ws/chat/{chat_id}")
+    parser.add_argument("--url", default=os.environ.get("LOADTEST_URL", "ws://localhost:8080"))
+    parser.add_argument("--clients", type=int, default=100, help="число вебсокет-клиентов (N)")
+    parser.add_argument("--chats", type=int, default=10, help="число чатов (M), клиенты делятся поровну")
+    parser.add_argument("--rate", type=float, default=1.0, help="сообщений в секунду от каждого клиента")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность отправки (секунды)")
+    parser.add_argument("--drain", type=float, default=2.0, help="ожидание доставки после отправки (секунды)")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="подключений в секунду (0 — сразу все)")
+    parser.add_argument("--server-pid", help="pid процессов сервера через запятую, для замера памяти и CPU")
+    parser.add_argument("--encoding", choices=sorted(SUBPROTOCOLS), default="legacy",
+                        help="протокол клиентов: legacy, json или msgpack")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--max-p99", type=float, help="порог p99 задержки доставки (мс)")
+    parser.add_argument("--min-delivery", type=float, help="минимальная доля доставленных сообщений (0..1)")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданных пользователей и чаты")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
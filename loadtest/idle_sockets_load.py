@@ -0,0 +1,207 @@
+"""
+Нагрузочный тест: простаивающие вебсокеты не должны занимать пул соединений с БД.
+
+Скрипт создаёт временных пользователей и чаты (как loadtest.chat_load) и дважды нагружает
+HTTP-маршрут (--path, по умолчанию /my_chats) --http-clients конкурентными клиентами
+в течение --duration секунд: сначала без вебсокетов, затем после подключения --sockets
+простаивающих вебсокетов (--endpoint: /ws/chat/{chat_id} или мультиплексированный /ws),
+которые ничего не отправляют до конца замера.
+
+В отчёте для обоих замеров: запросов в секунду, ошибок (включая таймауты), перцентили времени
+ответа и число соединений приложения с БД (pg_stat_activity), а также сколько сокетов
+закрылось во время замера. Если обработчик вебсокета держит сессию всё время жизни сокета,
+пул (DB_POOL_SIZE + DB_MAX_OVERFLOW) исчерпывается и HTTP-запросы ждут DB_POOL_TIMEOUT.
+
+Запуск (приложение уже работает с локальными Postgres и Redis, переменные окружения те же):
+
+    python -m loadtest.idle_sockets_load --url http://localhost:8080 --sockets 1000 --duration 20
+
+--max-p99 и --max-errors завершают скрипт с кодом 1, если порог нарушен при открытых сокетах.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import time
+from typing import List, Optional
+
+import httpx
+import websockets
+from sqlalchemy import text
+
+from src.auth.auth_cookie import cookie_transport, get_jwt_strategy
+from src.auth.models import User
+from src.database import async_session_maker, engine
+from loadtest.chat_load import create_fixtures, drop_fixtures, percentile
+
+
+class Stats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+
+
+def raise_open_files_limit(needed: int):
+    # Каждый сокет — дескриптор процесса стенда
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+async def db_connections() -> Optional[int]:
+    # Соединения с базой приложения, кроме соединения самого стенда
+    async with async_session_maker() as session:
+        return (await session.execute(text(
+            "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+        ))).scalar()
+
+
+async def hold_socket(url: str, token: str, opened: List[int], closed: List[int], index: int,
+                      stop: asyncio.Event, timeout: float):
+    headers = {"Cookie": f"{cookie_transport.cookie_name}={token}"}
+    async with websockets.connect(url, extra_headers=headers, max_size=None, open_timeout=timeout) as ws:
+        opened.append(index)
+        waiter = asyncio.create_task(stop.wait())
+        # Сокет простаивает; входящие кадры (события других чатов) не нужны
+        closing = asyncio.create_task(ws.wait_closed())
+        await asyncio.wait({waiter, closing}, return_when=asyncio.FIRST_COMPLETED)
+        if closing.done():
+            closed.append(index)
+        waiter.cancel()
+        closing.cancel()
+
+
+async def run_http_client(client: httpx.AsyncClient, path: str, deadline: float, stats: Stats):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+        except httpx.HTTPError:
+            stats.errors += 1
+            continue
+        stats.latencies.append(time.perf_counter() - started)
+        stats.requests += 1
+        if response.status_code >= 400:
+            stats.errors += 1
+
+
+async def measure_http(token: str, args) -> dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.http_clients, max_keepalive_connections=args.http_clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout,
+                                 cookies={cookie_transport.cookie_name: token}) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        connections = asyncio.create_task(asyncio.sleep(args.duration / 2))
+        runners = asyncio.gather(*[
+            run_http_client(client, args.path, deadline, stats) for _ in range(args.http_clients)
+        ])
+        # Соединения с БД считаются в середине замера, когда пул нагружен
+        await connections
+        in_use = await db_connections()
+        await runners
+        elapsed = time.monotonic() - started
+    return {
+        "requests": stats.requests,
+        "requests_per_sec": stats.requests / elapsed,
+        "errors": stats.errors,
+        "db_connections": in_use,
+        "latency_ms": {
+            "p50": percentile(stats.latencies, 0.50) * 1000,
+            "p90": percentile(stats.latencies, 0.90) * 1000,
+            "p99": percentile(stats.latencies, 0.99) * 1000,
+            "max": max(stats.latencies) * 1000 if stats.latencies else None,
+            "mean": statistics.fmean(stats.latencies) * 1000 if stats.latencies else None,
+        },
+    }
+
+
+async def main(args) -> int:
+    raise_open_files_limit(args.sockets + args.http_clients + 100)
+    fixtures = await create_fixtures(args.sockets, args.chats)
+    strategy = get_jwt_strategy()
+    tokens = [await strategy.write_token(User(id=user_id)) for user_id in fixtures["users"]]
+    ws_url = args.url.replace("http", "ws", 1)
+
+    stop = asyncio.Event()
+    opened: List[int] = []
+    closed: List[int] = []
+    tasks = []
+    try:
+        baseline = await measure_http(tokens[0], args)
+
+        for index, token in enumerate(tokens):
+            path = f"/ws/chat/{fixtures['chats'][index % args.chats]}" if args.endpoint == "chat" else "/ws"
+            tasks.append(asyncio.create_task(
+                hold_socket(ws_url + path, token, opened, closed, index, stop, args.timeout)
+            ))
+            if args.connect_rate:
+                await asyncio.sleep(1 / args.connect_rate)
+        while len(opened) < len(tokens):
+            failed = [task for task in tasks if task.done() and task.exception()]
+            if failed:
+                raise failed[0].exception()
+            await asyncio.sleep(0.1)
+        idle_connections = await db_connections()
+
+        with_sockets = await measure_http(tokens[0], args)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if not args.keep:
+            await drop_fixtures(fixtures)
+        await engine.dispose()
+
+    report = {
+        "sockets": args.sockets,
+        "endpoint": args.endpoint,
+        "path": args.path,
+        "http_clients": args.http_clients,
+        "sockets_closed_during_run": len(closed),
+        "db_connections_with_idle_sockets": idle_connections,
+        "without_sockets": baseline,
+        "with_sockets": with_sockets,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failed = False
+    if args.max_p99 is not None and not with_sockets["latency_ms"]["p99"] <= args.max_p99:
+        print(f"p99 {with_sockets['latency_ms']['p99']:.1f} мс при открытых сокетах больше порога {args.max_p99} мс")
+        failed = True
+    if args.max_errors is not None and with_sockets["errors"] > args.max_errors:
+        print(f"Ошибок HTTP при открытых сокетах {with_sockets['errors']}, порог {args.max_errors}")
+        failed = True
+    if closed:
+        print(f"Во время замера закрылось сокетов: {len(closed)}")
+        failed = True
+    return 1 if failed else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP-маршруты при тысяче простаивающих вебсокетов")
+    parser.add_argument("--url", default=os.environ.get("LOADTEST_URL", "http://localhost:8080"))
+    parser.add_argument("--sockets", type=int, default=1000, help="число простаивающих вебсокетов")
+    parser.add_argument("--chats", type=int, default=100, help="число чатов, сокеты делятся поровну")
+    parser.add_argument("--endpoint", choices=["chat", "ws"], default="chat",
+                        help="chat — /ws/chat/{chat_id}, ws — мультиплексированный /ws")
+    parser.add_argument("--path", default="/my_chats", help="HTTP-маршрут под нагрузкой")
+    parser.add_argument("--http-clients", type=int, default=20, help="конкурентных HTTP-клиентов")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность каждого замера (секунды)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="таймаут HTTP-запроса и рукопожатия (секунды)")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="подключений в секунду (0 — сразу все)")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--max-p99", type=float, help="порог p99 времени ответа при открытых сокетах (мс)")
+    parser.add_argument("--max-errors", type=int, default=0, help="допустимое число ошибок HTTP при открытых сокетах")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданных пользователей и чаты")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
@@ -0,0 +1,162 @@
+"""
+Бенчмарк инбокса /my_chats: число SQL-запросов и время ответа в зависимости от числа чатов.
+
+Для каждого N из --chats скрипт создаёт пользователя с N личными чатами (собеседник с профилем
+user_info, сводка последнего сообщения в chats) и вызывает /my_chats в процессе скрипта
+(httpx + ASGI, авторизация JWT в cookie "Messager", как у клиентов). Запросы считаются
+count_queries() (src/query_debug.py) — те же, что видит QUERY_DEBUG.
+
+В отчёте для каждого N: запросов на первый (холодные кэши пользователя и непрочитанных)
+и на повторные вызовы (чаще всего встречающееся и наибольшее число), перцентили времени ответа.
+Число запросов не должно расти с N; время растёт медленно — сортируются только строки сводки.
+
+Запуск (миграции применены, Postgres и Redis те же, что у приложения):
+
+    python -m loadtest.my_chats_bench --chats 10,100,1000 --repeat 50
+
+--max-queries завершает скрипт с кодом 1, если повторный вызов выполнил больше запросов
+или их число различается для разных N.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import httpx
+from sqlalchemy import delete, insert, text
+
+from src.app import app
+from src.auth.auth_cookie import cookie_transport, get_jwt_strategy
+from src.auth.models import User, UserInfo
+from src.Chat.models import Chat, ChatParticipant
+from src.database import async_session_maker, engine
+from src.query_debug import count_queries
+from loadtest.chat_load import percentile
+
+
+async def create_fixtures(chats: int) -> Dict[str, list]:
+    # Пользователь с chats личными чатами; сообщения не нужны — инбокс читает сводку из chats
+    run_id = uuid.uuid4().hex[:8]
+    now = datetime.utcnow()
+    async with async_session_maker() as session:
+        user_ids = (await session.execute(
+            insert(User).returning(User.id),
+            [
+                {"email": f"inboxbench-{run_id}-{i}@example.com", "username": f"inboxbench_{run_id}_{i}",
+                 "hashed_password": "!", "is_active": True, "is_superuser": False, "is_verified": True}
+                for i in range(chats + 1)
+            ],
+        )).scalars().all()
+        owner, peers = user_ids[0], user_ids[1:]
+        await session.execute(insert(UserInfo), [
+            {"user_id": peer, "first_name": f"Имя{i}", "pic_path": f"static/avatars/{peer}.png"}
+            for i, peer in enumerate(peers)
+        ])
+        chat_ids = (await session.execute(
+            insert(Chat).returning(Chat.id),
+            [
+                {"participants": [owner, peer], "direct_user_low": owner, "direct_user_high": peer,
+                 "message_count": i + 1, "last_message_id": None, "last_message_preview": f"сообщение {i}",
+                 "last_message_at": now - timedelta(minutes=i)}
+                for i, peer in enumerate(peers)
+            ],
+        )).scalars().all()
+        await session.execute(insert(ChatParticipant), [
+            {"chat_id": chat_id, "user_id": user_id}
+            for chat_id, peer in zip(chat_ids, peers) for user_id in (owner, peer)
+        ])
+        await session.commit()
+    # Статистика планировщика для только что вставленных строк, как у давно заполненных таблиц
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text('ANALYZE chats, chat_participants, user_info, "user"'))
+    return {"owner": owner, "users": list(user_ids), "chats": list(chat_ids)}
+
+
+async def drop_fixtures(fixtures: Dict[str, list]):
+    async with async_session_maker() as session:
+        await session.execute(delete(ChatParticipant).where(ChatParticipant.chat_id.in_(fixtures["chats"])))
+        await session.execute(delete(Chat).where(Chat.id.in_(fixtures["chats"])))
+        await session.execute(delete(UserInfo).where(UserInfo.user_id.in_(fixtures["users"])))
+        await session.execute(delete(User).where(User.id.in_(fixtures["users"])))
+        await session.commit()
+
+
+async def measure(fixtures: Dict[str, list], args) -> dict:
+    token = await get_jwt_strategy().write_token(User(id=fixtures["owner"]))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={cookie_transport.cookie_name: token}) as client:
+        queries: List[int] = []
+        latencies: List[float] = []
+        for _ in range(args.repeat + 1):
+            started = time.perf_counter()
+            with count_queries() as log:
+                response = await client.get("/my_chats", params={"limit": args.page_size})
+            latencies.append(time.perf_counter() - started)
+            queries.append(log.count)
+            response.raise_for_status()
+    rows = len(response.json()["chats"])
+    warm = latencies[1:]
+    # Пока воркер не подписан на инвалидации кэша пользователей, пользователь читается из Postgres
+    repeated = queries[1:]
+    return {
+        "chats": len(fixtures["chats"]),
+        "rows": rows,
+        "first_call_queries": queries[0],
+        "queries": statistics.mode(repeated),
+        "max_queries": max(repeated),
+        "first_call_ms": latencies[0] * 1000,
+        "latency_ms": {
+            "p50": percentile(warm, 0.50) * 1000,
+            "p90": percentile(warm, 0.90) * 1000,
+            "p99": percentile(warm, 0.99) * 1000,
+            "mean": statistics.fmean(warm) * 1000 if warm else None,
+        },
+    }
+
+
+async def main(args) -> int:
+    results = []
+    try:
+        for chats in [int(value) for value in args.chats.split(",") if value]:
+            fixtures = await create_fixtures(chats)
+            try:
+                results.append(await measure(fixtures, args))
+            finally:
+                if not args.keep:
+                    await drop_fixtures(fixtures)
+    finally:
+        await engine.dispose()
+
+    report = {"page_size": args.page_size, "repeat": args.repeat, "runs": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.max_queries is not None:
+        counts = {run["queries"] for run in results}
+        if len(counts) > 1 or max(counts) > args.max_queries:
+            print(f"Запросов на вызов {sorted(counts)}, порог {args.max_queries} и одинаковое число для всех N")
+            return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Запросов к БД и время /my_chats для N чатов")
+    parser.add_argument("--chats", default="10,100,1000", help="значения N через запятую")
+    parser.add_argument("--repeat", type=int, default=50, help="повторных вызовов для каждого N")
+    parser.add_argument("--page-size", type=int, default=50, help="limit страницы /my_chats")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--max-queries", type=int, help="порог запросов на повторный вызов")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданных пользователей и чаты")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
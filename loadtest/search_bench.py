@@ -0,0 +1,220 @@
+"""
+Бенчмарк полнотекстового поиска по сообщениям (/search_messages).
+
+Скрипт заполняет messages десятками миллионов сообщений в служебных чатах (INSERT ... SELECT
+generate_series на стороне Postgres, пачками), после чего замеряет search_messages для запросов
+разной избирательности: частое слово, редкое слово, фраза, исключение, поиск в одном чате
+и вторая страница по курсору. Слова выбираются со смещённым распределением, поэтому частота
+токенов различается на порядки, как в живой переписке.
+
+В отчёте: перцентили времени запроса, число результатов и EXPLAIN (ANALYZE, BUFFERS) самого
+медленного запроса для проверки, что используется ix_messages_search_vector.
+
+Запуск (миграции применены, переменные окружения те же, что у приложения):
+
+    python -m loadtest.search_bench --messages 20000000 --chats 200 --repeat 20
+
+--keep оставляет данные, а --reuse <chat_id,...> запускает замеры на уже заполненных чатах.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import delete, insert, text
+
+from src.auth.models import User
+from src.Chat.models import Chat, ChatParticipant, Message
+from src.Chat.partitions import add_months, create_partition_sql, month_start
+from src.Chat.search import build_search_query, search_messages, encode_search_cursor
+from src.database import async_session_maker, engine
+from loadtest.chat_load import percentile
+
+# Словарь "w0".."w<N>": w0 встречается почти в каждом сообщении, последние слова — единицы раз
+WORD_PREFIX = "w"
+
+
+async def create_fixtures(chats: int) -> Dict[str, list]:
+    run_id = uuid.uuid4().hex[:8]
+    async with async_session_maker() as session:
+        user_ids = (await session.execute(
+            insert(User).returning(User.id),
+            [
+                {"email": f"searchbench-{run_id}-{i}@example.com", "username": f"searchbench_{run_id}_{i}",
+                 "hashed_password": "!", "is_active": True, "is_superuser": False, "is_verified": True}
+                for i in range(chats + 1)
+            ],
+        )).scalars().all()
+        chat_ids = (await session.execute(
+            insert(Chat).returning(Chat.id), [{"participants": []} for _ in range(chats)]
+        )).scalars().all()
+        # Первый пользователь ищет и состоит в половине чатов — проверяется и фильтр по участию
+        await session.execute(insert(ChatParticipant), [
+            {"chat_id": chat_id, "user_id": user_ids[i + 1]} for i, chat_id in enumerate(chat_ids)
+        ] + [
+            {"chat_id": chat_id, "user_id": user_ids[0]} for chat_id in chat_ids[::2]
+        ])
+        await session.commit()
+    return {"users": list(user_ids), "chats": list(chat_ids)}
+
+
+async def seed_messages(fixtures: Dict[str, list], messages: int, vocabulary: int, batch: int):
+    chats = fixtures["chats"]
+    senders = fixtures["users"][1:]
+    # Сообщения идут по одному в секунду до текущего момента — нужны секции за весь этот период
+    month = month_start(datetime.utcnow() - timedelta(seconds=messages))
+    async with async_session_maker() as session:
+        while month <= month_start(datetime.utcnow()):
+            await session.execute(text(create_partition_sql(month)))
+            month = add_months(month, 1)
+        await session.commit()
+    started = time.monotonic()
+    for offset in range(0, messages, batch):
+        count = min(batch, messages - offset)
+        async with async_session_maker() as session:
+            # Подзапрос со словами ссылается на g, поэтому выполняется для каждой строки заново
+            await session.execute(text("""
+                INSERT INTO messages (chat_id, sender, text, is_picture, created_at)
+                SELECT CAST(:chats AS integer[])[1 + g % :n_chats],
+                       CAST(:senders AS integer[])[1 + g % :n_chats],
+                       (SELECT string_agg(CAST(:prefix AS text) || floor(power(random(), 3) * :vocabulary)::int, ' ')
+                        FROM generate_series(1, 4 + g % 12)),
+                       false,
+                       timezone('utc', now()) - make_interval(secs => :messages - g)
+                FROM generate_series(:start, :stop) AS g
+            """), {"chats": chats, "senders": senders, "n_chats": len(chats), "prefix": WORD_PREFIX,
+                   "vocabulary": vocabulary, "messages": messages, "start": offset, "stop": offset + count - 1})
+            await session.commit()
+        done = offset + count
+        print(f"{done}/{messages} сообщений, {done / (time.monotonic() - started):.0f} строк/с", flush=True)
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("VACUUM ANALYZE messages"))
+
+
+async def drop_fixtures(fixtures: Dict[str, list]):
+    async with async_session_maker() as session:
+        await session.execute(delete(Message).where(Message.chat_id.in_(fixtures["chats"])))
+        await session.execute(delete(ChatParticipant).where(ChatParticipant.chat_id.in_(fixtures["chats"])))
+        await session.execute(delete(Chat).where(Chat.id.in_(fixtures["chats"])))
+        await session.execute(delete(User).where(User.id.in_(fixtures["users"])))
+        await session.commit()
+
+
+def bench_queries(vocabulary: int) -> Dict[str, str]:
+    word = lambda rank: f"{WORD_PREFIX}{rank}"
+    return {
+        "frequent": word(0),
+        "medium": word(vocabulary // 10),
+        "rare": word(vocabulary - 1),
+        "phrase": f'"{word(1)} {word(2)}"',
+        "exclude": f"{word(vocabulary // 20)} -{word(0)}",
+        "missing": "несуществующееслово",
+    }
+
+
+async def measure(user_id: int, query: str, chat_id, repeat: int, limit: int) -> dict:
+    timings: List[float] = []
+    rows = []
+    for _ in range(repeat):
+        async with async_session_maker() as session:
+            started = time.perf_counter()
+            rows = await search_messages(session, user_id, query, chat_id=chat_id, limit=limit)
+            timings.append(time.perf_counter() - started)
+    # Вторая страница по курсору последнего результата
+    next_page_ms = None
+    if len(rows) == limit:
+        async with async_session_maker() as session:
+            started = time.perf_counter()
+            await search_messages(session, user_id, query, chat_id=chat_id, limit=limit,
+                                  after=(rows[-1].rank, rows[-1].Message.id))
+            next_page_ms = (time.perf_counter() - started) * 1000
+    return {
+        "query": query,
+        "results": len(rows),
+        "next_cursor": encode_search_cursor(rows[-1].rank, rows[-1].Message.id) if len(rows) == limit else None,
+        "latency_ms": {
+            "p50": percentile(timings, 0.50) * 1000,
+            "p90": percentile(timings, 0.90) * 1000,
+            "max": max(timings) * 1000,
+            "mean": statistics.fmean(timings) * 1000,
+        },
+        "next_page_ms": next_page_ms,
+    }
+
+
+async def explain(user_id: int, query: str, limit: int) -> str:
+    # Тот же SQL, что выполняет search_messages, с подставленными параметрами
+    statement = build_search_query(user_id, query, limit=limit)
+    compiled = statement.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+    async with async_session_maker() as session:
+        result = await session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {compiled}"))
+        return "\n".join(row[0] for row in result.all())
+
+
+async def main(args) -> int:
+    if args.reuse:
+        chat_ids = [int(chat_id) for chat_id in args.reuse.split(",") if chat_id]
+        async with async_session_maker() as session:
+            user_id = (await session.execute(text(
+                "SELECT user_id FROM chat_participants WHERE chat_id = :chat_id ORDER BY user_id LIMIT 1"
+            ), {"chat_id": chat_ids[0]})).scalar_one()
+        fixtures = {"users": [user_id], "chats": chat_ids}
+    else:
+        fixtures = await create_fixtures(args.chats)
+    try:
+        if not args.reuse:
+            await seed_messages(fixtures, args.messages, args.vocabulary, args.batch)
+        searcher = fixtures["users"][0]
+        results = {}
+        for name, query in bench_queries(args.vocabulary).items():
+            results[name] = await measure(searcher, query, None, args.repeat, args.limit)
+        results["frequent_in_chat"] = await measure(
+            searcher, bench_queries(args.vocabulary)["frequent"], fixtures["chats"][0], args.repeat, args.limit
+        )
+        slowest = max(results.values(), key=lambda result: result["latency_ms"]["p50"])
+        report = {
+            "messages": args.messages if not args.reuse else None,
+            "chats": len(fixtures["chats"]),
+            "queries": results,
+            "explain": {"query": slowest["query"], "plan": await explain(searcher, slowest["query"], args.limit)},
+        }
+    finally:
+        if not args.keep and not args.reuse:
+            await drop_fixtures(fixtures)
+        else:
+            print(f"Данные оставлены, чаты: {','.join(map(str, fixtures['chats']))}")
+        await engine.dispose()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.max_p50 is not None and slowest["latency_ms"]["p50"] > args.max_p50:
+        print(f"p50 {slowest['latency_ms']['p50']:.1f} мс больше порога {args.max_p50} мс ({slowest['query']})")
+        return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк полнотекстового поиска сообщений")
+    parser.add_argument("--messages", type=int, default=20_000_000, help="число сообщений для заполнения")
+    parser.add_argument("--chats", type=int, default=200, help="число чатов, сообщения делятся поровну")
+    parser.add_argument("--vocabulary", type=int, default=50_000, help="размер словаря")
+    parser.add_argument("--batch", type=int, default=1_000_000, help="строк в одной транзакции заполнения")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    parser.add_argument("--limit", type=int, default=20, help="размер страницы результатов")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--max-p50", type=float, help="порог медианы самого медленного запроса (мс)")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданные данные")
+    parser.add_argument("--reuse", help="id ранее заполненных чатов через запятую (без заполнения)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
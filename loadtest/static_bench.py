@@ -0,0 +1,192 @@
+"""
+Бенчмарк отдачи аватарок: прежний app.mount("/static", StaticFiles(...)) против маршрутов serve_file.
+
+Скрипт кладёт --avatars временных аватарок размером --size в static/avatars, после чего --clients
+конкурентных клиентов-"браузеров" в течение --duration секунд показывают случайные аватарки.
+Браузер хранит ответы с ETag и Cache-Control: пока max-age не истёк, аватарка показывается без запроса,
+после — запрос с If-None-Match (304 без тела). С --no-cache каждый показ — полный запрос,
+это пропускная способность самой отдачи файла.
+
+В отчёте для каждого сервера: показов и запросов в секунду, запросов и байт на показ, доля 304
+и перцентили времени запроса. Показ из кэша клиента мгновенный, поэтому с кэшем главное — запросов
+и байт на показ, а пропускную способность сервера сравнивает запуск с --no-cache.
+
+Запуск (приложение уже работает, прежний вариант отдачи — отдельным процессом из того же каталога):
+
+    uvicorn --factory loadtest.static_bench:legacy_app --port 8081 &
+    python -m loadtest.static_bench --url http://localhost:8080 --legacy-url http://localhost:8081 \\
+        --clients 50 --duration 20
+
+Чтобы аватарки кэшировались клиентом, у приложения должен быть задан STATIC_MAX_AGE.
+--min-speedup завершает скрипт с кодом 1, если показов в секунду у serve_file меньше, чем в N раз больше.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+from loadtest.chat_load import percentile
+
+AVATAR_DIRECTORY = os.path.join("static", "avatars")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def legacy_app() -> FastAPI:
+    # Приложение в прежнем виде: /static обслуживает StaticFiles раньше маршрутов serve_file,
+    # middleware те же, что у приложения
+    from src.app import app
+    app.router.routes.insert(0, Mount("/static", StaticFiles(directory="static"), name="static"))
+    return app
+
+
+class Stats:
+    def __init__(self):
+        self.views = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+
+
+def create_avatars(count: int, size: int) -> List[str]:
+    run_id = uuid.uuid4().hex[:8]
+    paths = []
+    for i in range(count):
+        name = f"staticbench-{run_id}-{i}.png"
+        with open(os.path.join(AVATAR_DIRECTORY, name), "wb") as file:
+            file.write(PNG_SIGNATURE + os.urandom(size - len(PNG_SIGNATURE)))
+        paths.append(f"/static/avatars/{name}")
+    return paths
+
+
+def drop_avatars(paths: List[str]):
+    for path in paths:
+        os.remove(os.path.join(AVATAR_DIRECTORY, os.path.basename(path)))
+
+
+def cache_entry(response: httpx.Response) -> Tuple[Optional[str], float]:
+    # (ETag, до какого момента ответ свежий) — как решает браузер по заголовкам ответа
+    cache_control = response.headers.get("cache-control", "")
+    match = MAX_AGE.search(cache_control)
+    max_age = int(match.group(1)) if match and "no-cache" not in cache_control else 0
+    return response.headers.get("etag"), time.monotonic() + max_age
+
+
+async def run_browser(client: httpx.AsyncClient, avatars: List[str], deadline: float, use_cache: bool,
+                      stats: Stats):
+    cache: Dict[str, Tuple[Optional[str], float]] = {}
+    while time.monotonic() < deadline:
+        path = random.choice(avatars)
+        stats.views += 1
+        etag, fresh_until = cache.get(path, (None, 0.0))
+        if use_cache and time.monotonic() < fresh_until:
+            await asyncio.sleep(0)
+            continue
+        headers = {"if-none-match": etag} if use_cache and etag else {}
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+        except httpx.HTTPError:
+            stats.errors += 1
+            continue
+        stats.latencies.append(time.perf_counter() - started)
+        stats.requests += 1
+        stats.bytes += len(response.content)
+        if response.status_code == 304:
+            stats.not_modified += 1
+            cache[path] = (etag, cache_entry(response)[1])
+        elif response.status_code == 200:
+            cache[path] = cache_entry(response)
+        else:
+            stats.errors += 1
+
+
+async def measure(url: str, avatars: List[str], args) -> dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            run_browser(client, avatars, deadline, not args.no_cache, stats) for _ in range(args.clients)
+        ])
+        elapsed = time.monotonic() - started
+    return {
+        "views": stats.views,
+        "views_per_sec": stats.views / elapsed,
+        "requests_per_sec": stats.requests / elapsed,
+        "requests_per_view": stats.requests / stats.views if stats.views else None,
+        "bytes_per_view": stats.bytes / stats.views if stats.views else None,
+        "not_modified_ratio": stats.not_modified / stats.requests if stats.requests else None,
+        "errors": stats.errors,
+        "request_latency_ms": {
+            "p50": percentile(stats.latencies, 0.50) * 1000,
+            "p90": percentile(stats.latencies, 0.90) * 1000,
+            "p99": percentile(stats.latencies, 0.99) * 1000,
+            "mean": statistics.fmean(stats.latencies) * 1000 if stats.latencies else None,
+        },
+    }
+
+
+async def main(args) -> int:
+    avatars = create_avatars(args.avatars, args.size)
+    results = {}
+    try:
+        for name, url in (("static_files", args.legacy_url), ("serve_file", args.url)):
+            if url:
+                results[name] = await measure(url, avatars, args)
+    finally:
+        if not args.keep:
+            drop_avatars(avatars)
+
+    report = {
+        "clients": args.clients,
+        "avatars": args.avatars,
+        "size": args.size,
+        "client_cache": not args.no_cache,
+        "servers": results,
+    }
+    if len(results) == 2:
+        report["speedup"] = results["serve_file"]["views_per_sec"] / results["static_files"]["views_per_sec"]
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.min_speedup is not None and report.get("speedup", 0) < args.min_speedup:
+        print(f"Ускорение {report.get('speedup')} меньше порога {args.min_speedup}")
+        return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Показов аватарок в секунду: StaticFiles и serve_file")
+    parser.add_argument("--url", default=os.environ.get("LOADTEST_URL", "http://localhost:8080"),
+                        help="приложение с маршрутами serve_file")
+    parser.add_argument("--legacy-url", help="uvicorn --factory loadtest.static_bench:legacy_app (прежняя отдача)")
+    parser.add_argument("--clients", type=int, default=50, help="конкурентных клиентов")
+    parser.add_argument("--avatars", type=int, default=200, help="число разных аватарок")
+    parser.add_argument("--size", type=int, default=30 * 1024, help="размер аватарки (байт)")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность замера каждого сервера (секунды)")
+    parser.add_argument("--no-cache", action="store_true", help="клиенты не кэшируют ответы")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--min-speedup", type=float, help="минимальное ускорение serve_file")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданные аватарки")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
@@ -0,0 +1,208 @@
+"""
+Бенчмарк поиска пользователей (/search_users) на таблице из миллиона пользователей.
+
+Скрипт заполняет "user" --users пользователями (INSERT ... SELECT generate_series на стороне
+Postgres, пачками): username из двух слогов и номера, слоги выбираются со смещённым
+распределением, поэтому подстроки встречаются с частотой от долей процента до десятков процентов.
+Каждый второй пользователь получает user_info с именем и фамилией.
+
+Замеряется /search_users в процессе скрипта (httpx + ASGI): без кэша (ключ кэша удаляется перед
+каждым вызовом) и с кэшем Redis, для частой и редкой подстроки, самой короткой допустимой
+(SEARCH_MIN_LENGTH символов), точного username, поиска по имени (include_names) и второй страницы по курсору.
+
+В отчёте: перцентили времени ответа, число результатов и EXPLAIN (ANALYZE, BUFFERS) самого
+медленного запроса для проверки, что используются индексы *_trgm.
+
+Запуск (миграции применены, переменные окружения те же, что у приложения):
+
+    python -m loadtest.user_search_bench --users 1000000 --repeat 20
+
+--keep оставляет данные, а --reuse <run_id> запускает замеры на уже заполненных пользователях.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import text
+
+from src.app import app
+from src.auth.utils import redis
+from src.database import async_session_maker, engine
+from src.friends.utils import SEARCH_MIN_LENGTH, build_user_search_query, search_cache_key
+from loadtest.chat_load import percentile
+
+# Слоги username; первые встречаются намного чаще последних
+SYLLABLES = ["ka", "ri", "mo", "na", "te", "lu", "si", "vo", "de", "pa", "go", "mi", "ru", "ze", "bo", "ly",
+             "xa", "fe", "ju", "qo", "wy", "ci", "he", "nu", "tra", "kle", "stro", "vin", "dor", "zul"]
+FIRST_NAMES = ["Анна", "Иван", "Мария", "Пётр", "Ольга", "Сергей", "Елена", "Дмитрий", "Наталья", "Алексей"]
+LAST_NAMES = ["Иванов", "Смирнова", "Кузнецов", "Попова", "Соколов", "Лебедева", "Козлов", "Новикова"]
+
+
+def email_pattern(run_id: str) -> str:
+    return f"usersearch-{run_id}-%@example.com"
+
+
+async def seed_users(run_id: str, users: int, batch: int):
+    started = time.monotonic()
+    for offset in range(0, users, batch):
+        count = min(batch, users - offset)
+        async with async_session_maker() as session:
+            await session.execute(text("""
+                INSERT INTO "user" (email, username, hashed_password, is_active, is_superuser, is_verified, reg_at)
+                SELECT 'usersearch-' || :run_id || '-' || g || '@example.com',
+                       (CAST(:syllables AS text[]))[1 + floor(power(random(), 3) * CAST(:n_syllables AS integer))::int]
+                           || (CAST(:syllables AS text[]))[1 + floor(random() * CAST(:n_syllables AS integer))::int] || g,
+                       '!', true, false, true, timezone('utc', now())
+                FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS g
+            """), {"run_id": run_id, "syllables": SYLLABLES, "n_syllables": len(SYLLABLES),
+                   "start": offset, "stop": offset + count - 1})
+            await session.commit()
+        done = offset + count
+        print(f"{done}/{users} пользователей, {done / (time.monotonic() - started):.0f} строк/с", flush=True)
+    async with async_session_maker() as session:
+        await session.execute(text("""
+            INSERT INTO user_info (user_id, first_name, last_name)
+            SELECT id,
+                   (CAST(:first_names AS text[]))[1 + id % :n_first],
+                   (CAST(:last_names AS text[]))[1 + (id / :n_first) % :n_last]
+            FROM "user"
+            WHERE email LIKE :pattern AND id % 2 = 0
+        """), {"first_names": FIRST_NAMES, "last_names": LAST_NAMES, "n_first": len(FIRST_NAMES),
+               "n_last": len(LAST_NAMES), "pattern": email_pattern(run_id)})
+        await session.commit()
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text('VACUUM ANALYZE "user", user_info'))
+
+
+async def drop_users(run_id: str):
+    async with async_session_maker() as session:
+        await session.execute(text("""
+            DELETE FROM user_info WHERE user_id IN (SELECT id FROM "user" WHERE email LIKE :pattern)
+        """), {"pattern": email_pattern(run_id)})
+        await session.execute(text('DELETE FROM "user" WHERE email LIKE :pattern'),
+                              {"pattern": email_pattern(run_id)})
+        await session.commit()
+
+
+async def sample_username(run_id: str) -> str:
+    async with async_session_maker() as session:
+        # Точный username одного из созданных пользователей
+        return (await session.execute(text(
+            'SELECT username FROM "user" WHERE email LIKE :pattern LIMIT 1'
+        ), {"pattern": email_pattern(run_id)})).scalar_one()
+
+
+def bench_queries(exact: str) -> Dict[str, dict]:
+    return {
+        "frequent": {"username": SYLLABLES[0] + SYLLABLES[1]},
+        "rare": {"username": SYLLABLES[-1] + SYLLABLES[-2]},
+        "short": {"username": (SYLLABLES[0] + SYLLABLES[1])[:SEARCH_MIN_LENGTH]},
+        "exact": {"username": exact},
+        "names": {"username": LAST_NAMES[0], "include_names": True},
+        "missing": {"username": "несуществующий"},
+    }
+
+
+async def measure(client: httpx.AsyncClient, params: dict, repeat: int, limit: int) -> dict:
+    params = {**params, "limit": limit}
+    key = search_cache_key(params["username"], params.get("include_names", False), limit, None)
+    cold: List[float] = []
+    cached: List[float] = []
+    response = None
+    for _ in range(repeat):
+        await redis.delete(key)
+        started = time.perf_counter()
+        response = await client.get("/search_users", params=params)
+        cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        await client.get("/search_users", params=params)
+        cached.append(time.perf_counter() - started)
+    results = response.json() if response.status_code == 200 else []
+    next_cursor: Optional[str] = response.headers.get("x-next-cursor")
+    # Вторая страница по курсору последнего результата, без кэша
+    next_page_ms = None
+    if next_cursor:
+        await redis.delete(search_cache_key(params["username"], params.get("include_names", False), limit,
+                                            next_cursor))
+        started = time.perf_counter()
+        await client.get("/search_users", params={**params, "cursor": next_cursor})
+        next_page_ms = (time.perf_counter() - started) * 1000
+    return {
+        "params": params,
+        "results": len(results),
+        "latency_ms": {
+            "p50": percentile(cold, 0.50) * 1000,
+            "p90": percentile(cold, 0.90) * 1000,
+            "max": max(cold) * 1000,
+            "mean": statistics.fmean(cold) * 1000,
+        },
+        "cached_p50_ms": percentile(cached, 0.50) * 1000,
+        "next_page_ms": next_page_ms,
+    }
+
+
+async def explain(params: dict, limit: int) -> str:
+    # Тот же SQL, что выполняет /search_users, с подставленными параметрами
+    statement = build_user_search_query(params["username"], params.get("include_names", False), limit)
+    compiled = statement.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+    async with async_session_maker() as session:
+        result = await session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {compiled}"))
+        return "\n".join(row[0] for row in result.all())
+
+
+async def main(args) -> int:
+    run_id = args.reuse or uuid.uuid4().hex[:8]
+    try:
+        if not args.reuse:
+            await seed_users(run_id, args.users, args.batch)
+        queries = bench_queries(await sample_username(run_id))
+        results = {}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for name, params in queries.items():
+                results[name] = await measure(client, params, args.repeat, args.limit)
+        slowest = max(results.values(), key=lambda result: result["latency_ms"]["p50"])
+        report = {
+            "users": args.users if not args.reuse else None,
+            "run_id": run_id,
+            "queries": results,
+            "explain": {"params": slowest["params"], "plan": await explain(slowest["params"], args.limit)},
+        }
+    finally:
+        if not args.keep and not args.reuse:
+            await drop_users(run_id)
+        else:
+            print(f"Данные оставлены, --reuse {run_id}")
+        await engine.dispose()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.max_p50 is not None and slowest["latency_ms"]["p50"] > args.max_p50:
+        print(f"p50 {slowest['latency_ms']['p50']:.1f} мс больше порога {args.max_p50} мс ({slowest['params']})")
+        return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска пользователей /search_users")
+    parser.add_argument("--users", type=int, default=1_000_000, help="число пользователей для заполнения")
+    parser.add_argument("--batch", type=int, default=200_000, help="строк в одной транзакции заполнения")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого запроса")
+    parser.add_argument("--limit", type=int, default=20, help="размер страницы результатов")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--max-p50", type=float, help="порог медианы самого медленного запроса без кэша (мс)")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданных пользователей")
+    parser.add_argument("--reuse", help="run_id ранее заполненных пользователей (без заполнения)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
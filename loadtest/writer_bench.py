@@ -0,0 +1,133 @@
+"""
+Бенчмарк записи сообщений чата в одном воркере: обычный режим против отложенной записи (write-behind).
+
+Скрипт создаёт временных пользователей и чаты, после чего --senders конкурентных отправителей
+(как сокеты одного воркера) пишут сообщения в течение --duration секунд. Сообщение считается
+записанным, когда отправитель получил бы подтверждение:
+    direct       — save_message в своей транзакции, как при MESSAGE_WRITE_BEHIND=false;
+    write-behind — MessageWriter.submit и ожидание PendingMessage.durable (COMMIT пачки).
+
+В отчёте для каждого режима: записанных сообщений в секунду, перцентили времени до подтверждения
+и число COMMIT на сообщение (pg_stat_database).
+
+Запуск (миграции применены, Postgres и Redis те же, что у приложения):
+
+    python -m loadtest.writer_bench --senders 50 --chats 10 --duration 20
+
+--min-speedup завершает скрипт с кодом 1, если write-behind быстрее обычного режима меньше, чем в N раз.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from src.Chat.chat_routers import save_message
+from src.Chat.writer import MessageWriter
+from src.database import async_session_maker, engine
+from loadtest.chat_load import create_fixtures, drop_fixtures, percentile
+
+MODES = ("direct", "write-behind")
+
+
+async def commit_counter() -> int:
+    async with async_session_maker() as session:
+        return (await session.execute(text(
+            "SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()"
+        ))).scalar()
+
+
+async def run_sender(mode: str, writer: MessageWriter, chat_id: int, user_id: int, deadline: float,
+                     latencies: List[float]):
+    seq = 0
+    while time.monotonic() < deadline:
+        body = f"bench:{user_id}:{seq}"
+        started = time.perf_counter()
+        if mode == "direct":
+            async with async_session_maker() as db:
+                await save_message(db, chat_id, user_id, body)
+        else:
+            pending = await writer.submit(chat_id, user_id, body)
+            await pending.durable
+        latencies.append(time.perf_counter() - started)
+        seq += 1
+
+
+async def measure(mode: str, fixtures: Dict[str, list], duration: float, args) -> dict:
+    writer = MessageWriter(batch_size=args.batch_size, flush_interval=args.flush_interval,
+                           use_journal=not args.no_journal)
+    latencies: List[float] = []
+    commits_before = await commit_counter()
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*[
+        run_sender(mode, writer, fixtures["chats"][i % len(fixtures["chats"])], user_id, deadline, latencies)
+        for i, user_id in enumerate(fixtures["users"])
+    ])
+    elapsed = time.monotonic() - started
+    await writer.close()
+    commits = await commit_counter() - commits_before
+    return {
+        "messages": len(latencies),
+        "messages_per_sec": len(latencies) / elapsed,
+        "commits_per_message": commits / len(latencies) if latencies else None,
+        "ack_latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p90": percentile(latencies, 0.90) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "mean": statistics.fmean(latencies) * 1000 if latencies else None,
+        },
+    }
+
+
+async def main(args) -> int:
+    fixtures = await create_fixtures(args.senders, args.chats)
+    results = {}
+    try:
+        for mode in MODES if args.mode == "both" else (args.mode,):
+            results[mode] = await measure(mode, fixtures, args.duration, args)
+    finally:
+        if not args.keep:
+            await drop_fixtures(fixtures)
+        await engine.dispose()
+
+    report = {
+        "senders": args.senders,
+        "chats": args.chats,
+        "batch_size": args.batch_size,
+        "flush_interval": args.flush_interval,
+        "modes": results,
+    }
+    if len(results) == len(MODES):
+        report["speedup"] = results["write-behind"]["messages_per_sec"] / results["direct"]["messages_per_sec"]
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.min_speedup is not None and report.get("speedup", 0) < args.min_speedup:
+        print(f"Ускорение {report.get('speedup')} меньше порога {args.min_speedup}")
+        return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сообщений в секунду на воркер: обычная и отложенная запись")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--senders", type=int, default=50, help="конкурентных отправителей")
+    parser.add_argument("--chats", type=int, default=10, help="число чатов, отправители делятся поровну")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность каждого режима (секунды)")
+    parser.add_argument("--batch-size", type=int, default=100, help="MESSAGE_BATCH_SIZE для write-behind")
+    parser.add_argument("--flush-interval", type=float, default=0.005, help="MESSAGE_FLUSH_INTERVAL (секунды)")
+    parser.add_argument("--no-journal", action="store_true", help="без журнала в Redis (MESSAGE_JOURNAL=false)")
+    parser.add_argument("--output", help="файл для отчёта в JSON")
+    parser.add_argument("--min-speedup", type=float, help="минимальное ускорение write-behind")
+    parser.add_argument("--keep", action="store_true", help="не удалять созданных пользователей и чаты")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main(parse_args())))
@@ -8,8 +8,9 @@ from alembic import context
 from src.DB_config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS
 from src.database import Base
 from src.auth.models import User, UserInfo
-from src.friends.models import Friends, FriendRequest
-from src.Chat.models import Chat, Message
+from src.friends.models import Friends, FriendRequest, Friendship
+from src.Chat.models import Chat, ChatParticipant, Message
+from src.storage.models import Blob
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,32 @@
+"""Read cursor created_at
+
+Revision ID: 3e6b9c1f7d24
+Revises: a8d3f6b0c512
+Create Date: 2026-10-18 21:05:12.448163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e6b9c1f7d24'
+down_revision: Union[str, None] = 'a8d3f6b0c512'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_participants', sa.Column('last_read_at', sa.DateTime(), nullable=True))
+    op.execute("""
+        UPDATE chat_participants AS cp
+        SET last_read_at = m.created_at
+        FROM messages AS m
+        WHERE m.id = cp.last_read_message_id AND m.chat_id = cp.chat_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('chat_participants', 'last_read_at')
@@ -0,0 +1,37 @@
+"""Content-addressed blob store
+
+Revision ID: 4f1c2b9d7a63
+Revises: 833aa5cc259c
+Create Date: 2026-10-18 13:05:41.402317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1c2b9d7a63'
+down_revision: Union[str, None] = '833aa5cc259c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_index('ix_blobs_orphans', 'blobs', ['last_used_at'], unique=False,
+                    postgresql_where=sa.text('ref_count = 0'))
+    # Старые вложения (static/chat_pic, static/avatars) остаются на месте и отдаются через /static
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blobs_orphans', table_name='blobs', postgresql_where=sa.text('ref_count = 0'))
+    op.drop_table('blobs')
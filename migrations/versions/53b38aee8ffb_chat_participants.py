@@ -0,0 +1,71 @@
+"""Chat participants
+
+Revision ID: 53b38aee8ffb
+Revises: 83799b6d5e91
+Create Date: 2026-10-18 11:04:17.226391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '53b38aee8ffb'
+down_revision: Union[str, None] = '83799b6d5e91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('chat_participants',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('chat_id', 'user_id')
+    )
+    op.create_index('ix_chat_participants_user_id_chat_id', 'chat_participants', ['user_id', 'chat_id'], unique=False)
+
+    # Перенос участников из JSONB-массива chats.participants
+    op.execute("""
+        INSERT INTO chat_participants (chat_id, user_id)
+        SELECT chats.id, participant.value::int
+        FROM chats, jsonb_array_elements_text(chats.participants) AS participant
+        WHERE jsonb_typeof(chats.participants) = 'array'
+        ON CONFLICT DO NOTHING
+    """)
+
+    op.add_column('chats', sa.Column('direct_user_low', sa.Integer(), nullable=True))
+    op.add_column('chats', sa.Column('direct_user_high', sa.Integer(), nullable=True))
+    op.create_foreign_key('chats_direct_user_low_fkey', 'chats', 'user', ['direct_user_low'], ['id'])
+    op.create_foreign_key('chats_direct_user_high_fkey', 'chats', 'user', ['direct_user_high'], ['id'])
+
+    # Пара собеседников для личных чатов; если дубликаты уже были созданы, ключ получает самый ранний чат
+    op.execute("""
+        UPDATE chats
+        SET direct_user_low = pair.low, direct_user_high = pair.high
+        FROM (
+            SELECT DISTINCT ON (low, high) id, low, high
+            FROM (
+                SELECT chat_id AS id, MIN(user_id) AS low, MAX(user_id) AS high
+                FROM chat_participants
+                GROUP BY chat_id
+                HAVING COUNT(*) = 2
+            ) AS pairs
+            ORDER BY low, high, id
+        ) AS pair
+        WHERE chats.id = pair.id
+    """)
+    op.create_unique_constraint('uq_chats_direct_pair', 'chats', ['direct_user_low', 'direct_user_high'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_chats_direct_pair', 'chats', type_='unique')
+    op.drop_constraint('chats_direct_user_high_fkey', 'chats', type_='foreignkey')
+    op.drop_constraint('chats_direct_user_low_fkey', 'chats', type_='foreignkey')
+    op.drop_column('chats', 'direct_user_high')
+    op.drop_column('chats', 'direct_user_low')
+    op.drop_index('ix_chat_participants_user_id_chat_id', table_name='chat_participants')
+    op.drop_table('chat_participants')
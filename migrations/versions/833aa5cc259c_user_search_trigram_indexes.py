@@ -0,0 +1,50 @@
+"""User search trigram indexes
+
+Revision ID: 833aa5cc259c
+Revises: e7092ba45471
+Create Date: 2026-10-18 12:26:09.114752
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '833aa5cc259c'
+down_revision: Union[str, None] = 'e7092ba45471'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонка) для поиска по подстроке через ILIKE и similarity()
+TRGM_INDEXES = [
+    ('ix_user_username_trgm', 'user', 'username'),
+    ('ix_user_info_first_name_trgm', 'user_info', 'first_name'),
+    ('ix_user_info_last_name_trgm', 'user_info', 'last_name'),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY не блокирует регистрацию и обновление профилей во время построения индексов
+    with op.get_context().autocommit_block():
+        for name, table, column in TRGM_INDEXES:
+            op.create_index(
+                name,
+                table,
+                [column],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'},
+                postgresql_concurrently=True,
+            )
+    # Индекс для соединения user_info с user при выдаче результатов поиска
+    op.create_index('ix_user_info_user_id', 'user_info', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_info_user_id', table_name='user_info')
+    with op.get_context().autocommit_block():
+        for name, table, column in reversed(TRGM_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
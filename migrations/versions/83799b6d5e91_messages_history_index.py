@@ -0,0 +1,40 @@
+"""Messages history index
+
+Revision ID: 83799b6d5e91
+Revises: ed343b3e9974
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '83799b6d5e91'
+down_revision: Union[str, None] = 'ed343b3e9974'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс для постраничной загрузки истории по курсору (created_at, id).
+    # CONCURRENTLY не блокирует запись в messages, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_chat_id_created_at_id',
+            'messages',
+            ['chat_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_messages_chat_id_created_at_id',
+            table_name='messages',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,27 @@
+"""Blob content type
+
+Revision ID: a8d3f6b0c512
+Revises: f5c2e8a9d310
+Create Date: 2026-10-18 18:12:40.517203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d3f6b0c512'
+down_revision: Union[str, None] = 'f5c2e8a9d310'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # У существующих блобов тип остаётся NULL и определяется по содержимому при первой отдаче
+    op.add_column('blobs', sa.Column('content_type', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('blobs', 'content_type')
@@ -0,0 +1,29 @@
+"""Image variants for avatars and chat pictures
+
+Revision ID: b6e0d3f85c21
+Revises: 4f1c2b9d7a63
+Create Date: 2026-10-18 13:41:12.580164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e0d3f85c21'
+down_revision: Union[str, None] = '4f1c2b9d7a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_info', sa.Column('pic_variants', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('messages', sa.Column('variants', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'variants')
+    op.drop_column('user_info', 'pic_variants')
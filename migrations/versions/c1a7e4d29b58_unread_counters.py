@@ -0,0 +1,35 @@
+"""Read cursors and unread counters
+
+Revision ID: c1a7e4d29b58
+Revises: b6e0d3f85c21
+Create Date: 2026-10-18 14:22:37.915042
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1a7e4d29b58'
+down_revision: Union[str, None] = 'b6e0d3f85c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_participants', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+    op.add_column('chat_participants', sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False))
+    # Существующая история считается прочитанной
+    op.execute("""
+        UPDATE chat_participants AS cp
+        SET last_read_message_id = last.id
+        FROM (SELECT chat_id, max(id) AS id FROM messages GROUP BY chat_id) AS last
+        WHERE last.chat_id = cp.chat_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('chat_participants', 'unread_count')
+    op.drop_column('chat_participants', 'last_read_message_id')
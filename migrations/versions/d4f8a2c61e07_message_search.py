@@ -0,0 +1,48 @@
+"""Message full-text search
+
+Revision ID: d4f8a2c61e07
+Revises: c1a7e4d29b58
+Create Date: 2026-10-18 15:03:12.640218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f8a2c61e07'
+down_revision: Union[str, None] = 'c1a7e4d29b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Генерируемый столбец: добавление переписывает таблицу messages под эксклюзивной блокировкой
+    op.add_column('messages', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("CASE WHEN is_picture THEN NULL ELSE to_tsvector('russian', text) END", persisted=True),
+        nullable=True,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_search_vector',
+            'messages',
+            ['search_vector'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_messages_search_vector',
+            table_name='messages',
+            postgresql_concurrently=True,
+        )
+    op.drop_column('messages', 'search_vector')
@@ -0,0 +1,62 @@
+"""Friendships
+
+Revision ID: e7092ba45471
+Revises: 53b38aee8ffb
+Create Date: 2026-10-18 11:48:52.680143
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7092ba45471'
+down_revision: Union[str, None] = '53b38aee8ffb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Первичный ключ (user_id, friend_id) обслуживает проверку дружбы и постраничный список друзей
+    op.create_table('friendships',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('friend_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['friend_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'friend_id')
+    )
+
+    # Перенос из friends.friend_with; рёбра добавляются в обе стороны
+    op.execute("""
+        INSERT INTO friendships (user_id, friend_id, created_at)
+        SELECT friends.owner_id, friend."id", now()
+        FROM friends
+        CROSS JOIN LATERAL jsonb_array_elements_text(friends.friend_with) AS friend_ids(value)
+        JOIN "user" AS friend ON friend."id" = friend_ids.value::int
+        WHERE jsonb_typeof(friends.friend_with) = 'array'
+          AND friend."id" <> friends.owner_id
+        ON CONFLICT DO NOTHING
+    """)
+    op.execute("""
+        INSERT INTO friendships (user_id, friend_id, created_at)
+        SELECT friend_id, user_id, created_at
+        FROM friendships
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    # Возвращаем списки друзей в JSONB, чтобы откат не терял данные
+    op.execute("""
+        UPDATE friends
+        SET friend_with = COALESCE(
+            (SELECT jsonb_agg(friendships.friend_id ORDER BY friendships.friend_id)
+             FROM friendships
+             WHERE friendships.user_id = friends.owner_id),
+            '[]'::jsonb
+        )
+    """)
+    op.drop_table('friendships')
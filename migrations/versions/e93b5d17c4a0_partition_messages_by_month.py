@@ -0,0 +1,113 @@
+"""Partition messages by month
+
+Revision ID: e93b5d17c4a0
+Revises: d4f8a2c61e07
+Create Date: 2026-10-18 15:48:05.271396
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e93b5d17c4a0'
+down_revision: Union[str, None] = 'd4f8a2c61e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Секции создаются и на несколько месяцев вперёд; дальше их создаёт задача create_message_partitions
+PARTITIONS_AHEAD = 3
+COLUMNS = 'id, chat_id, text, is_picture, variants, created_at, sender'
+INDEXES = ['ix_messages_id', 'ix_messages_chat_id_created_at_id', 'ix_messages_search_vector']
+
+
+def add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def message_columns() -> list:
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('messages_id_seq'::regclass)"), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('text', sa.String(), nullable=False),
+        sa.Column('is_picture', sa.Boolean(), nullable=True),
+        sa.Column('variants', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sender', sa.Integer(), nullable=False),
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("CASE WHEN is_picture THEN NULL ELSE to_tsvector('russian', text) END", persisted=True),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ),
+        sa.ForeignKeyConstraint(['sender'], ['user.id'], ),
+    ]
+
+
+def rename_old_table(new_name: str):
+    # Имена индексов уникальны в схеме — освобождаем их для новой таблицы
+    op.rename_table('messages', new_name)
+    op.execute(f'ALTER INDEX messages_pkey RENAME TO {new_name}_pkey')
+    for index in INDEXES:
+        op.execute(f'ALTER INDEX {index} RENAME TO {index.replace("messages", new_name, 1)}')
+
+
+def create_indexes():
+    # Индексы на секционированной таблице создаются во всех секциях, включая будущие
+    op.create_index('ix_messages_id', 'messages', ['id'], unique=False)
+    op.create_index('ix_messages_chat_id_created_at_id', 'messages', ['chat_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+
+
+def upgrade() -> None:
+    # Ключ секционирования не может быть NULL
+    op.execute("UPDATE messages SET created_at = timezone('utc', now()) WHERE created_at IS NULL")
+    rename_old_table('messages_legacy')
+
+    # Первичный ключ секционированной таблицы обязан включать created_at;
+    # уникальность id по-прежнему обеспечивает последовательность messages_id_seq
+    op.create_table(
+        'messages',
+        *message_columns(),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+
+    first = op.get_bind().execute(sa.text('SELECT min(created_at) FROM messages_legacy')).scalar()
+    now = datetime.utcnow()
+    month = date((first or now).year, (first or now).month, 1)
+    last = add_months(date(now.year, now.month, 1), PARTITIONS_AHEAD)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE messages_y{month.year}m{month.month:02d} PARTITION OF messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+        month = add_months(month, 1)
+
+    # Таблица переписывается целиком: миграция выполняется в окно обслуживания
+    op.execute(f'INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_legacy')
+    op.drop_table('messages_legacy')
+    create_indexes()
+
+
+def downgrade() -> None:
+    # Отсоединённые (архивированные) секции в обычную таблицу не возвращаются
+    rename_old_table('messages_partitioned')
+    op.create_table(
+        'messages',
+        *message_columns(),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+    op.execute(f'INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_partitioned')
+    op.execute('DROP TABLE messages_partitioned CASCADE')
+    create_indexes()
+    op.alter_column('messages', 'created_at', existing_type=sa.DateTime(), nullable=True)
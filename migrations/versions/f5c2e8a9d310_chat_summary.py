@@ -0,0 +1,48 @@
+"""Chat summary columns
+
+Revision ID: f5c2e8a9d310
+Revises: e93b5d17c4a0
+Create Date: 2026-10-18 16:31:54.108627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c2e8a9d310'
+down_revision: Union[str, None] = 'e93b5d17c4a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chats', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('chats', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+    op.add_column('chats', sa.Column('last_message_preview', sa.String(), nullable=True))
+    op.add_column('chats', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    # Однократное заполнение по существующей истории; превью как в src/Chat/summary.py
+    op.execute("""
+        UPDATE chats AS c
+        SET last_message_id = last.id,
+            last_message_at = last.created_at,
+            last_message_preview = CASE WHEN last.is_picture THEN last.text ELSE left(last.text, 200) END,
+            message_count = counts.total
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, created_at, text, is_picture
+            FROM messages
+            ORDER BY chat_id, created_at DESC, id DESC
+        ) AS last
+        JOIN (SELECT chat_id, count(*) AS total FROM messages GROUP BY chat_id) AS counts
+            ON counts.chat_id = last.chat_id
+        WHERE last.chat_id = c.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('chats', 'message_count')
+    op.drop_column('chats', 'last_message_preview')
+    op.drop_column('chats', 'last_message_at')
+    op.drop_column('chats', 'last_message_id')
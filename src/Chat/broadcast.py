@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import aioredis
+
+from src.DB_config import REDIS_HOST, REDIS_PORT, BROADCAST_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Колбэк локальной доставки: (chat_id или user_id, сериализованное сообщение)
+DeliverCallback = Callable[[int, str], Awaitable[None]]
+
+
+class BroadcastBackend:
+    """
+    Интерфейс рассылки сообщений чата между процессами приложения.
+
+    Кроме каналов чатов есть каналы пользователей — для событий, которые касаются
+    всех сокетов /ws пользователя в любом процессе (например, новый чат).
+    """
+
+    def __init__(self):
+        self._deliver: Optional[DeliverCallback] = None
+        self._deliver_user: Optional[DeliverCallback] = None
+
+    def bind(self, deliver: DeliverCallback, deliver_user: Optional[DeliverCallback] = None):
+        # Менеджер соединений регистрирует функции доставки в локальные сокеты
+        self._deliver = deliver
+        self._deliver_user = deliver_user
+
+    async def subscribe(self, chat_id: int):
+        pass
+
+    async def unsubscribe(self, chat_id: int):
+        pass
+
+    async def subscribe_user(self, user_id: int):
+        pass
+
+    async def unsubscribe_user(self, user_id: int):
+        pass
+
+    async def publish(self, chat_id: int, message: str):
+        raise NotImplementedError
+
+    async def publish_user(self, user_id: int, message: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryBroadcastBackend(BroadcastBackend):
+    """Рассылка внутри одного процесса (режим по умолчанию)."""
+
+    async def publish(self, chat_id: int, message: str):
+        await self._deliver(chat_id, message)
+
+    async def publish_user(self, user_id: int, message: str):
+        if self._deliver_user is not None:
+            await self._deliver_user(user_id, message)
+
+
+class RedisBroadcastBackend(BroadcastBackend):
+    """
+    Рассылка через Redis pub/sub.
+
+    Процесс подписывается на канал чата один раз, когда в нём появляется первый
+    локальный сокет, и отписывается, когда последний сокет отключается.
+    Собственные публикации процесс тоже получает через Redis, поэтому
+    локальная доставка выполняется только из слушателя канала.
+    """
+
+    CHANNEL_PREFIX = "chat:"
+    USER_CHANNEL_PREFIX = "user_events:"
+
+    def __init__(self, url: str):
+        super().__init__()
+        self._redis = aioredis.from_url(url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._listener: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Создаём лениво, чтобы блокировка принадлежала циклу событий воркера
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _channel(self, chat_id: int) -> str:
+        return f"{self.CHANNEL_PREFIX}{chat_id}"
+
+    def _user_channel(self, user_id: int) -> str:
+        return f"{self.USER_CHANNEL_PREFIX}{user_id}"
+
+    async def _subscribe(self, channel: str):
+        async with self.lock:
+            await self._pubsub.subscribe(channel)
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.create_task(self._listen())
+
+    async def _unsubscribe(self, channel: str):
+        async with self.lock:
+            await self._pubsub.unsubscribe(channel)
+
+    async def subscribe(self, chat_id: int):
+        await self._subscribe(self._channel(chat_id))
+
+    async def unsubscribe(self, chat_id: int):
+        await self._unsubscribe(self._channel(chat_id))
+
+    async def subscribe_user(self, user_id: int):
+        await self._subscribe(self._user_channel(user_id))
+
+    async def unsubscribe_user(self, user_id: int):
+        await self._unsubscribe(self._user_channel(user_id))
+
+    async def publish(self, chat_id: int, message: str):
+        await self._redis.publish(self._channel(chat_id), message)
+
+    async def publish_user(self, user_id: int, message: str):
+        await self._redis.publish(self._user_channel(user_id), message)
+
+    async def _listen(self):
+        # listen() завершается сам, когда не остаётся ни одной подписки
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item["type"] != "message":
+                        continue
+                    channel = item["channel"].decode("utf-8")
+                    if channel.startswith(self.USER_CHANNEL_PREFIX):
+                        user_id = int(channel[len(self.USER_CHANNEL_PREFIX):])
+                        if self._deliver_user is not None:
+                            await self._deliver_user(user_id, item["data"].decode("utf-8"))
+                        continue
+                    chat_id = int(channel[len(self.CHANNEL_PREFIX):])
+                    await self._deliver(chat_id, item["data"].decode("utf-8"))
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка чтения Redis pub/sub, повторное подключение")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        await self._pubsub.close()
+        await self._redis.close()
+
+
+def create_broadcast_backend(name: str = BROADCAST_BACKEND) -> BroadcastBackend:
+    if name == "memory":
+        return MemoryBroadcastBackend()
+    if name == "redis":
+        return RedisBroadcastBackend(f"redis://{REDIS_HOST}:{REDIS_PORT}")
+    raise ValueError(f"Неизвестный бэкенд рассылки: {name}")
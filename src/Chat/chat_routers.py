@@ -1,27 +1,45 @@
-import base64
+import asyncio
 import json
-import os
-import uuid
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, and_, desc
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, true
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.auth.models import User
-from src.database import get_async_session
-from src.Chat.models import Chat, Message
-from src.auth.auth_cookie import fastapi_users
+from src.auth.models import User, UserInfo
+from src.database import get_async_session, async_session_maker
+from src.Chat.models import Chat, ChatParticipant, Message
+from src.Chat.utils import is_chat_participant, get_or_create_direct_chat, get_user_chat_ids
+from src.Chat.manager import manager
+from src.Chat.writer import PendingMessage, message_writer
+from src.Chat.unread import mark_unread, mark_read, get_unread_counts
+from src.Chat.summary import record_messages
+from src.Chat.recent import fetch_recent_history, push_recent
+from src.Chat.codec import EncodedMessage, Frame, history_frame, negotiate_encoding
+from src.DB_config import MESSAGE_WRITE_BEHIND
+from src.metrics import WS_OPEN_SOCKETS, WS_MESSAGES_IN
+from src.query_debug import query_budget
+from src.Chat.uploads import ChunkedUpload, UploadError, save_base64_upload
+from src.storage.store import blob_store, detect_content_type, make_blob_ref, small_variant
+from src.tasks import enqueue_image_variants
+from src.Chat.history import Cursor, clamp_page_size, fetch_history, message_to_dict, encode_cursor, decode_cursor
+from src.Chat.search import SEARCH_MAX_PAGE_SIZE, search_messages, encode_search_cursor, decode_search_cursor, \
+    highlight_html
+from src.auth.auth_cookie import fastapi_users, get_websocket_user
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from typing import Dict, List, Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIRECTORY = "static/chat_pic"
-os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
-
 chat_router = APIRouter()
+
+# Метка endpoint для метрик вебсокетов
+CHAT_WS_ENDPOINT = "/ws/chat/{chat_id}"
+MULTIPLEXED_WS_ENDPOINT = "/ws"
 current_user = fastapi_users.current_user()
 
 # Роут для создания нового чата
@@ -31,211 +49,453 @@ async def create_chat(
     session: AsyncSession = Depends(get_async_session),
     user: User = Depends(current_user)
 ):
-    # Проверяем, не создали ли уже чат с этим пользователем
-    query = select(Chat).where(
-        and_(
-            Chat.participants.contains([user.id]),
-            Chat.participants.contains([second_user_id])
-        )
-    )
-    result = await session.execute(query)
-    existing_chat = result.scalars().first()
-
     if second_user_id == user.id:
         raise HTTPException(status_code=400, detail="Нельзя создать чат с самим собой")
 
-    if existing_chat:
-        return {"chat_id": existing_chat.id, "status": "Chat allready created"}
+    # Ищем личный чат по паре пользователей и создаем его, если такого ещё нет
+    try:
+        chat_id, created = await get_or_create_direct_chat(session, user.id, second_user_id)
+    except IntegrityError:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    # Если чат не найден, создаем новый
-    new_chat = Chat(participants=[user.id, second_user_id])
-    session.add(new_chat)
-    await session.commit()
-    await session.refresh(new_chat)
+    if not created:
+        return {"chat_id": chat_id, "status": "Chat allready created"}
 
-    return {"chat_id": new_chat.id, "status": "Chat created"}
+    await manager.notify_chat_joined(chat_id, (user.id, second_user_id))
+    return {"chat_id": chat_id, "status": "Chat created"}
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
 
-    async def connect(self, chat_id: int, websocket: WebSocket):
-        if chat_id not in self.active_connections:
-            self.active_connections[chat_id] = []
-        self.active_connections[chat_id].append(websocket)
+@chat_router.get("/current_user_get")
+async def current_user_get(user: User = Depends(current_user)):
+    return user.id
 
-    def disconnect(self, chat_id: int, websocket: WebSocket):
-        self.active_connections[chat_id].remove(websocket)
-        if not self.active_connections[chat_id]:
-            del self.active_connections[chat_id]
 
-    async def send_message(self, chat_id: int, message: dict):
-        # Сериализация сообщения в строку JSON
-        message_str = json.dumps(message)
-        for connection in self.active_connections.get(chat_id, []):
-            await connection.send_text(message_str)
+async def save_message(db: AsyncSession, chat_id: int, sender: int, text: str, is_picture: bool = False) -> Message:
+    # Сохранение сообщения в базе данных; id и created_at нужны для рассылки
+    message = Message(chat_id=chat_id, text=text, sender=sender, is_picture=is_picture)
+    db.add(message)
+    await db.flush()
+    await record_messages(db, [message])
+    await db.commit()
+    await push_recent([message])
+    return message
+
+
+async def save_file_message(db: AsyncSession, chat_id: int, sender: int, filename: str,
+                            tmp_path: str, sha256: str, size: int) -> Message:
+    # Файл попадает в хранилище блобов; сообщение и счётчик ссылок фиксируются одной транзакцией
+    content_type = await run_in_threadpool(detect_content_type, tmp_path)
+    await blob_store.save_file(db, tmp_path, sha256, size, refs=1, content_type=content_type)
+    message = await save_message(db, chat_id, sender, make_blob_ref(sha256, filename), is_picture=True)
+    await mark_unread(chat_id, sender)
+    if content_type.startswith("image/"):
+        # Уменьшенные копии для ленты чата создаются в фоне, только для изображений
+        await enqueue_image_variants("message", message.id)
+    return message
+
+
+async def post_text_message(websocket: WebSocket, chat_id: int, sender: int, text: str,
+                            client_id: Optional[str] = None):
+    # Сохранение и рассылка текстового сообщения в обычном или отложенном (write-behind) режиме
+    if not MESSAGE_WRITE_BEHIND:
+        async with async_session_maker() as db:
+            message = await save_message(db, chat_id, sender, text)
+        await manager.send_message(chat_id, message_to_dict(message))
+        await mark_unread(chat_id, sender)
+        return
+    pending = await message_writer.submit(chat_id, sender, text)
+    asyncio.create_task(deliver_when_durable(websocket, pending, client_id))
+
+
+async def post_read_receipt(chat_id: int, user_id: int, message_id) -> bool:
+    # Отметка о прочтении: курсор и счётчик непрочитанных, уведомление участников чата
+    if not isinstance(message_id, int):
+        return False
+    if await mark_read(chat_id, user_id, message_id) is not None:
+        await manager.send_event(chat_id, {"type": "read", "chat_id": chat_id, "user_id": user_id,
+                                           "message_id": message_id})
+    return True
+
+
+async def send_history(websocket: WebSocket, chat_id: int, messages: List[EncodedMessage], batched: bool):
+    # Страница истории (от новых к старым) уходит клиенту от старых к новым:
+    # одним кадром "history" или, в прежнем протоколе /ws/chat, по кадру на сообщение.
+    # Кадры сообщений уже сериализованы (из Redis или один раз после чтения из Postgres)
+    ordered = list(reversed(messages))
+    if batched:
+        next_cursor = messages[-1].cursor if messages else None
+        await manager.send_frame(websocket, history_frame(chat_id, ordered, next_cursor))
+        return
+    for message in ordered:
+        await manager.send_frame(websocket, Frame.from_json(message.json))
 
-manager = ConnectionManager()
 
-@chat_router.get("/current_user_get")
-async def current_user_get(user: User = Depends(current_user)):
-    return user.id
-@chat_router.websocket("/ws/chat/{chat_id}")
-async def chat_websocket(websocket: WebSocket,
-                         chat_id: int,
-                         db: AsyncSession = Depends(get_async_session)):
-    await websocket.accept()
-    data2 = await websocket.receive_text()
-    user_data = json.loads(data2)
-    user = user_data.get("userId")
-    await manager.connect(chat_id, websocket)
+async def deliver_when_durable(websocket: WebSocket, pending: PendingMessage, client_id: Optional[str]):
+    # Рассылка, счётчики непрочитанных и подтверждение — только после фиксации сообщения в Postgres:
+    # сообщение, которое база отклонила, никто не увидит
+    message = pending.message
+    try:
+        await pending.durable
+    except Exception:
+        await manager.send_personal(websocket, {"type": "error", "chat_id": message.chat_id, "id": message.id,
+                                                "client_id": client_id, "error": "Message not saved"})
+        return
+    await manager.send_message(message.chat_id, message_to_dict(message))
+    await mark_unread(message.chat_id, message.sender)
+    await manager.send_personal(websocket, {"type": "ack", "chat_id": message.chat_id, "id": message.id,
+                                            "client_id": client_id})
 
-    # Проверка, является ли пользователь участником чата
-    chat = await db.get(Chat, chat_id)
-    if chat is None:
-        await websocket.close()
+
+@chat_router.websocket("/ws/chat/{chat_id}")
+async def chat_websocket(websocket: WebSocket, chat_id: int):
+    # Пользователь определяется по JWT из cookie рукопожатия, а не по данным клиента
+    current = await get_websocket_user(websocket)
+    if current is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
-    # для пагинации
-    page = 1  # Начинаем с первой страницы
-    page_size = 5
-    if user not in chat.participants:
-        await websocket.close()
+    user = current.id
+
+    # Проверка членства до регистрации сокета, чтобы отклонённые соединения не попадали в менеджер
+    if chat_id not in await get_user_chat_ids(user):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         return
 
-    result = await db.execute(
-        select(Message)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at.desc())
-        .limit(page_size)
-    )
-    messages = result.scalars().all()
+    # Подпротокол chat.v2.* включает историю одним кадром и выбирает кодировку (src/Chat/codec.py)
+    subprotocol, encoding = negotiate_encoding(websocket)
+    batched = subprotocol is not None
+    await websocket.accept(subprotocol=subprotocol)
+    manager.set_encoding(websocket, encoding, events=batched)
+    await manager.connect(chat_id, websocket)
+    WS_OPEN_SOCKETS.labels(CHAT_WS_ENDPOINT).inc()
 
-    # Отправляем их пользователю в обратном порядке (чтобы первые были самыми старыми)
-    for message in reversed(messages):
-        await websocket.send_json({
-            "sender": message.sender,
-            "text": message.text,
-            "is_picture": message.is_picture,
-            "created_at": str(message.created_at)
-        })
+    # Текущая загрузка файла бинарными кадрами
+    upload: Optional[ChunkedUpload] = None
 
     try:
+        # Сессия БД берётся на каждую операцию, а не на всё время жизни сокета:
+        # иначе простаивающие сокеты держат соединения пула и блокируют HTTP-роуты
+        # Последние сообщения — из списка в Redis, Postgres только при промахе
+        messages = await fetch_recent_history(chat_id)
+        # Курсор самого старого отправленного сообщения — с него продолжается loadMore
+        cursor = decode_cursor(messages[-1].cursor) if messages else None
+        await send_history(websocket, chat_id, messages, batched)
+
         while True:
             data = await websocket.receive()
             if data["type"] == "websocket.disconnect":  # Обрабатываем разрыв соединения
                 logger.info(f"Пользователь {user} отключился от чата {chat_id}")
-                manager.disconnect(chat_id, websocket)
                 break
+            WS_MESSAGES_IN.labels(CHAT_WS_ENDPOINT).inc()
+            if data.get("bytes") is not None:  # Бинарный кадр — очередной кусок загружаемого файла
+                if upload is None:
+                    await manager.send_personal(websocket, {"error": "Загрузка файла не начата"})
+                    continue
+                try:
+                    await upload.write(data["bytes"])
+                except UploadError as e:
+                    await upload.abort()
+                    upload = None
+                    await manager.send_personal(websocket, {"error": str(e)})
+                continue
             message_data = json.loads(data["text"])
+            if 'uploadStart' in message_data:  # {"uploadStart": {"filename": ..., "size": ...}}
+                if upload is not None:
+                    await upload.abort()
+                try:
+                    upload = ChunkedUpload(message_data["uploadStart"].get("filename"),
+                                           message_data["uploadStart"].get("size"))
+                    await upload.open()
+                except UploadError as e:
+                    upload = None
+                    await manager.send_personal(websocket, {"error": str(e)})
+                    continue
+                await manager.send_personal(websocket, {"upload": "ready"})
+                continue
+            if 'uploadEnd' in message_data:
+                if upload is None:
+                    await manager.send_personal(websocket, {"error": "Загрузка файла не начата"})
+                    continue
+                try:
+                    tmp_path, sha256 = await upload.finish()
+                except UploadError as e:
+                    await upload.abort()
+                    await manager.send_personal(websocket, {"error": str(e)})
+                    continue
+                finally:
+                    finished, upload = upload, None
+                await manager.send_personal(websocket, {"upload": "done", "sha256": sha256})
+
+                # В чат уходит только ссылка на готовый файл
+                async with async_session_maker() as db:
+                    message = await save_file_message(db, chat_id, user, finished.filename,
+                                                      tmp_path, sha256, finished.size)
+                await manager.send_message(chat_id, message_to_dict(message))
+                continue
+            if 'userId' in message_data:  # Старые клиенты присылают userId первым кадром — больше не нужен
+                continue
+            if 'read' in message_data:  # {"read": id последнего прочитанного сообщения}
+                if not await post_read_receipt(chat_id, user, message_data['read']):
+                    await manager.send_personal(websocket, {"error": "Некорректный id сообщения"})
+                continue
             if 'loadMore' in message_data:  # Если запрос на загрузку следующей порции сообщений
-                offset = page * page_size
-                result = await db.execute(
-                    select(Message)
-                    .where(Message.chat_id == chat_id)
-                    .order_by(Message.created_at.desc())
-                    .offset(offset)
-                    .limit(page_size)
-                )
-                messages = result.scalars().all()
-
-                if not messages:
-                    await websocket.send_json({"info": "Все сообщения загружены"})
+                # Клиент может передать свой курсор и размер страницы (не больше HISTORY_MAX_PAGE_SIZE)
+                if message_data.get("cursor"):
+                    try:
+                        cursor = decode_cursor(message_data["cursor"])
+                    except ValueError as e:
+                        await manager.send_personal(websocket, {"error": str(e)})
+                        continue
+                messages = []
+                if cursor is not None:  # Иначе в чате не было истории на момент подключения
+                    messages = await fetch_recent_history(chat_id, before=cursor, limit=message_data.get("limit"))
+
+                if not messages and not batched:
+                    await manager.send_personal(websocket, {"info": "Все сообщения загружены"})
                     continue
 
-                # Отправляем их пользователю в обратном порядке
-                for message in reversed(messages):
-                    await websocket.send_json({
-                        "sender": message.sender,
-                        "text": message.text,
-                        "is_picture": message.is_picture,
-                        "created_at": str(message.created_at)
-                    })
-
-                page += 1
+                # Пустой кадр истории с next_cursor = null — история загружена полностью
+                await send_history(websocket, chat_id, messages, batched)
+                if messages:
+                    cursor = decode_cursor(messages[-1].cursor)
                 continue
             # Проверка на тип полученных данных (бинарные или текстовые)
-            if isinstance(data, dict) and 'file' in message_data:  # Получены бинарные данные (файл)
-                base64_file = message_data['file']
-                if base64_file.startswith('data:'):
-                    base64_file = base64_file.split(',')[1]
-                file_name = str(uuid.uuid4()) +'__$__'+ message_data['filename']  # Генерируем уникальный идентификатор для файла
-                file_path = os.path.join(UPLOAD_DIRECTORY, file_name)
-                decoded_data = base64.b64decode(base64_file)
-
-                # Сохранение файла на диск
-                with open(file_path, "wb") as file:
-                    file.write(decoded_data)
-
-                # Запись в базу данных
-                message = Message(chat_id=chat_id, text=file_path, sender=user, is_picture=True)
-                db.add(message)
-                await db.commit()
-
-                # Отправка клиентам ссылки на файл
-                await manager.send_message(chat_id, {
-                    "sender": user,
-                    "text": file_path,  # Путь к файлу
-                    "created_at": str(message.created_at),
-                    "is_picture": True
-                })
+            if isinstance(data, dict) and 'file' in message_data:  # Файл в base64 (старые клиенты)
+                # Декодирование и запись на диск выполняются вне цикла событий
+                try:
+                    tmp_path, sha256, size = await save_base64_upload(message_data['file'])
+                except UploadError as e:
+                    await manager.send_personal(websocket, {"error": str(e)})
+                    continue
+
+                # Запись в базу данных и отправка клиентам ссылки на файл
+                async with async_session_maker() as db:
+                    message = await save_file_message(db, chat_id, user, message_data.get('filename'),
+                                                      tmp_path, sha256, size)
+                await manager.send_message(chat_id, message_to_dict(message))
 
             else:  # Текстовые данные
                 if not isinstance(data, dict) or "text" not in message_data:
                     logger.error(f"Некорректные данные: {message_data}")
                     continue
-                message = Message(chat_id=chat_id, text=message_data["text"], sender=user, is_picture=False)
-                # Сохранение сообщения в базе данных
-                db.add(message)
-                await db.commit()
-
-                # Широковещательная отправка сообщения другим подключенным клиентам
-                await manager.send_message(chat_id, {
-                    "sender": user,
-                    "text": message_data["text"],
-                    "created_at": str(message.created_at),
-                    "is_picture": False
-                })
+                # Сохранение и широковещательная отправка сообщения другим подключенным клиентам
+                await post_text_message(websocket, chat_id, user, message_data["text"],
+                                        message_data.get("client_id"))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if upload is not None:
+            await upload.abort()
+        await manager.disconnect(chat_id, websocket)
+        WS_OPEN_SOCKETS.labels(CHAT_WS_ENDPOINT).dec()
+
+
+@chat_router.websocket("/ws")
+async def multiplexed_websocket(websocket: WebSocket):
+    """
+    Один сокет на пользователя для всех его чатов.
+
+    Кадры клиента: {"type": "subscribe" | "loadMore" | "message", "chat_id": ..., ...}.
+    Сервер присылает {"type": "history", "chat_id", "messages", "next_cursor"} в ответ на
+    subscribe/loadMore и кадры {"type": "message", "chat_id", ...} по всем чатам пользователя —
+    для неоткрытых чатов это обновления инбокса вместо опроса /my_chats.
+    Когда пользователь попадает в новый чат, сокет подписывается на него сам и получает
+    {"type": "chat_joined", "chat_id"}.
+    Кодировку исходящих кадров клиент выбирает подпротоколом chat.v2.json или chat.v2.msgpack.
+    Сессия БД берётся только на время обработки одного кадра.
+    """
+    current = await get_websocket_user(websocket)
+    if current is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    user = current.id
+
+    subprotocol, encoding = negotiate_encoding(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    # Подписка на события пользователя раньше чтения списка чатов: чат, созданный в промежутке, не теряется
+    await manager.register(websocket, user)
+    manager.set_encoding(websocket, encoding)
+    WS_OPEN_SOCKETS.labels(MULTIPLEXED_WS_ENDPOINT).inc()
+    for chat_id in await get_user_chat_ids(user):
+        await manager.connect(chat_id, websocket)
+
+    # Курсоры истории по открытым чатам
+    cursors: Dict[int, Optional[Cursor]] = {}
+
+    try:
+        while True:
+            data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                logger.info(f"Пользователь {user} отключился от /ws")
+                break
+            WS_MESSAGES_IN.labels(MULTIPLEXED_WS_ENDPOINT).inc()
+            try:
+                frame = json.loads(data.get("text") or "")
+            except ValueError:
+                await manager.send_personal(websocket, {"type": "error", "error": "Invalid frame"})
+                continue
+
+            frame_type = frame.get("type")
+            chat_id = frame.get("chat_id")
+            if not isinstance(chat_id, int) or chat_id not in await get_user_chat_ids(user):
+                await manager.send_personal(websocket, {"type": "error", "chat_id": chat_id, "error": "Chat not found"})
+                continue
+            if chat_id not in manager.clients[websocket].chat_ids:
+                # Чат создан уже после подключения сокета
+                await manager.connect(chat_id, websocket)
+
+            if frame_type in ("subscribe", "loadMore"):
+                try:
+                    before = decode_cursor(frame.get("cursor"))
+                except ValueError as e:
+                    await manager.send_personal(websocket, {"type": "error", "chat_id": chat_id, "error": str(e)})
+                    continue
+                if before is None and frame_type == "loadMore":
+                    if cursors.get(chat_id) is None:
+                        await manager.send_personal(websocket, {"type": "history", "chat_id": chat_id,
+                                                                "messages": [], "next_cursor": None})
+                        continue
+                    before = cursors[chat_id]
+
+                messages = await fetch_recent_history(chat_id, before=before, limit=frame.get("limit"))
+                cursors[chat_id] = decode_cursor(messages[-1].cursor) if messages else None
+                await send_history(websocket, chat_id, messages, batched=True)
+
+            elif frame_type == "message":
+                text = frame.get("text")
+                if not isinstance(text, str) or not text:
+                    await manager.send_personal(websocket, {"type": "error", "chat_id": chat_id, "error": "Empty message"})
+                    continue
+                await post_text_message(websocket, chat_id, user, text, frame.get("client_id"))
+
+            elif frame_type == "read":
+                if not await post_read_receipt(chat_id, user, frame.get("message_id")):
+                    await manager.send_personal(websocket, {"type": "error", "chat_id": chat_id,
+                                                            "error": "Invalid message_id"})
+
+            else:
+                await manager.send_personal(websocket, {"type": "error", "chat_id": chat_id,
+                                                        "error": f"Unknown frame type: {frame_type}"})
     except WebSocketDisconnect:
-        manager.disconnect(chat_id, websocket)
+        pass
+    finally:
+        await manager.disconnect_all(websocket)
+        WS_OPEN_SOCKETS.labels(MULTIPLEXED_WS_ENDPOINT).dec()
 
 @chat_router.get("/my_chats")
+@query_budget(3)  # +1 запрос при промахе кэша непрочитанных
 async def my_chats(
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0),
     user: User = Depends(current_user),
     session: AsyncSession = Depends(get_async_session)
 ):
-    # Запрос для получения чатов, в которых участвует пользователь
-    chat_query = select(Chat).where(Chat.participants.contains([user.id]))
+    # Другой участник чата из chat_participants (по первичному ключу chat_id, user_id)
+    peer_participant = aliased(ChatParticipant)
+    peer = (
+        select(peer_participant.user_id.label("peer_id"))
+        .where(peer_participant.chat_id == Chat.id, peer_participant.user_id != user.id)
+        .limit(1)
+        .lateral("peer")
+    )
+
+    # Один запрос: чаты со сводкой последнего сообщения (без чтения messages) и собеседник
+    chat_query = (
+        select(
+            Chat.id,
+            Chat.last_message_preview,
+            Chat.last_message_at,
+            Chat.message_count,
+            User.id.label("user_id"),
+            User.username,
+            UserInfo.pic_path,
+            UserInfo.pic_variants,
+        )
+        .select_from(ChatParticipant)
+        .join(Chat, Chat.id == ChatParticipant.chat_id)
+        .outerjoin(peer, true())
+        .outerjoin(User, User.id == peer.c.peer_id)
+        .outerjoin(UserInfo, UserInfo.user_id == User.id)
+        .where(ChatParticipant.user_id == user.id)
+        .order_by(Chat.last_message_at.desc().nulls_last(), Chat.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
     result = await session.execute(chat_query)
-    chats = result.scalars().all()
+    rows = result.all()
 
-    if not chats:
+    if not rows and offset == 0:
         return {"status": "No chats found"}
 
-    chat_list = []
-
-    # Для каждого чата ищем последнее сообщение и имя другого участника
-    for chat in chats:
-        message_query = select(Message).where(Message.chat_id == chat.id).order_by(desc(Message.created_at)).limit(1)
-        message_result = await session.execute(message_query)
-        last_message = message_result.scalars().first()
-
-        # Найти ID другого участника чата
-        other_user_id = next((uid for uid in chat.participants if uid != user.id), None)
-        other_user = None
-
-        if other_user_id is not None:
-            user_query = select(User).where(User.id == other_user_id)
-            user_result = await session.execute(user_query)
-            other_user = user_result.scalars().first()
-
-        chat_info = {
-            "chat_id": chat.id,
-            "last_message": last_message.text if last_message else None,
-            "username": other_user.username if other_user else None  # Имя другого участника
+    # Счётчики непрочитанных из Redis, без подсчёта строк messages
+    unread = await get_unread_counts(session, user.id)
+
+    chat_list = [
+        {
+            "chat_id": row.id,
+            "last_message": row.last_message_preview,
+            "last_message_at": str(row.last_message_at) if row.last_message_at else None,
+            "message_count": row.message_count,
+            "user_id": row.user_id,
+            "username": row.username,  # Имя другого участника
+            "pic_path": small_variant(row.pic_path, row.pic_variants),
+            "unread_count": unread.get(row.id, 0)
         }
-
-        chat_list.append(chat_info)
+        for row in rows
+    ]
 
     return {"chats": chat_list}
 
+# REST-доступ к истории чата с той же семантикой курсора, что и loadMore в вебсокете
+@chat_router.get("/chats/{chat_id}/messages")
+@query_budget(3)
+async def chat_history(
+    chat_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    user: User = Depends(current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    if not await is_chat_participant(session, chat_id, user.id):
+        raise HTTPException(status_code=404, detail="Chat not found")
 
+    try:
+        before = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    messages = await fetch_history(session, chat_id, before=before, limit=limit)
+
+    return {
+        # Сообщения от старых к новым, как и в вебсокете
+        "messages": [message_to_dict(message) for message in reversed(messages)],
+        # Неполная страница — последняя, более старых сообщений нет
+        "next_cursor": encode_cursor(messages[-1]) if len(messages) == clamp_page_size(limit) else None
+    }
+
+# Поиск по тексту сообщений во всех чатах пользователя (или в одном чате при chat_id)
+@chat_router.get("/search_messages")
+@query_budget(2)
+async def search_chat_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    chat_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    user: User = Depends(current_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    try:
+        after = decode_search_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Членство проверяется в самом запросе: чужой chat_id даёт пустой результат
+    rows = await search_messages(session, user.id, q, chat_id=chat_id, after=after, limit=limit)
+
+    return {
+        "messages": [
+            # highlight — HTML: экранированный фрагмент текста с найденными словами в <mark>
+            {**message_to_dict(message), "rank": rank, "highlight": highlight_html(highlight)}
+            for message, rank, highlight in rows
+        ],
+        "next_cursor": encode_search_cursor(rows[-1].rank, rows[-1].Message.id) if len(rows) == limit else None
+    }
@@ -0,0 +1,95 @@
+"""
+Кодек исходящих кадров чата.
+
+Кадр сообщения (message_to_dict): {"type": "message", "id", "chat_id", "sender", "text",
+"is_picture", "preview", "created_at", "ts", "cursor"}, где id — серверный id сообщения,
+created_at — время в UTC строкой, ts — то же время в миллисекундах Unix, cursor — курсор loadMore.
+Кадр истории: {"type": "history", "chat_id", "messages": [кадры сообщений от старых к новым],
+"next_cursor"}.
+
+Кодировка выбирается подпротоколом вебсокета (Sec-WebSocket-Protocol):
+    chat.v2.json    — текстовые кадры JSON, история одним кадром;
+    chat.v2.msgpack — те же кадры в MessagePack, бинарными кадрами.
+Без подпротокола /ws/chat работает по прежнему протоколу: JSON, история по сообщению на кадр,
+без служебных кадров (отметки о прочтении {"type": "read"} получают только /ws и chat.v2.*).
+Входящие кадры клиента во всех режимах — JSON (бинарные кадры /ws/chat — куски загружаемого файла).
+"""
+from typing import List, Optional, Tuple, Union
+
+import msgpack
+import orjson
+from fastapi import WebSocket
+
+from src.Chat.history import encode_cursor, message_to_dict
+from src.Chat.models import Message
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+SUBPROTOCOLS = {"chat.v2.json": ENCODING_JSON, "chat.v2.msgpack": ENCODING_MSGPACK}
+
+
+def negotiate_encoding(websocket: WebSocket) -> Tuple[Optional[str], str]:
+    # Первый поддерживаемый подпротокол из списка клиента; None — прежний протокол
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol in SUBPROTOCOLS:
+            return subprotocol, SUBPROTOCOLS[subprotocol]
+    return None, ENCODING_JSON
+
+
+class Frame:
+    """Кадр, который сериализуется не больше одного раза в каждую кодировку, сколько бы сокетов его ни получили."""
+
+    __slots__ = ("_payload", "_json", "_msgpack")
+
+    def __init__(self, payload: Optional[dict] = None, json_text: Optional[str] = None):
+        self._payload = payload
+        self._json = json_text
+        self._msgpack: Optional[bytes] = None
+
+    @classmethod
+    def from_json(cls, json_text: str) -> "Frame":
+        return cls(json_text=json_text)
+
+    def payload(self) -> dict:
+        if self._payload is None:
+            self._payload = orjson.loads(self._json)
+        return self._payload
+
+    def json(self) -> str:
+        if self._json is None:
+            self._json = orjson.dumps(self._payload).decode()
+        return self._json
+
+    def msgpack(self) -> bytes:
+        if self._msgpack is None:
+            self._msgpack = msgpack.packb(self.payload())
+        return self._msgpack
+
+    def encode(self, encoding: str) -> Union[str, bytes]:
+        return self.msgpack() if encoding == ENCODING_MSGPACK else self.json()
+
+
+class EncodedMessage:
+    """Кадр сообщения, уже сериализованный в JSON, и курсор истории на этом сообщении."""
+
+    __slots__ = ("cursor", "json")
+
+    def __init__(self, cursor: str, json_text: str):
+        self.cursor = cursor
+        self.json = json_text
+
+    @classmethod
+    def from_message(cls, message: Message) -> "EncodedMessage":
+        return cls(encode_cursor(message), encode_message(message))
+
+
+def encode_message(message: Message) -> str:
+    return orjson.dumps(message_to_dict(message)).decode()
+
+
+def history_frame(chat_id: int, messages: List[EncodedMessage], next_cursor: Optional[str]) -> Frame:
+    # Готовые кадры сообщений вклеиваются в кадр истории без повторной сериализации
+    return Frame.from_json(
+        f'{{"type":"history","chat_id":{chat_id},"messages":[{",".join(m.json for m in messages)}],'
+        f'"next_cursor":{orjson.dumps(next_cursor).decode()}}}'
+    )
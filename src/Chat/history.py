@@ -0,0 +1,77 @@
+import calendar
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.Chat.models import Message
+from src.DB_config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from src.storage.store import small_variant
+
+# Курсор истории — строка "<created_at в ISO>_<id>" последнего (самого старого) полученного сообщения
+Cursor = Tuple[datetime, int]
+
+
+def encode_cursor(message: Message) -> str:
+    return f"{message.created_at.isoformat()}_{message.id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    try:
+        created_at, message_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        raise ValueError(f"Некорректный курсор: {cursor}")
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not isinstance(limit, int) or limit < 1:
+        return HISTORY_PAGE_SIZE
+    return min(limit, HISTORY_MAX_PAGE_SIZE)
+
+
+def epoch_millis(value: datetime) -> int:
+    # created_at хранится в UTC без часового пояса
+    return calendar.timegm(value.timetuple()) * 1000 + value.microsecond // 1000
+
+
+def message_to_dict(message: Message) -> dict:
+    return {
+        "type": "message",
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "sender": message.sender,
+        "text": message.text,
+        "is_picture": message.is_picture,
+        # Маленькая копия картинки для ленты; text по-прежнему указывает на оригинал
+        "preview": small_variant(None, message.variants),
+        "created_at": str(message.created_at),
+        "ts": epoch_millis(message.created_at),
+        "cursor": encode_cursor(message),
+    }
+
+
+async def fetch_history(
+    session: AsyncSession,
+    chat_id: int,
+    before: Optional[Cursor] = None,
+    limit: Optional[int] = None,
+) -> List[Message]:
+    """
+    Возвращает страницу сообщений чата, начиная с самых новых, строго старше курсора.
+
+    Сравнение пар (created_at, id) обслуживается индексом
+    ix_messages_chat_id_created_at_id без сканирования пропущенных строк, как при OFFSET.
+    """
+    query = select(Message).where(Message.chat_id == chat_id)
+    if before is not None:
+        # Отдельное условие на created_at отсекает более новые секции messages (сравнение пар их не отсекает)
+        query = query.where(tuple_(Message.created_at, Message.id) < tuple_(*before),
+                            Message.created_at <= before[0])
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(clamp_page_size(limit))
+
+    result = await session.execute(query)
+    return result.scalars().all()
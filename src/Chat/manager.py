@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+import orjson
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+
+from src.Chat.broadcast import BroadcastBackend, MemoryBroadcastBackend, create_broadcast_backend
+from src.Chat.codec import ENCODING_JSON, Frame
+from src.DB_config import WS_SEND_QUEUE_SIZE, WS_SEND_TIMEOUT, WS_SLOW_CONSUMER_POLICY
+from src.metrics import WS_MESSAGES_OUT, WS_BROADCAST_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Метрики обратного давления по чатам
+CHAT_QUEUE_DEPTH = Gauge(
+    "chat_send_queue_depth", "Сообщения, ожидающие отправки в сокеты чата", ["chat_id"],
+    multiprocess_mode="livesum"
+)
+CHAT_DROPPED_FRAMES = Counter(
+    "chat_dropped_frames_total", "Сообщения, отброшенные из-за переполнения очереди сокета", ["chat_id"]
+)
+CHAT_EVICTED_CLIENTS = Counter(
+    "chat_evicted_clients_total", "Медленные клиенты, отключенные сервером", ["chat_id"]
+)
+
+# Код закрытия 1013 — "Try Again Later"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Служебные кадры чата (например, отметки о прочтении) публикуются с этим префиксом:
+# прежний протокол /ws/chat без подпротокола знает только кадры сообщений и их не получает
+EVENT_MARKER = "!"
+
+
+class ClientConnection:
+    """
+    Сокет клиента с ограниченной очередью исходящих сообщений и своей задачей-писателем.
+
+    Один сокет может быть подписан на несколько чатов (мультиплексированный /ws),
+    поэтому в сокет пишет только эта задача, а элементы очереди помечены chat_id для метрик.
+    В очереди лежат общие для всех получателей Frame; кодировку сокета выбирает писатель.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float,
+                 on_failure: Callable[["ClientConnection"], None]):
+        self.websocket = websocket
+        self.chat_ids: Set[int] = set()
+        # Кодировка исходящих кадров, согласованная при подключении (src/Chat/codec.py)
+        self.encoding = ENCODING_JSON
+        # (chat_id или None для личных ответов, кадр, время постановки в очередь)
+        self.queue: "asyncio.Queue[Tuple[Optional[int], Frame, float]]" = asyncio.Queue(maxsize=max_queue)
+        self._send_timeout = send_timeout
+        self._on_failure = on_failure
+        self.evicted = False
+        # Мультиплексированный сокет живёт, даже пока не подписан ни на один чат
+        self.persistent = False
+        # Клиент понимает служебные кадры (/ws и подпротоколы chat.v2.*)
+        self.events = False
+        # Владелец сокета /ws (register)
+        self.user_id: Optional[int] = None
+        self._writer = asyncio.create_task(self._write())
+
+    def enqueue(self, chat_id: int, frame: Frame) -> bool:
+        try:
+            self.queue.put_nowait((chat_id, frame, time.perf_counter()))
+        except asyncio.QueueFull:
+            return False
+        CHAT_QUEUE_DEPTH.labels(chat_id).inc()
+        return True
+
+    async def send(self, frame: Frame):
+        # Личные ответы (история, ошибки) ждут места в очереди, а не отбрасываются
+        try:
+            await asyncio.wait_for(self.queue.put((None, frame, time.perf_counter())), self._send_timeout)
+        except asyncio.TimeoutError:
+            self._on_failure(self)
+
+    async def _write(self):
+        while True:
+            chat_id, frame, enqueued_at = await self.queue.get()
+            if chat_id is not None:
+                CHAT_QUEUE_DEPTH.labels(chat_id).dec()
+            data = frame.encode(self.encoding)
+            send = self.websocket.send_bytes if isinstance(data, bytes) else self.websocket.send_text
+            try:
+                await asyncio.wait_for(send(data), self._send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.info(f"Не удалось отправить сообщение в сокет: {e!r}")
+                self._on_failure(self)
+                return
+            WS_MESSAGES_OUT.inc()
+            if chat_id is not None:
+                WS_BROADCAST_LATENCY.observe(time.perf_counter() - enqueued_at)
+
+    def stop(self):
+        self._writer.cancel()
+        # Сообщения, оставшиеся в очереди, больше не будут отправлены
+        while not self.queue.empty():
+            chat_id, _, _ = self.queue.get_nowait()
+            if chat_id is not None:
+                CHAT_QUEUE_DEPTH.labels(chat_id).dec()
+
+
+class ConnectionManager:
+    def __init__(self, backend: Optional[BroadcastBackend] = None,
+                 max_queue: int = WS_SEND_QUEUE_SIZE,
+                 send_timeout: float = WS_SEND_TIMEOUT,
+                 slow_consumer_policy: str = WS_SLOW_CONSUMER_POLICY):
+        if slow_consumer_policy not in ("disconnect", "drop"):
+            raise ValueError(f"Неизвестная политика для медленных клиентов: {slow_consumer_policy}")
+        # chat_id -> сокеты этого процесса, подписанные на чат
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        # Одна очередь и один писатель на сокет, сколько бы чатов он ни слушал
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # user_id -> сокеты /ws этого процесса; подписываются на новые чаты пользователя
+        self.user_sockets: Dict[int, Set[WebSocket]] = {}
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.backend = backend or MemoryBroadcastBackend()
+        self.backend.bind(self.broadcast_local, self.deliver_user_event)
+
+    def _client(self, websocket: WebSocket) -> ClientConnection:
+        client = self.clients.get(websocket)
+        if client is None:
+            client = ClientConnection(websocket, self.max_queue, self.send_timeout, self._evict)
+            self.clients[websocket] = client
+        return client
+
+    async def register(self, websocket: WebSocket, user_id: int):
+        # Сокет /ws: живёт без чатов, получает служебные кадры и события пользователя
+        client = self._client(websocket)
+        client.persistent = True
+        client.events = True
+        client.user_id = user_id
+        sockets = self.user_sockets.setdefault(user_id, set())
+        if not sockets:
+            await self.backend.subscribe_user(user_id)
+        sockets.add(websocket)
+
+    def set_encoding(self, websocket: WebSocket, encoding: str, events: bool = False):
+        client = self._client(websocket)
+        client.encoding = encoding
+        client.events = client.events or events
+
+    async def connect(self, chat_id: int, websocket: WebSocket):
+        client = self._client(websocket)
+        if chat_id not in self.active_connections:
+            self.active_connections[chat_id] = {}
+            # Первый локальный сокет чата — подписываем процесс на канал
+            await self.backend.subscribe(chat_id)
+        self.active_connections[chat_id][websocket] = client
+        client.chat_ids.add(chat_id)
+
+    async def disconnect(self, chat_id: int, websocket: WebSocket):
+        if self._remove(chat_id, websocket):
+            await self.backend.unsubscribe(chat_id)
+
+    async def disconnect_all(self, websocket: WebSocket):
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        for chat_id in list(client.chat_ids):
+            await self.disconnect(chat_id, websocket)
+        if self.clients.pop(websocket, None) is not None:
+            client.stop()
+        sockets = self.user_sockets.get(client.user_id)
+        if sockets is not None and websocket in sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.user_sockets[client.user_id]
+                await self.backend.unsubscribe_user(client.user_id)
+
+    def _remove(self, chat_id: int, websocket: WebSocket) -> bool:
+        # Возвращает True, если в чате не осталось локальных сокетов
+        connections = self.active_connections.get(chat_id)
+        if not connections or websocket not in connections:
+            return False
+        client = connections.pop(websocket)
+        client.chat_ids.discard(chat_id)
+        if not client.chat_ids and not client.persistent:
+            self.clients.pop(websocket, None)
+            client.stop()
+        if connections:
+            return False
+        del self.active_connections[chat_id]
+        return True
+
+    def _evict(self, client: ClientConnection):
+        # Вызывается синхронно из рассылки, поэтому закрытие выполняется отдельной задачей
+        if client.evicted:
+            return
+        client.evicted = True
+        for chat_id in client.chat_ids:
+            CHAT_EVICTED_CLIENTS.labels(chat_id).inc()
+        asyncio.create_task(self._close_evicted(client))
+
+    async def _close_evicted(self, client: ClientConnection):
+        await self.disconnect_all(client.websocket)
+        try:
+            await client.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def send_message(self, chat_id: int, message: dict):
+        # Сериализация сообщения в строку JSON и публикация через бэкенд
+        message_str = orjson.dumps(message).decode()
+        await self.backend.publish(chat_id, message_str)
+
+    async def send_event(self, chat_id: int, event: dict):
+        # Служебный кадр чата только для клиентов, которые понимают такие кадры
+        await self.backend.publish(chat_id, EVENT_MARKER + orjson.dumps(event).decode())
+
+    async def notify_chat_joined(self, chat_id: int, user_ids: Iterable[int]):
+        # Новый чат или новый участник: сокеты /ws пользователей во всех процессах подписываются на чат
+        event = orjson.dumps({"type": "chat_joined", "chat_id": chat_id}).decode()
+        for user_id in user_ids:
+            await self.backend.publish_user(user_id, event)
+
+    async def deliver_user_event(self, user_id: int, message_str: str):
+        frame = Frame.from_json(message_str)
+        event = frame.payload()
+        for websocket in list(self.user_sockets.get(user_id, ())):
+            if event.get("type") == "chat_joined":
+                await self.connect(event["chat_id"], websocket)
+            await self.send_frame(websocket, frame)
+
+    async def send_personal(self, websocket: WebSocket, message: dict):
+        await self.send_frame(websocket, Frame(message))
+
+    async def send_frame(self, websocket: WebSocket, frame: Frame):
+        # Ответ одному сокету через его очередь, чтобы не писать в сокет параллельно с писателем
+        client = self.clients.get(websocket)
+        if client is not None:
+            await client.send(frame)
+
+    async def broadcast_local(self, chat_id: int, message_str: str):
+        # Только ставит готовый кадр в очереди сокетов, не дожидаясь отправки;
+        # один Frame на всех получателей — каждая кодировка сериализуется один раз
+        events_only = message_str.startswith(EVENT_MARKER)
+        frame = Frame.from_json(message_str[len(EVENT_MARKER):] if events_only else message_str)
+        for client in list(self.active_connections.get(chat_id, {}).values()):
+            if events_only and not client.events:
+                continue
+            if client.enqueue(chat_id, frame):
+                continue
+            CHAT_DROPPED_FRAMES.labels(chat_id).inc()
+            if self.slow_consumer_policy == "disconnect":
+                self._evict(client)
+
+    async def close(self):
+        for client in list(self.clients.values()):
+            client.stop()
+        self.clients.clear()
+        self.active_connections.clear()
+        self.user_sockets.clear()
+        await self.backend.close()
+
+
+manager = ConnectionManager(create_broadcast_backend())
@@ -1,21 +1,80 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, UniqueConstraint, Computed, \
+    Sequence
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from src.database import Base
 from datetime import datetime
 
+# Конфигурация полнотекстового поиска по сообщениям (входит в выражение генерируемого столбца)
+MESSAGE_SEARCH_CONFIG = "russian"
+# Последовательность id сообщений; из неё же берёт id заранее отложенная запись (src/Chat/writer.py)
+MESSAGE_ID_SEQUENCE = Sequence("messages_id_seq")
+
 class Chat(Base):
     __tablename__ = "chats"
     id = Column(Integer, primary_key=True, index=True)
-    participants = Column(JSONB)
+    participants = Column(JSONB)  # Оставлено для совместимости, членство хранится в chat_participants
+    # Упорядоченная пара собеседников личного чата (меньший и больший id)
+    direct_user_low = Column(Integer, ForeignKey("user.id"), nullable=True)
+    direct_user_high = Column(Integer, ForeignKey("user.id"), nullable=True)
+    # Сводка для списка чатов, обновляется в транзакции вставки сообщения (src/Chat/summary.py).
+    # Без индекса: обновление строки на каждое сообщение остаётся HOT
+    last_message_id = Column(Integer, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_preview = Column(String, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
     messages = relationship("Message", back_populates="chat")
+    members = relationship("ChatParticipant", back_populates="chat")
+
+    __table_args__ = (
+        # Не больше одного личного чата на пару пользователей, поиск чата по паре — точечный
+        UniqueConstraint("direct_user_low", "direct_user_high", name="uq_chats_direct_pair"),
+    )
+
+class ChatParticipant(Base):
+    __tablename__ = "chat_participants"
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    # Курсор прочтения и число непрочитанных; актуальное значение счётчика — в Redis (src/Chat/unread.py)
+    last_read_message_id = Column(Integer, nullable=True)
+    # created_at прочитанного сообщения: id из разных блоков писателей не упорядочены по времени,
+    # курсор сравнивается по (created_at, id), как и история
+    last_read_at = Column(DateTime, nullable=True)
+    unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    chat = relationship("Chat", back_populates="members")
+
+    __table_args__ = (
+        # Список чатов пользователя; первичный ключ (chat_id, user_id) обслуживает проверку членства
+        Index("ix_chat_participants_user_id_chat_id", "user_id", "chat_id"),
+    )
 
 class Message(Base):
+    # Секционирована по created_at помесячно (src/Chat/partitions.py), первичный ключ в БД — (id, created_at)
     __tablename__ = "messages"
-    id = Column(Integer, primary_key=True, index=True)
+    # Составной первичный ключ не даёт SQLAlchemy считать id автоинкрементным —
+    # последовательность указана явно, INSERT берёт из неё id и возвращает его через RETURNING
+    id = Column(Integer, MESSAGE_ID_SEQUENCE, primary_key=True, index=True, autoincrement=True)
     chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
     text = Column(String, nullable=False)
     is_picture = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Уменьшенные копии картинки (как UserInfo.pic_variants); {} — файл не является изображением
+    variants = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     sender = Column(Integer, ForeignKey("user.id"), nullable=False)
+    # Полнотекстовый индекс текста; у файлов (is_picture) в text путь, они в поиск не попадают.
+    # deferred — вектор не загружается вместе с историей
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(f"CASE WHEN is_picture THEN NULL ELSE to_tsvector('{MESSAGE_SEARCH_CONFIG}', text) END",
+                 persisted=True),
+    ))
     chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # Постраничная загрузка истории чата по курсору (created_at, id)
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Для ORM сообщение по-прежнему определяется одним id: session.get(Message, id) работает как раньше
+    __mapper_args__ = {"primary_key": [id]}
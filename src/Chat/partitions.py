@@ -0,0 +1,122 @@
+import gzip
+import logging
+import os
+from datetime import date, datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.DB_config import MESSAGE_PARTITIONS_AHEAD, MESSAGE_ARCHIVE_AFTER_MONTHS, MESSAGE_ARCHIVE_DIRECTORY, \
+    MESSAGE_ARCHIVE_DROP
+
+logger = logging.getLogger(__name__)
+
+# Таблица messages секционирована по created_at помесячно: messages_y2026m10 хранит октябрь 2026
+MESSAGES_TABLE = "messages"
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{MESSAGES_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def create_partition_sql(month: date) -> str:
+    # IF NOT EXISTS: задачу могут запустить повторно, а секции уже созданы миграцией
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {MESSAGES_TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+async def ensure_partitions(session: AsyncSession, months_ahead: int = MESSAGE_PARTITIONS_AHEAD) -> List[str]:
+    """
+    Создаёт секции текущего месяца и months_ahead следующих (задача Celery beat).
+
+    Секции по умолчанию нет: сообщение с датой вне секций не вставится,
+    поэтому секции создаются с запасом в несколько месяцев.
+    """
+    current = month_start(datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        exists = (await session.execute(text("SELECT to_regclass(:name)"), {"name": partition_name(month)})).scalar()
+        if exists is None:
+            await session.execute(text(create_partition_sql(month)))
+            created.append(partition_name(month))
+    await session.commit()
+    return created
+
+
+async def list_partitions(session: AsyncSession) -> List[Tuple[str, date]]:
+    # Присоединённые секции messages и первый день месяца после их диапазона
+    result = await session.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+        ORDER BY child.relname
+    """), {"table": MESSAGES_TABLE})
+    partitions = []
+    for name in result.scalars().all():
+        try:
+            year, month = name[len(MESSAGES_TABLE) + 2:].split("m")
+            partitions.append((name, add_months(date(int(year), int(month), 1), 1)))
+        except ValueError:
+            continue  # Секции, созданные вручную под другим именем, не архивируются
+    return partitions
+
+
+async def export_partition(session: AsyncSession, name: str, directory: str) -> str:
+    # COPY ... TO STDOUT прямо из asyncpg, в файл CSV со сжатием gzip
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    tmp_path = path + ".part"
+    connection = await session.connection()
+    raw = (await connection.get_raw_connection()).driver_connection
+    with gzip.open(tmp_path, "wb") as archive:
+        async def write(chunk: bytes):
+            archive.write(chunk)
+        # search_vector генерируется заново при загрузке архива обратно
+        await raw.copy_from_query(
+            f"SELECT id, chat_id, text, is_picture, variants, created_at, sender FROM {name} ORDER BY id",
+            output=write, format="csv", header=True,
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+async def archive_partitions(
+    session: AsyncSession,
+    after_months: int = MESSAGE_ARCHIVE_AFTER_MONTHS,
+    directory: str = MESSAGE_ARCHIVE_DIRECTORY,
+    drop: bool = MESSAGE_ARCHIVE_DROP,
+) -> List[str]:
+    """
+    Выгружает секции старше after_months месяцев в <directory>/<секция>.csv.gz и отсоединяет их.
+
+    Отсоединённая секция остаётся обычной таблицей (её можно вернуть через ATTACH PARTITION),
+    при drop=True она удаляется после выгрузки.
+    """
+    cutoff = add_months(month_start(datetime.utcnow()), -after_months)
+    archived = []
+    for name, upper_bound in await list_partitions(session):
+        if upper_bound > cutoff:
+            continue
+        path = await export_partition(session, name, directory)
+        await session.execute(text(f"ALTER TABLE {MESSAGES_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            await session.execute(text(f"DROP TABLE {name}"))
+        await session.commit()
+        logger.info(f"Секция {name} выгружена в {path} и отсоединена")
+        archived.append(name)
+    return archived
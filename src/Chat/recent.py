@@ -0,0 +1,212 @@
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select, true
+from sqlalchemy.orm import aliased
+
+from src.auth.utils import redis
+from src.Chat.codec import EncodedMessage, encode_message
+from src.Chat.history import Cursor, clamp_page_size, fetch_history
+from src.Chat.models import Chat, Message
+from src.DB_config import RECENT_MESSAGES_SIZE, RECENT_MESSAGES_TTL, RECENT_WARM_CHATS
+from src.database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# recent:{chat_id} — список последних RECENT_MESSAGES_SIZE сообщений чата, от новых к старым.
+# Элемент — "<ключ сортировки> <кадр message_to_dict в JSON>", ключ сортировки сравнивается как строка,
+# а JSON уходит клиентам как есть, без повторной сериализации
+RECENT_KEY_PREFIX = "recent:"
+# recent_gen:{chat_id} — растёт при каждой записи в чат; заполнение из Postgres не перетирает
+# сообщения, пришедшие, пока выполнялся запрос
+RECENT_GEN_KEY_PREFIX = "recent_gen:"
+
+# Вставляет элементы с сохранением порядка: сообщения разных воркеров могут прийти не по порядку.
+# Пока список не заполнен из Postgres, сообщения в него не пишутся — иначе он выглядел бы полным
+_PUSH_SCRIPT = redis.register_script("""
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local size = tonumber(ARGV[1])
+for i = 3, #ARGV do
+    local entry = ARGV[i]
+    local head = redis.call('LINDEX', KEYS[1], 0)
+    if entry > head then
+        redis.call('LPUSH', KEYS[1], entry)
+    else
+        local items = redis.call('LRANGE', KEYS[1], 0, -1)
+        local placed = false
+        for j = 1, #items do
+            if items[j] == entry then
+                placed = true
+                break
+            elseif items[j] < entry then
+                redis.call('LINSERT', KEYS[1], 'BEFORE', items[j], entry)
+                placed = true
+                break
+            end
+        end
+        if not placed and #items < size then
+            redis.call('RPUSH', KEYS[1], entry)
+        end
+    end
+end
+redis.call('LTRIM', KEYS[1], 0, size - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+""")
+
+_FILL_SCRIPT = redis.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+""")
+
+
+def recent_key(chat_id: int) -> str:
+    return f"{RECENT_KEY_PREFIX}{chat_id}"
+
+
+def recent_gen_key(chat_id: int) -> str:
+    return f"{RECENT_GEN_KEY_PREFIX}{chat_id}"
+
+
+def sort_key(created_at, message_id: int) -> str:
+    # Фиксированная длина: строковое сравнение совпадает со сравнением пар (created_at, id)
+    return f"{created_at:%Y-%m-%dT%H:%M:%S.%f}|{message_id:012d}"
+
+
+SORT_KEY_LENGTH = len(sort_key(datetime(2000, 1, 1), 0))
+
+
+def ring_entry(message: Message) -> str:
+    return f"{sort_key(message.created_at, message.id)} {encode_message(message)}"
+
+
+def parse_ring_entry(entry: bytes) -> EncodedMessage:
+    # Курсор в формате encode_cursor: "<created_at в ISO>_<id>"
+    created_at, message_id = entry[:SORT_KEY_LENGTH].decode().split("|")
+    created_at = datetime.fromisoformat(created_at).isoformat()
+    return EncodedMessage(f"{created_at}_{int(message_id)}", entry[SORT_KEY_LENGTH + 1:].decode())
+
+
+async def _generation(chat_id: int) -> str:
+    gen = await redis.get(recent_gen_key(chat_id))
+    return gen.decode() if gen is not None else ""
+
+
+async def push_recent(messages: Iterable[Message]):
+    """Добавляет записанные в Postgres сообщения в списки их чатов (после COMMIT)."""
+    by_chat = {}
+    for message in messages:
+        by_chat.setdefault(message.chat_id, []).append(ring_entry(message))
+    for chat_id, entries in by_chat.items():
+        await _PUSH_SCRIPT(keys=[recent_key(chat_id), recent_gen_key(chat_id)],
+                           args=[RECENT_MESSAGES_SIZE, RECENT_MESSAGES_TTL] + sorted(entries))
+
+
+async def fill_recent(chat_id: int, generation: str, messages: List[Message]):
+    # messages — последние сообщения чата от новых к старым, как возвращает fetch_history
+    entries = [ring_entry(message) for message in messages[:RECENT_MESSAGES_SIZE]]
+    if entries:
+        await _FILL_SCRIPT(keys=[recent_key(chat_id), recent_gen_key(chat_id)],
+                           args=[RECENT_MESSAGES_TTL, generation] + entries)
+
+
+async def invalidate_recent(chat_id: int):
+    # Кадры сообщений изменились (например, появились уменьшенные копии картинки)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(recent_key(chat_id))
+        pipe.incr(recent_gen_key(chat_id))
+        pipe.expire(recent_gen_key(chat_id), RECENT_MESSAGES_TTL)
+        await pipe.execute()
+
+
+async def read_recent(chat_id: int, before: Optional[Cursor], limit: int) -> Optional[List[EncodedMessage]]:
+    """Страница из списка в Redis или None, если её нельзя собрать без Postgres."""
+    key = recent_key(chat_id)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, RECENT_MESSAGES_TTL)  # Чаты, которые не читают, вытесняются по TTL
+        entries, _ = await pipe.execute()
+    if not entries:
+        return None
+    boundary = sort_key(*before).encode() if before is not None else None
+    older = [entry for entry in entries if boundary is None or entry < boundary]
+    # Короткий список — это вся история чата, иначе более старые сообщения есть только в Postgres
+    if len(older) < limit and len(entries) >= RECENT_MESSAGES_SIZE:
+        return None
+    return [parse_ring_entry(entry) for entry in older[:limit]]
+
+
+async def fetch_recent_history(chat_id: int, before: Optional[Cursor] = None,
+                               limit: Optional[int] = None) -> List[EncodedMessage]:
+    """
+    Страница истории (готовые кадры сообщений от новых к старым) с той же семантикой, что fetch_history.
+
+    Первая страница и ближайшие loadMore отдаются из Redis; при промахе первая страница
+    читается из Postgres сразу на RECENT_MESSAGES_SIZE сообщений и заполняет список.
+    """
+    limit = clamp_page_size(limit)
+    page = await read_recent(chat_id, before, limit)
+    if page is not None:
+        return page
+
+    generation = await _generation(chat_id)
+    async with async_session_maker() as db:
+        if before is None:
+            messages = await fetch_history(db, chat_id, limit=max(limit, RECENT_MESSAGES_SIZE))
+        else:
+            messages = await fetch_history(db, chat_id, before=before, limit=limit)
+    if before is None:
+        await fill_recent(chat_id, generation, messages)
+    return [EncodedMessage.from_message(message) for message in messages[:limit]]
+
+
+async def warm_recent(chat_limit: int = RECENT_WARM_CHATS) -> int:
+    """Заполняет списки самых активных чатов (по сводке chats.last_message_at) одним запросом."""
+    if chat_limit <= 0:
+        return 0
+    async with async_session_maker() as db:
+        chat_ids = (await db.execute(
+            select(Chat.id)
+            .where(Chat.last_message_at.isnot(None))
+            .order_by(Chat.last_message_at.desc())
+            .limit(chat_limit)
+        )).scalars().all()
+        if not chat_ids:
+            return 0
+        gens = await redis.mget([recent_gen_key(chat_id) for chat_id in chat_ids])
+        generations = {chat_id: gen.decode() if gen is not None else "" for chat_id, gen in zip(chat_ids, gens)}
+        # Последние сообщения каждого чата — LATERAL по индексу (chat_id, created_at, id)
+        latest = (
+            select(Message)
+            .where(Message.chat_id == Chat.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(RECENT_MESSAGES_SIZE)
+            .lateral("latest")
+        )
+        latest_message = aliased(Message, latest)
+        result = await db.execute(
+            select(latest_message)
+            .select_from(Chat)
+            .join(latest, true())
+            .where(Chat.id.in_(chat_ids))
+            .order_by(latest.c.chat_id, latest.c.created_at.desc(), latest.c.id.desc())
+        )
+        by_chat = {}
+        for message in result.scalars().all():
+            by_chat.setdefault(message.chat_id, []).append(message)
+    for chat_id, messages in by_chat.items():
+        await fill_recent(chat_id, generations[chat_id], messages)
+    logger.info(f"Прогреты последние сообщения {len(by_chat)} чатов")
+    return len(by_chat)
@@ -0,0 +1,96 @@
+import html
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, select, func, cast, and_, or_
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.Chat.models import ChatParticipant, Message, MESSAGE_SEARCH_CONFIG
+
+# Курсор поиска — строка "<rank>_<id>" последнего результата предыдущей страницы
+SearchCursor = Tuple[float, int]
+
+SEARCH_MAX_PAGE_SIZE = 50
+# ts_headline отмечает найденные слова управляющими символами, а не тегами: фрагмент текста
+# экранируется уже после выделения (highlight_html), и <mark> остаются единственной разметкой
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_STOP = "\x03"
+HEADLINE_OPTIONS = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, MaxFragments=2, MaxWords=20, MinWords=5"
+
+
+def encode_search_cursor(rank: float, message_id: int) -> str:
+    return f"{rank!r}_{message_id}"
+
+
+def decode_search_cursor(cursor: Optional[str]) -> Optional[SearchCursor]:
+    if not cursor:
+        return None
+    try:
+        rank, message_id = cursor.rsplit("_", 1)
+        return float(rank), int(message_id)
+    except ValueError:
+        raise ValueError(f"Некорректный курсор: {cursor}")
+
+
+def highlight_html(headline: str) -> str:
+    # Текст сообщения — пользовательский ввод; в HTML фрагмента из него попадают только экранированные символы
+    return html.escape(headline).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+
+
+def build_search_query(
+    user_id: int,
+    query: str,
+    chat_id: Optional[int] = None,
+    after: Optional[SearchCursor] = None,
+    limit: int = 20,
+) -> Select:
+    config = cast(MESSAGE_SEARCH_CONFIG, REGCONFIG)
+    # websearch_to_tsquery не падает на произвольном вводе: "фразы", OR, -исключения
+    tsquery = func.websearch_to_tsquery(config, query)
+    rank = func.ts_rank_cd(Message.search_vector, tsquery).label("rank")
+
+    # Сначала выбираем страницу id по рангу, и только для неё считаем ts_headline — он дорогой
+    page = (
+        select(Message.id, Message.created_at, rank)
+        .join(ChatParticipant, and_(ChatParticipant.chat_id == Message.chat_id,
+                                    ChatParticipant.user_id == user_id))
+        # У файлов search_vector равен NULL, поэтому они не совпадают с запросом
+        .where(Message.search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), Message.id.desc())
+        .limit(min(limit, SEARCH_MAX_PAGE_SIZE))
+    )
+    if chat_id is not None:
+        page = page.where(Message.chat_id == chat_id)
+    if after is not None:
+        last_rank, last_id = after
+        page = page.where(or_(rank < last_rank, and_(rank == last_rank, Message.id < last_id)))
+    page = page.subquery()
+
+    # Символы-разделители, встречающиеся в самом тексте, удаляются, чтобы не превратиться в лишние <mark>
+    headline_text = func.translate(Message.text, HIGHLIGHT_START + HIGHLIGHT_STOP, "")
+    highlight = func.ts_headline(config, headline_text, tsquery, HEADLINE_OPTIONS).label("highlight")
+    return (
+        select(Message, page.c.rank, highlight)
+        # created_at в условии соединения отсекает лишние секции messages при выполнении
+        .join(page, and_(page.c.id == Message.id, page.c.created_at == Message.created_at))
+        .order_by(page.c.rank.desc(), Message.id.desc())
+    )
+
+
+async def search_messages(
+    session: AsyncSession,
+    user_id: int,
+    query: str,
+    chat_id: Optional[int] = None,
+    after: Optional[SearchCursor] = None,
+    limit: int = 20,
+) -> List[tuple]:
+    """
+    Полнотекстовый поиск по сообщениям чатов, в которых состоит пользователь.
+
+    Совпадения ищутся по GIN-индексу ix_messages_search_vector, результаты упорядочены
+    по (rank desc, id desc). Возвращает строки (Message, rank, highlight); highlight ещё не HTML —
+    перед отдачей клиенту он проходит через highlight_html.
+    """
+    result = await session.execute(build_search_query(user_id, query, chat_id=chat_id, after=after, limit=limit))
+    return result.all()
@@ -0,0 +1,61 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import update, case, or_, tuple_, bindparam, Integer, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.Chat.models import Chat, Message
+
+# Длина превью последнего сообщения в chats; ссылки на файлы не обрезаются
+PREVIEW_LENGTH = 200
+
+
+def message_preview(text: str, is_picture: bool) -> str:
+    return text if is_picture else text[:PREVIEW_LENGTH]
+
+
+_chat_id = bindparam("chat", type_=Integer)
+_count = bindparam("count", type_=Integer)
+_message_id = bindparam("message_id", type_=Integer)
+_preview = bindparam("preview", type_=String)
+_at = bindparam("at", type_=DateTime)
+
+_newer = or_(
+    Chat.last_message_at.is_(None),
+    tuple_(Chat.last_message_at, Chat.last_message_id) < tuple_(_at, _message_id),
+)
+
+# Все выражения SET видят старые значения строки, поэтому условие _newer одно для всех столбцов:
+# сообщения, записанные разными воркерами не по порядку, не откатывают last_message назад
+_update_summary = (
+    update(Chat)
+    .where(Chat.id == _chat_id)
+    .values(
+        message_count=Chat.message_count + _count,
+        last_message_id=case((_newer, _message_id), else_=Chat.last_message_id),
+        last_message_preview=case((_newer, _preview), else_=Chat.last_message_preview),
+        last_message_at=case((_newer, _at), else_=Chat.last_message_at),
+    )
+)
+
+
+async def record_messages(session: AsyncSession, messages: Iterable[Message]):
+    """
+    Обновляет сводку чатов (последнее сообщение и счётчик) в транзакции, которая вставляет сообщения.
+
+    Вызывается до COMMIT; у сообщений уже должны быть id (после flush или из последовательности).
+    """
+    chats: Dict[int, dict] = {}
+    for message in messages:
+        summary = chats.get(message.chat_id)
+        if summary is None:
+            summary = chats[message.chat_id] = {"chat": message.chat_id, "count": 0, "at": None, "message_id": None}
+        summary["count"] += 1
+        if summary["at"] is None or (message.created_at, message.id) > (summary["at"], summary["message_id"]):
+            summary.update(at=message.created_at, message_id=message.id,
+                           preview=message_preview(message.text, message.is_picture))
+    if not chats:
+        return
+    # Строки chats блокируются в порядке id — параллельные пачки не взаимоблокируются
+    rows: List[dict] = [chats[chat_id] for chat_id in sorted(chats)]
+    connection = await session.connection()
+    await connection.execute(_update_summary, rows)
@@ -0,0 +1,166 @@
+from typing import Dict, Optional, Set
+
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.utils import redis
+from src.Chat.models import ChatParticipant, Message
+from src.DB_config import CHAT_MEMBERSHIP_CACHE_TTL, UNREAD_CACHE_TTL
+from src.database import async_session_maker
+
+# unread:{user_id} — хэш chat_id -> число непрочитанных; поле "0" отмечает загруженный из Postgres хэш
+UNREAD_KEY_PREFIX = "unread:"
+UNREAD_MARKER_FIELD = "0"
+# Пары "user_id:chat_id", изменённые в Redis и ещё не записанные в chat_participants
+UNREAD_DIRTY_KEY = "unread:dirty"
+CHAT_MEMBERS_KEY_PREFIX = "chat_members:"
+
+# Увеличивает счётчики только в загруженных хэшах и возвращает номера получателей без хэша:
+# их счётчики увеличиваются сразу в Postgres. TTL продлевается при каждом изменении,
+# как при заполнении хэша: хэш без TTL неактивного пользователя жил бы в Redis бессрочно
+_INCREMENT_SCRIPT = redis.register_script("""
+local missing = {}
+for i = 2, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('HINCRBY', KEYS[i], ARGV[1], 1)
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+        redis.call('SADD', KEYS[1], ARGV[i + 1])
+    else
+        table.insert(missing, i - 1)
+    end
+end
+return missing
+""")
+
+_SET_IF_LOADED_SCRIPT = redis.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+""")
+
+
+def unread_key(user_id: int) -> str:
+    return f"{UNREAD_KEY_PREFIX}{user_id}"
+
+
+async def get_chat_member_ids(chat_id: int) -> Set[int]:
+    # Участники чата для рассылки счётчиков; кэш как у get_user_chat_ids
+    key = f"{CHAT_MEMBERS_KEY_PREFIX}{chat_id}"
+    cached = await redis.smembers(key)
+    if cached:
+        return {int(user_id) for user_id in cached}
+
+    async with async_session_maker() as session:
+        result = await session.execute(select(ChatParticipant.user_id).where(ChatParticipant.chat_id == chat_id))
+        user_ids = set(result.scalars().all())
+
+    if user_ids:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, *user_ids)
+            pipe.expire(key, CHAT_MEMBERSHIP_CACHE_TTL)
+            await pipe.execute()
+    return user_ids
+
+
+async def mark_unread(chat_id: int, sender: int):
+    """Новое сообщение: +1 к непрочитанным у всех участников чата, кроме отправителя."""
+    recipients = sorted(await get_chat_member_ids(chat_id) - {sender})
+    if not recipients:
+        return
+    missing = await _INCREMENT_SCRIPT(
+        keys=[UNREAD_DIRTY_KEY] + [unread_key(user_id) for user_id in recipients],
+        args=[chat_id, UNREAD_CACHE_TTL] + [f"{user_id}:{chat_id}" for user_id in recipients],
+    )
+    if missing:
+        async with async_session_maker() as session:
+            await session.execute(
+                update(ChatParticipant)
+                .where(ChatParticipant.chat_id == chat_id,
+                       ChatParticipant.user_id.in_([recipients[i - 1] for i in missing]))
+                .values(unread_count=ChatParticipant.unread_count + 1)
+            )
+            await session.commit()
+
+
+async def get_unread_counts(session: AsyncSession, user_id: int) -> Dict[int, int]:
+    # Счётчики всех чатов пользователя из Redis; при промахе хэш заполняется из chat_participants
+    key = unread_key(user_id)
+    cached = await redis.hgetall(key)
+    if cached:
+        return {int(chat_id): int(count) for chat_id, count in cached.items()
+                if chat_id != UNREAD_MARKER_FIELD.encode()}
+
+    result = await session.execute(
+        select(ChatParticipant.chat_id, ChatParticipant.unread_count).where(ChatParticipant.user_id == user_id)
+    )
+    counts = {chat_id: unread_count for chat_id, unread_count in result.all()}
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping={UNREAD_MARKER_FIELD: 0, **counts})
+        pipe.expire(key, UNREAD_CACHE_TTL)
+        await pipe.execute()
+    return counts
+
+
+async def mark_read(chat_id: int, user_id: int, message_id: int) -> Optional[int]:
+    """
+    Пользователь прочитал чат до message_id включительно.
+
+    Курсор (created_at, id) только сдвигается вперёд; число непрочитанных пересчитывается по индексу
+    (chat_id, created_at, id) и сразу пишется в Postgres и в Redis.
+    Возвращает новое число непрочитанных или None, если курсор не изменился.
+    """
+    async with async_session_maker() as session:
+        participant = (await session.execute(
+            select(ChatParticipant)
+            .where(ChatParticipant.chat_id == chat_id, ChatParticipant.user_id == user_id)
+            .with_for_update()
+        )).scalar_one_or_none()
+        if participant is None:
+            return None
+        read_at = (await session.execute(
+            select(Message.created_at).where(Message.id == message_id, Message.chat_id == chat_id)
+        )).scalar()
+        if read_at is None:
+            return None
+        if participant.last_read_at is not None and \
+                (read_at, message_id) <= (participant.last_read_at, participant.last_read_message_id):
+            return None
+        unread = (await session.execute(
+            select(func.count())
+            .select_from(Message)
+            .where(Message.chat_id == chat_id,
+                   tuple_(Message.created_at, Message.id) > tuple_(read_at, message_id),
+                   Message.created_at >= read_at,
+                   Message.sender != user_id)
+        )).scalar_one()
+        participant.last_read_message_id = message_id
+        participant.last_read_at = read_at
+        participant.unread_count = unread
+        await session.commit()
+
+    await _SET_IF_LOADED_SCRIPT(keys=[unread_key(user_id)], args=[chat_id, unread])
+    return unread
+
+
+async def flush_unread_counts(batch_size: int = 1000) -> int:
+    """Запись изменённых в Redis счётчиков в chat_participants (задача Celery)."""
+    flushed = 0
+    while True:
+        members = await redis.spop(UNREAD_DIRTY_KEY, batch_size)
+        if not members:
+            return flushed
+        pairs = [tuple(int(part) for part in member.split(b":")) for member in members]
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id, chat_id in pairs:
+                pipe.hget(unread_key(user_id), chat_id)
+            counts = await pipe.execute()
+        rows = [
+            {"chat_id": chat_id, "user_id": user_id, "unread_count": int(count)}
+            for (user_id, chat_id), count in zip(pairs, counts) if count is not None
+        ]
+        if rows:
+            async with async_session_maker() as session:
+                # Массовое обновление по первичному ключу (chat_id, user_id)
+                await session.execute(update(ChatParticipant), rows)
+                await session.commit()
+        flushed += len(rows)
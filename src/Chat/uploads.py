@@ -0,0 +1,90 @@
+import base64
+import binascii
+import hashlib
+from typing import Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from src.DB_config import CHAT_UPLOAD_MAX_SIZE
+from src.storage.store import make_staging_path, safe_filename, remove_staged_file
+
+
+class UploadError(Exception):
+    pass
+
+
+class ChunkedUpload:
+    """
+    Загрузка файла бинарными кадрами вебсокета.
+
+    Куски пишутся во временный файл в пуле потоков, чтобы не блокировать цикл событий,
+    SHA-256 считается по мере поступления, размер ограничен CHAT_UPLOAD_MAX_SIZE.
+    Готовый файл передаётся в хранилище блобов (src.storage.store).
+    """
+
+    def __init__(self, filename: str, size: int):
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("Не указан размер файла")
+        if size > CHAT_UPLOAD_MAX_SIZE:
+            raise UploadError(f"Файл больше {CHAT_UPLOAD_MAX_SIZE} байт")
+        self.filename = safe_filename(filename)
+        self.size = size
+        self.received = 0
+        self.path = make_staging_path()
+        self._hash = hashlib.sha256()
+        self._file = None
+
+    async def open(self):
+        self._file = await run_in_threadpool(open, self.path, "wb")
+
+    def _write_chunk(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    async def write(self, chunk: bytes):
+        if self.received + len(chunk) > self.size:
+            raise UploadError("Получено больше данных, чем было заявлено")
+        await run_in_threadpool(self._write_chunk, chunk)
+        self.received += len(chunk)
+
+    async def finish(self) -> Tuple[str, str]:
+        # Возвращает (путь к временному файлу, sha256)
+        if self.received != self.size:
+            raise UploadError(f"Получено {self.received} из {self.size} байт")
+        await run_in_threadpool(self._file.close)
+        return self.path, self._hash.hexdigest()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+        remove_staged_file(self.path)
+
+    async def abort(self):
+        await run_in_threadpool(self._discard)
+
+
+def _save_base64(path: str, encoded: str) -> Tuple[str, int]:
+    data = base64.b64decode(encoded, validate=True)
+    if len(data) > CHAT_UPLOAD_MAX_SIZE:
+        raise UploadError(f"Файл больше {CHAT_UPLOAD_MAX_SIZE} байт")
+    with open(path, "wb") as file:
+        file.write(data)
+    return hashlib.sha256(data).hexdigest(), len(data)
+
+
+async def save_base64_upload(encoded: str) -> Tuple[str, str, int]:
+    """
+    Старый путь загрузки (base64 внутри JSON); декодирование и запись выполняются вне цикла событий.
+    Возвращает (путь к временному файлу, sha256, размер).
+    """
+    if encoded.startswith('data:'):
+        encoded = encoded.split(',', 1)[1]
+    # Грубая проверка до декодирования: base64 длиннее исходных данных в 4/3 раза
+    if len(encoded) * 3 // 4 > CHAT_UPLOAD_MAX_SIZE:
+        raise UploadError(f"Файл больше {CHAT_UPLOAD_MAX_SIZE} байт")
+    path = make_staging_path()
+    try:
+        sha256, size = await run_in_threadpool(_save_base64, path, encoded)
+    except (binascii.Error, ValueError):
+        raise UploadError("Некорректные данные файла")
+    return path, sha256, size
@@ -0,0 +1,94 @@
+from typing import Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.utils import redis
+from src.Chat.models import Chat, ChatParticipant
+from src.DB_config import CHAT_MEMBERSHIP_CACHE_TTL
+from src.database import async_session_maker
+
+MEMBERSHIP_KEY_PREFIX = "user_chats:"
+# Метка в Redis-множестве, чтобы кэшировать и пустой список чатов (id чатов начинаются с 1)
+EMPTY_MEMBERSHIP_MARKER = "0"
+
+
+async def is_chat_participant(session: AsyncSession, chat_id: int, user_id: int) -> bool:
+    # Точечный запрос по первичному ключу chat_participants (chat_id, user_id)
+    result = await session.execute(
+        select(ChatParticipant.chat_id).where(
+            ChatParticipant.chat_id == chat_id,
+            ChatParticipant.user_id == user_id
+        )
+    )
+    return result.first() is not None
+
+
+async def get_user_chat_ids(user_id: int) -> Set[int]:
+    """
+    Все чаты пользователя одним запросом с кэшированием в Redis.
+
+    При массовом переподключении после деплоя каждый сокет проверяет членство
+    по кэшу, а Postgres получает не больше одного запроса на пользователя за TTL.
+    """
+    key = f"{MEMBERSHIP_KEY_PREFIX}{user_id}"
+    cached = await redis.smembers(key)
+    if cached:
+        return {int(chat_id) for chat_id in cached} - {int(EMPTY_MEMBERSHIP_MARKER)}
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(ChatParticipant.chat_id).where(ChatParticipant.user_id == user_id)
+        )
+        chat_ids = set(result.scalars().all())
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.sadd(key, EMPTY_MEMBERSHIP_MARKER, *chat_ids)
+        pipe.expire(key, CHAT_MEMBERSHIP_CACHE_TTL)
+        await pipe.execute()
+    return chat_ids
+
+
+async def invalidate_user_chat_ids(*user_ids: int):
+    await redis.delete(*(f"{MEMBERSHIP_KEY_PREFIX}{user_id}" for user_id in user_ids))
+
+
+async def get_or_create_direct_chat(session: AsyncSession, user_id: int, second_user_id: int) -> Tuple[int, bool]:
+    """
+    Возвращает (chat_id, created) личного чата двух пользователей.
+
+    Уникальный ключ (direct_user_low, direct_user_high) не даёт создать
+    дубликат при одновременных запросах: проигравшая вставка ничего не
+    возвращает, и чат читается повторно.
+    """
+    low, high = sorted((user_id, second_user_id))
+    existing_query = select(Chat.id).where(Chat.direct_user_low == low, Chat.direct_user_high == high)
+
+    result = await session.execute(existing_query)
+    chat_id = result.scalar()
+    if chat_id is not None:
+        return chat_id, False
+
+    insert_query = (
+        insert(Chat)
+        .values(participants=[user_id, second_user_id], direct_user_low=low, direct_user_high=high)
+        .on_conflict_do_nothing(constraint="uq_chats_direct_pair")
+        .returning(Chat.id)
+    )
+    result = await session.execute(insert_query)
+    chat_id = result.scalar()
+    if chat_id is None:
+        await session.rollback()
+        result = await session.execute(existing_query)
+        return result.scalar_one(), False
+
+    await session.execute(
+        insert(ChatParticipant)
+        .values([{"chat_id": chat_id, "user_id": low}, {"chat_id": chat_id, "user_id": high}])
+        .on_conflict_do_nothing()
+    )
+    await session.commit()
+    await invalidate_user_chat_ids(low, high)
+    return chat_id, True
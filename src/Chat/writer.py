@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from prometheus_client import Counter
+
+from src.Chat.models import Message, MESSAGE_ID_SEQUENCE
+from src.Chat.summary import record_messages
+from src.Chat.recent import push_recent
+from src.DB_config import MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL, MESSAGE_JOURNAL, MESSAGE_JOURNAL_WORKER_TTL
+from src.auth.utils import redis
+from src.database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+# У каждого воркера свой Redis Stream chat:message_journal:{worker_id} с ещё не записанными сообщениями.
+# Хэш JOURNAL_OWNERS — журнал -> воркер, который его дописывает; воркер жив, пока есть его ключ
+# JOURNAL_ALIVE_PREFIX{worker_id} (TTL MESSAGE_JOURNAL_WORKER_TTL, продлевается в фоне)
+JOURNAL_STREAM_PREFIX = "chat:message_journal:"
+JOURNAL_OWNERS = "chat:message_journal_owners"
+JOURNAL_ALIVE_PREFIX = "chat:message_journal_alive:"
+# Пауза перед повтором записи пачки, если Postgres недоступен (секунды)
+FLUSH_RETRY_DELAY = 1.0
+
+# Передаёт журнал вызывающему воркеру, если прежний владелец не продлевал отметку дольше TTL.
+# Атомарно: журнал остановленного воркера дописывает ровно один из запускающихся воркеров
+_CLAIM_SCRIPT = redis.register_script("""
+local owner = redis.call('HGET', KEYS[1], ARGV[1])
+if not owner then
+    return 0
+end
+if owner ~= ARGV[2] and redis.call('EXISTS', ARGV[3] .. owner) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+""")
+
+MESSAGES_REJECTED = Counter(
+    "chat_messages_rejected_total", "Сообщения отложенной записи, отклонённые базой", ["reason"]
+)
+
+
+def is_row_error(error: DBAPIError) -> bool:
+    # Ошибка в данных конкретной строки (ограничение, недопустимое значение), а не недоступность базы:
+    # такая строка не запишется и при повторе, пачку с ней пишем по одной строке
+    return not error.connection_invalidated and not isinstance(error, (OperationalError, InterfaceError))
+
+
+class PendingMessage:
+    def __init__(self, message: Message):
+        self.message = message
+        self.journal_id: Optional[bytes] = None
+        self.durable: "asyncio.Future[Message]" = asyncio.get_running_loop().create_future()
+
+
+def _message_row(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "sender": message.sender,
+        "text": message.text,
+        "is_picture": message.is_picture,
+        "created_at": message.created_at,
+    }
+
+
+def _journal_entry(message: Message) -> str:
+    row = _message_row(message)
+    row["created_at"] = row["created_at"].isoformat()
+    return json.dumps(row)
+
+
+class MessageWriter:
+    """
+    Отложенная (write-behind) запись сообщений чата.
+
+    id берётся из последовательности messages заранее, пачкой, а в Postgres сообщение попадает
+    многострочным INSERT не позже чем через MESSAGE_FLUSH_INTERVAL после первого сообщения пачки
+    или по MESSAGE_BATCH_SIZE строк. Future PendingMessage.durable завершается после COMMIT — только
+    тогда сообщение рассылается и отправителю уходит подтверждение. До записи сообщение лежит
+    в журнале воркера в Redis; журнал остановленного воркера дописывает recover() другого воркера.
+    Строку, которую база отклоняет (удалённый чат, недопустимый текст), отправитель получает
+    как ошибку — она не блокирует остальные сообщения и удаляется из журнала.
+    """
+
+    def __init__(self, batch_size: int = MESSAGE_BATCH_SIZE, flush_interval: float = MESSAGE_FLUSH_INTERVAL,
+                 use_journal: bool = MESSAGE_JOURNAL, session_maker: async_sessionmaker = async_session_maker):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.use_journal = use_journal
+        self.session_maker = session_maker
+        self._ids: Deque[int] = deque()
+        self._buffer: List[PendingMessage] = []
+        self._ids_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal_stream = f"{JOURNAL_STREAM_PREFIX}{self.worker_id}"
+        self._registered = False
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _start(self):
+        # Примитивы asyncio создаются внутри работающего цикла событий (Python 3.9)
+        if self._flusher is None:
+            self._ids_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _register(self):
+        # Журнал воркера и отметка, что воркер жив — до первой записи в журнал
+        if not self._registered:
+            await self._mark_alive()
+            self._registered = True
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _mark_alive(self):
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(f"{JOURNAL_ALIVE_PREFIX}{self.worker_id}", 1, ex=MESSAGE_JOURNAL_WORKER_TTL)
+            pipe.hset(JOURNAL_OWNERS, self.journal_stream, self.worker_id)
+            await pipe.execute()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(MESSAGE_JOURNAL_WORKER_TTL / 3)
+            try:
+                await self._mark_alive()
+            except Exception as e:
+                logger.error(f"Не удалось продлить отметку журнала сообщений: {e!r}")
+
+    async def _next_id(self) -> int:
+        async with self._ids_lock:
+            if not self._ids:
+                # Один запрос к последовательности на batch_size сообщений
+                async with self.session_maker() as session:
+                    result = await session.execute(
+                        select(MESSAGE_ID_SEQUENCE.next_value())
+                        .select_from(func.generate_series(1, self.batch_size))
+                    )
+                    self._ids.extend(result.scalars().all())
+            return self._ids.popleft()
+
+    async def submit(self, chat_id: int, sender: int, text: str, is_picture: bool = False) -> PendingMessage:
+        self._start()
+        message = Message(id=await self._next_id(), chat_id=chat_id, sender=sender, text=text,
+                          is_picture=is_picture, created_at=datetime.utcnow())
+        pending = PendingMessage(message)
+        if self.use_journal:
+            await self._register()
+            pending.journal_id = await redis.xadd(self.journal_stream, {"data": _journal_entry(message)})
+        self._buffer.append(pending)
+        self._wakeup.set()
+        if len(self._buffer) >= self.batch_size:
+            self._batch_full.set()
+        return pending
+
+    async def _flush_loop(self):
+        while True:
+            # Пока буфер пуст, цикл спит на событии и не просыпается по таймеру
+            while not self._buffer:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # Окно накопления пачки: flush_interval с первого сообщения или до batch_size строк
+            if len(self._buffer) < self.batch_size:
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Пачка остаётся в буфере и в журнале, повторяем позже
+                logger.error(f"Не удалось записать сообщения: {e!r}")
+                await asyncio.sleep(FLUSH_RETRY_DELAY)
+
+    async def flush(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                await self._write(batch)
+            except BaseException:
+                # И при отмене (close() посреди записи): пачка возвращается в буфер, а не теряется
+                self._buffer[:0] = batch
+                raise
+
+    async def _write(self, batch: List[PendingMessage], stream: Optional[str] = None):
+        try:
+            async with self.session_maker() as session:
+                # ON CONFLICT: сообщение могло быть уже восстановлено из журнала другим воркером.
+                # Ключ секционированной таблицы — (id, created_at), created_at в журнале тот же
+                result = await session.execute(
+                    insert(Message).values([_message_row(p.message) for p in batch])
+                    .on_conflict_do_nothing(index_elements=[Message.id, Message.created_at])
+                    .returning(Message.id)
+                )
+                # Сводка чатов учитывает только действительно вставленные строки
+                inserted = set(result.scalars().all())
+                await record_messages(session, [p.message for p in batch if p.message.id in inserted])
+                await session.commit()
+            await push_recent([p.message for p in batch if p.message.id in inserted])
+            written: List[Tuple[PendingMessage, Optional[Exception]]] = [(p, None) for p in batch]
+        except DBAPIError as e:
+            if not is_row_error(e):
+                raise
+            # Одна «плохая» строка (например, удалённый чат) не должна блокировать всю пачку
+            written = [(p, await self._write_one(p)) for p in batch]
+
+        if self.use_journal:
+            await redis.xdel(stream or self.journal_stream, *[p.journal_id for p, _ in written])
+        for pending, error in written:
+            if pending.durable.done():
+                continue
+            if error is None:
+                pending.durable.set_result(pending.message)
+            else:
+                pending.durable.set_exception(error)
+
+    async def _write_one(self, pending: PendingMessage) -> Optional[Exception]:
+        try:
+            async with self.session_maker() as session:
+                result = await session.execute(
+                    insert(Message).values(_message_row(pending.message))
+                    .on_conflict_do_nothing(index_elements=[Message.id, Message.created_at])
+                    .returning(Message.id)
+                )
+                inserted = result.scalar() is not None
+                if inserted:
+                    await record_messages(session, [pending.message])
+                await session.commit()
+            if inserted:
+                await push_recent([pending.message])
+        except DBAPIError as e:
+            if not is_row_error(e):
+                raise
+            logger.error(f"Сообщение {pending.message.id} отклонено базой: {e.orig!r}")
+            MESSAGES_REJECTED.labels(type(e).__name__).inc()
+            return e
+        return None
+
+    async def recover(self):
+        """Дописывает в Postgres журналы остановленных воркеров (при запуске воркера)."""
+        if not self.use_journal:
+            return
+        await self._register()
+        recovered = 0
+        for stream in await redis.hkeys(JOURNAL_OWNERS):
+            stream = stream.decode()
+            if stream == self.journal_stream:
+                continue
+            # Журнал живого воркера или уже забранный другим воркером не трогаем
+            if not await _CLAIM_SCRIPT(keys=[JOURNAL_OWNERS],
+                                       args=[stream, self.worker_id, JOURNAL_ALIVE_PREFIX]):
+                continue
+            recovered += await self._replay(stream)
+            # Остановленный воркер в журнал больше не пишет; отклонённые базой строки удалены _write
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(stream)
+                pipe.hdel(JOURNAL_OWNERS, stream)
+                await pipe.execute()
+        if recovered:
+            logger.info(f"Восстановлено из журналов сообщений: {recovered}")
+
+    async def _replay(self, stream: str) -> int:
+        batch = []
+        for entry_id, fields in await redis.xrange(stream):
+            row = json.loads(fields[b"data"])
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+            pending = PendingMessage(Message(**row))
+            pending.journal_id = entry_id
+            batch.append(pending)
+        for start in range(0, len(batch), self.batch_size):
+            await self._write(batch[start:start + self.batch_size], stream)
+        return len(batch)
+
+    async def close(self):
+        if self._flusher is not None:
+            # Дожидаемся отмены фоновой записи, чтобы дописывание буфера не пересекалось с ней
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+            self._registered = False
+            # Буфер записан — журнал пуст, дописывать после остановки нечего
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.journal_stream, f"{JOURNAL_ALIVE_PREFIX}{self.worker_id}")
+                pipe.hdel(JOURNAL_OWNERS, self.journal_stream)
+                await pipe.execute()
+
+
+message_writer = MessageWriter()
@@ -11,11 +11,103 @@ DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
 DB_PASS = os.environ.get("DB_PASS")
 
+# Пул соединений SQLAlchemy: размер, переполнение, ожидание свободного соединения (секунды),
+# проверка соединения перед выдачей, пересоздание через N секунд (-1 — не пересоздавать)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+# Кэш подготовленных выражений asyncpg; 0 — для работы через PgBouncer в режиме transaction
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
 REDIS_PORT = os.environ.get("REDIS_PORT")
 REDIS_HOST = os.environ.get("REDIS_HOST")
 
+# Бэкенд рассылки сообщений чатов: "memory" (один процесс) или "redis" (несколько воркеров/подов)
+BROADCAST_BACKEND = os.environ.get("BROADCAST_BACKEND", "memory")
+
+# Очередь исходящих сообщений на каждый сокет и политика для медленных клиентов:
+# "disconnect" — отключать клиента при переполнении, "drop" — отбрасывать новые сообщения
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", 100))
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", 10))
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "disconnect")
+
+# Размер страницы истории чата по умолчанию и максимальный размер, который может запросить клиент
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 5))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 100))
+# Последние сообщения каждого чата в Redis: размер списка, TTL без обращений (секунды)
+# и сколько самых активных чатов заполнять при запуске
+RECENT_MESSAGES_SIZE = int(os.environ.get("RECENT_MESSAGES_SIZE", 50))
+RECENT_MESSAGES_TTL = int(os.environ.get("RECENT_MESSAGES_TTL", 3600))
+RECENT_WARM_CHATS = int(os.environ.get("RECENT_WARM_CHATS", 1000))
+
+# Отложенная запись сообщений: INSERT пачками раз в MESSAGE_FLUSH_INTERVAL секунд или по MESSAGE_BATCH_SIZE
+# строк, рассылка после COMMIT пачки; MESSAGE_JOURNAL — журнал незаписанных сообщений воркера в Redis
+MESSAGE_WRITE_BEHIND = os.environ.get("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+MESSAGE_BATCH_SIZE = int(os.environ.get("MESSAGE_BATCH_SIZE", 100))
+MESSAGE_FLUSH_INTERVAL = float(os.environ.get("MESSAGE_FLUSH_INTERVAL", 0.005))
+MESSAGE_JOURNAL = os.environ.get("MESSAGE_JOURNAL", "true").lower() == "true"
+# Через сколько секунд без отметки воркер считается остановленным и его журнал дописывает другой воркер
+MESSAGE_JOURNAL_WORKER_TTL = int(os.environ.get("MESSAGE_JOURNAL_WORKER_TTL", 30))
+
+# Время жизни хэша непрочитанных в Redis и период записи изменённых счётчиков в Postgres (секунды)
+UNREAD_CACHE_TTL = int(os.environ.get("UNREAD_CACHE_TTL", 24 * 3600))
+UNREAD_FLUSH_INTERVAL = int(os.environ.get("UNREAD_FLUSH_INTERVAL", 10))
+
+# Максимальный размер файла, отправляемого в чат (байты)
+CHAT_UPLOAD_MAX_SIZE = int(os.environ.get("CHAT_UPLOAD_MAX_SIZE", 20 * 1024 * 1024))
+# Максимальный размер аватарки (байты)
+AVATAR_MAX_SIZE = int(os.environ.get("AVATAR_MAX_SIZE", 5 * 1024 * 1024))
+
+# Хранилище вложений с адресацией по SHA-256: "local" (файловая система) или "s3" (S3-совместимое, требует boto3)
+BLOB_BACKEND = os.environ.get("BLOB_BACKEND", "local")
+BLOB_LOCAL_DIRECTORY = os.environ.get("BLOB_LOCAL_DIRECTORY", "media/blobs")
+BLOB_TMP_DIRECTORY = os.environ.get("BLOB_TMP_DIRECTORY", "media/tmp")
+# Блоб без ссылок удаляется сборщиком мусора не раньше, чем через столько секунд после последнего использования
+BLOB_GC_GRACE_SECONDS = int(os.environ.get("BLOB_GC_GRACE_SECONDS", 24 * 3600))
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY")
+S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY")
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+# Если задан (например "/_protected/"), файлы отдаёт фронт-прокси по X-Accel-Redirect, а не воркер
+STATIC_ACCEL_REDIRECT_PREFIX = os.environ.get("STATIC_ACCEL_REDIRECT_PREFIX", "")
+# max-age для файлов в /static, которые могут быть перезаписаны (секунды); остальные проверяются по ETag
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 0))
+
+# Время жизни кэша результатов поиска пользователей в Redis (секунды)
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 30))
+
+# Кэш аутентифицированных пользователей: размер LRU в процессе, TTL (секунды) и общий слой в Redis
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+USER_CACHE_REDIS = os.environ.get("USER_CACHE_REDIS", "false").lower() == "true"
+
+# Время жизни кэша списка чатов пользователя в Redis (секунды), используется при подключении вебсокетов
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.environ.get("CHAT_MEMBERSHIP_CACHE_TTL", 300))
+
 # Получение секрета для JWT
 SECRET_KEY = os.environ.get("SECRET_KEY")
 
 MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
-MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
\ No newline at end of file
+MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+
+# Порт, на котором воркер Celery отдаёт метрики Prometheus
+CELERY_METRICS_PORT = int(os.environ.get("CELERY_METRICS_PORT", 9808))
+
+# Режим разработки: запись SQL-запросов каждого HTTP-запроса, поиск N+1 и проверка бюджетов @query_budget
+QUERY_DEBUG = os.environ.get("QUERY_DEBUG", "false").lower() == "true"
+# Превышение бюджета — ошибка 500 (для тестов), а не предупреждение в логе
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "false").lower() == "true"
+# Сколько одинаковых по форме запросов за один HTTP-запрос считать признаком N+1
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", 3))
+
+# Секционирование messages по месяцам: сколько будущих секций держать созданными заранее
+MESSAGE_PARTITIONS_AHEAD = int(os.environ.get("MESSAGE_PARTITIONS_AHEAD", 3))
+# Архивация старых секций (выгрузка в .csv.gz и DETACH PARTITION), выключена по умолчанию
+MESSAGE_ARCHIVE = os.environ.get("MESSAGE_ARCHIVE", "false").lower() == "true"
+MESSAGE_ARCHIVE_AFTER_MONTHS = int(os.environ.get("MESSAGE_ARCHIVE_AFTER_MONTHS", 12))
+MESSAGE_ARCHIVE_DIRECTORY = os.environ.get("MESSAGE_ARCHIVE_DIRECTORY", "media/archive")
+# Удалять отсоединённую секцию после выгрузки
+MESSAGE_ARCHIVE_DROP = os.environ.get("MESSAGE_ARCHIVE_DROP", "false").lower() == "true"
@@ -1,22 +1,32 @@
+import asyncio
+import time
+
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.auth.auth_cookie import auth_backend, fastapi_users
+from src.auth.cache import user_cache
 from src.auth.models import User, UserInfo
 from src.auth.schemas import UserRead, UserCreate
 from src.auth.user_routers import user_info_router
 from src.database import get_async_session
 from src.friends.friends_routers import friend_router
 from src.Chat.chat_routers import chat_router
-from fastapi.staticfiles import StaticFiles
+from src.Chat.manager import manager
+from src.Chat.writer import message_writer
+from src.Chat.recent import warm_recent
+from src.DB_config import MESSAGE_WRITE_BEHIND, QUERY_DEBUG
+from src.query_debug import query_debug_middleware
+from src.storage.storage_routers import storage_router
 from prometheus_client import start_http_server, Summary
+from src.metrics import HTTP_REQUEST_DURATION, DB_QUERIES_PER_REQUEST, DB_TIME_PER_REQUEST, QueryStats, \
+    current_query_stats, generate_metrics, route_template
 from starlette.responses import Response
 
 app = FastAPI(title="Massanger")
 current_user = fastapi_users.current_user()
-app.mount("/static", StaticFiles(directory="static"), name="static")
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend),
@@ -33,6 +43,25 @@ app.include_router(
 app.include_router(user_info_router, tags=["User_info"])
 app.include_router(friend_router, tags=["friends"])
 app.include_router(chat_router, tags=["chat"])
+app.include_router(storage_router, tags=["storage"])
+
+@app.on_event("startup")
+async def recover_chat_messages():
+    # Сообщения, разосланные до аварийной остановки, но не записанные отложенной записью
+    if MESSAGE_WRITE_BEHIND:
+        await message_writer.recover()
+
+@app.on_event("startup")
+async def warm_recent_messages():
+    # Заполнение кэша последних сообщений активных чатов в фоне, не задерживая запуск
+    asyncio.create_task(warm_recent())
+
+@app.on_event("shutdown")
+async def close_chat_manager():
+    # Дописываем буфер отложенной записи и закрываем подписки Redis pub/sub (рассылка чатов, кэш пользователей)
+    await message_writer.close()
+    await manager.close()
+    await user_cache.close()
 
 @app.get("/protected-route")
 async def protected_route(
@@ -65,17 +94,34 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS", "DELETE", "PATCH", "PUT","*"],
     allow_headers=["Content-Type", "Set-Cookie", "Access-Control-Allow-Headers", "Access-Control-Allow-Origin",
                    "Authorization","*"],
+    expose_headers=["X-Next-Cursor"],  # Курсор следующей страницы в /search_users
 )
 
 REQUEST_TIME = Summary('request_processing_seconds', 'Time spent processing request')
 
 @app.middleware("http")
 async def add_process_time_header(request, call_next):
-    with REQUEST_TIME.time():
-        response = await call_next(request)
-    return response
+    # Гистограммы по шаблону роута, методу и статусу; число и время SQL-запросов на запрос
+    query_stats = QueryStats()
+    current_query_stats.set(query_stats)
+    status_code = 500
+    started = time.perf_counter()
+    try:
+        with REQUEST_TIME.time():
+            response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = route_template(request.scope)
+        HTTP_REQUEST_DURATION.labels(route, request.method, status_code).observe(time.perf_counter() - started)
+        DB_QUERIES_PER_REQUEST.labels(route).observe(query_stats.count)
+        DB_TIME_PER_REQUEST.labels(route).observe(query_stats.duration)
+
+if QUERY_DEBUG:
+    # Поиск N+1 и проверка бюджетов запросов (только для разработки и тестов)
+    app.middleware("http")(query_debug_middleware)
 
 @app.get("/metrics")
 async def get_metrics():
-    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
+    from prometheus_client import CONTENT_TYPE_LATEST
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
\ No newline at end of file
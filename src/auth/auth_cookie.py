@@ -1,15 +1,22 @@
+from typing import Optional
+
+from fastapi import WebSocket
 from fastapi_users import FastAPIUsers
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from fastapi_users.authentication import CookieTransport, JWTStrategy, AuthenticationBackend
+from src.auth.cache import CachedJWTStrategy
 from src.DB_config import SECRET_KEY
-from src.auth.manager import get_user_manager
+from src.auth.manager import get_user_manager, UserManager
 from src.auth.models import User
+from src.database import async_session_maker
 
 cookie_transport = CookieTransport(cookie_name="Messager", cookie_max_age=3600)
 
 SECRET = SECRET_KEY
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    # Пользователь после проверки токена берётся из кэша (src/auth/cache.py)
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
 auth_backend = AuthenticationBackend(
     name="jwt",
@@ -21,3 +28,24 @@ fastapi_users = FastAPIUsers[User, int](
     get_user_manager,
     [auth_backend],
 )
+
+
+async def get_websocket_user(websocket: WebSocket) -> Optional[User]:
+    """
+    Аутентификация вебсокета по JWT из cookie "Messager".
+
+    Зависимости fastapi_users рассчитаны на HTTP-запросы, поэтому токен читается
+    из cookie рукопожатия вручную, а сессия БД открывается только на время проверки
+    (при попадании в кэш пользователей запросов к Postgres нет).
+    """
+    token = websocket.cookies.get(cookie_transport.cookie_name)
+    if token is None:
+        return None
+
+    async with async_session_maker() as session:
+        user_manager = UserManager(SQLAlchemyUserDatabase(session, User))
+        user = await get_jwt_strategy().read_token(token, user_manager)
+
+    if user is None or not user.is_active:
+        return None
+    return user
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+import jwt
+from fastapi_users import BaseUserManager, exceptions
+from fastapi_users.authentication import JWTStrategy
+from fastapi_users.jwt import decode_jwt
+from prometheus_client import Counter
+from sqlalchemy import DateTime, inspect
+
+from src.DB_config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_REDIS
+from src.auth.models import User
+from src.auth.utils import redis
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_REQUESTS = Counter(
+    "auth_user_cache_requests_total", "Обращения к кэшу аутентифицированных пользователей", ["result"]
+)
+
+# Колонки таблицы user, которые сохраняются в кэше; хэш пароля не кэшируется —
+# он нужен только смене пароля, и та читает его из Postgres
+USER_COLUMNS = {attr.key: attr.columns[0] for attr in inspect(User).column_attrs if attr.key != "hashed_password"}
+# Канал Redis pub/sub, по которому id инвалидированных пользователей приходят во все процессы
+INVALIDATION_CHANNEL = "auth_user_invalidate"
+
+
+def _dump_user(user: User) -> dict:
+    data = {}
+    for key, column in USER_COLUMNS.items():
+        value = getattr(user, key)
+        data[key] = value.isoformat() if isinstance(value, datetime) else value
+    return data
+
+
+class CachedUser:
+    """
+    Текущий пользователь из кэша: только чтение и без хэша пароля.
+
+    Это не объект ORM, поэтому его нельзя по ошибке добавить в сессию и записать в Postgres
+    с пустым hashed_password; роуты, которым нужны учётные данные, читают строку из базы.
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: dict):
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, name: str):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(f"{name!r} нет в кэшированном пользователе") from None
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError("Кэшированный пользователь доступен только для чтения")
+
+    def __repr__(self) -> str:
+        return f"CachedUser(id={self._values.get('id')!r})"
+
+
+def _load_user(data: dict) -> CachedUser:
+    values = dict(data)
+    for key, column in USER_COLUMNS.items():
+        if isinstance(column.type, DateTime) and values.get(key):
+            values[key] = datetime.fromisoformat(values[key])
+    # Каждому запросу — свой экземпляр
+    return CachedUser(values)
+
+
+class UserCache:
+    """
+    LRU-кэш пользователей с TTL внутри процесса и необязательным общим слоем в Redis.
+
+    Инвалидация удаляет запись из Redis и публикуется в INVALIDATION_CHANNEL (при любом
+    USER_CACHE_REDIS). Процесс хранит записи локально, только пока подписан на канал,
+    поэтому изменения из других воркеров и Celery не ждут истечения TTL.
+    """
+
+    REDIS_PREFIX = "auth_user:"
+
+    def __init__(self, max_size: int, ttl: int, use_redis: bool):
+        self._entries: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self._use_redis = use_redis
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = False
+
+    def _listening(self) -> bool:
+        # Слушатель канала запускается при первом обращении, в цикле событий воркера
+        if self._listener is None or self._listener.done():
+            self._subscribed = False
+            self._listener = asyncio.create_task(self._listen())
+        return self._subscribed
+
+    async def _listen(self):
+        while True:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                self._subscribed = True
+                async for item in pubsub.listen():
+                    if item["type"] == "message":
+                        self._entries.pop(int(item["data"]), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка чтения канала инвалидации кэша пользователей, повторное подключение")
+            finally:
+                # Инвалидации, пришедшие без подписки, потеряны — локальные записи им не доверяют
+                self._subscribed = False
+                self._entries.clear()
+                await pubsub.close()
+            await asyncio.sleep(1)
+
+    def _store_local(self, user_id: int, data: dict):
+        if not self._listening():
+            return
+        self._entries[user_id] = (time.monotonic() + self._ttl, data)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: int) -> Optional[CachedUser]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, data = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                USER_CACHE_REQUESTS.labels("local_hit").inc()
+                return _load_user(data)
+            del self._entries[user_id]
+
+        if self._use_redis:
+            cached = await redis.get(f"{self.REDIS_PREFIX}{user_id}")
+            if cached:
+                data = json.loads(cached)
+                self._store_local(user_id, data)
+                USER_CACHE_REQUESTS.labels("redis_hit").inc()
+                return _load_user(data)
+
+        USER_CACHE_REQUESTS.labels("miss").inc()
+        return None
+
+    async def set(self, user: User):
+        data = _dump_user(user)
+        self._store_local(user.id, data)
+        if self._use_redis:
+            await redis.set(f"{self.REDIS_PREFIX}{user.id}", json.dumps(data), ex=self._ttl)
+
+    async def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+        # Сначала Redis: процесс, получивший сообщение, не должен прочитать оттуда старую запись
+        if self._use_redis:
+            await redis.delete(f"{self.REDIS_PREFIX}{user_id}")
+        await redis.publish(INVALIDATION_CHANNEL, user_id)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_REDIS)
+
+
+class CachedJWTStrategy(JWTStrategy):
+    """
+    JWT-стратегия, которая после проверки токена берёт пользователя из кэша, а не из Postgres.
+
+    Пользователь всегда возвращается как CachedUser — и при попадании в кэш, и при промахе, —
+    чтобы роуты не зависели от того, откуда он взят.
+    """
+
+    async def read_token(self, token: Optional[str], user_manager: BaseUserManager) -> Optional[CachedUser]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            if data.get("sub") is None:
+                return None
+            user_id = user_manager.parse_id(data["sub"])
+        except (jwt.PyJWTError, exceptions.InvalidID):
+            return None
+
+        user = await user_cache.get(user_id)
+        if user is not None:
+            return user
+
+        user = await super().read_token(token, user_manager)
+        if user is None:
+            return None
+        await user_cache.set(user)
+        return _load_user(_dump_user(user))
@@ -4,6 +4,7 @@ from fastapi import Depends, Request
 from fastapi_users import BaseUserManager, IntegerIDMixin
 
 from src.DB_config import SECRET_KEY
+from src.auth.cache import user_cache
 from src.auth.models import User, UserInfo
 from src.auth.utils import get_user_db, save_verification_code, generate_verification_code
 from src.database import get_async_session
@@ -52,6 +53,15 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         send_reset_password_email.delay(user.email, reset_link)
         print(f"User {user.id} has forgot their password. Reset token: {token}")
 
+    async def on_after_reset_password(self, user: User, request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
+    async def on_after_update(self, user: User, update_dict: dict, request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
+    async def on_after_verify(self, user: User, request: Optional[Request] = None):
+        await user_cache.invalidate(user.id)
+
     async def on_after_request_verify(
         self, user: User, token: str, request: Optional[Request] = None
     ):
@@ -1,7 +1,8 @@
 from datetime import datetime
 
 from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Boolean, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from src.database import Base
 
@@ -9,13 +10,23 @@ from src.database import Base
 class UserInfo(Base):
     __tablename__ = 'user_info'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("user.id"))
+    user_id = Column(Integer, ForeignKey("user.id"), index=True)
     first_name = Column(String, nullable=True)
     sec_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
     pic_path = Column(String, nullable=True)
+    # Уменьшенные копии аватарки: {"small": {"webp": ..., "jpg": ...}, "medium": {...}}
+    pic_variants = Column(JSONB, nullable=True)
     user = relationship("User", back_populates="user_info")
 
+    __table_args__ = (
+        # Триграммные индексы для поиска по имени и фамилии
+        Index("ix_user_info_first_name_trgm", "first_name", postgresql_using="gin",
+              postgresql_ops={"first_name": "gin_trgm_ops"}),
+        Index("ix_user_info_last_name_trgm", "last_name", postgresql_using="gin",
+              postgresql_ops={"last_name": "gin_trgm_ops"}),
+    )
+
 
 class User(SQLAlchemyBaseUserTable[int], Base):
     __tablename__ = 'user'
@@ -27,4 +38,10 @@ class User(SQLAlchemyBaseUserTable[int], Base):
     is_active: bool = Column(Boolean, default=False, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
     is_verified: bool = Column(Boolean, default=False, nullable=False)
-    user_info = relationship("UserInfo", back_populates="user", uselist=False)
\ No newline at end of file
+    user_info = relationship("UserInfo", back_populates="user", uselist=False)
+
+    __table_args__ = (
+        # Триграммный индекс для поиска пользователей по подстроке username
+        Index("ix_user_username_trgm", "username", postgresql_using="gin",
+              postgresql_ops={"username": "gin_trgm_ops"}),
+    )
\ No newline at end of file
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 import jwt
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
@@ -9,14 +10,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.DB_config import SECRET_KEY
 from src.auth.auth_cookie import fastapi_users
+from src.auth.cache import user_cache
 from src.auth.manager import UserManager, get_user_manager
 from src.auth.models import User, UserInfo
 from src.auth.schemas import UserInfoCreate, TokenSchema, ChangePasswordRequest, ResetPasswordRequest, \
     ForgotPasswordRequest
-from src.auth.utils import verify_verification_code, generate_verification_code, get_user_db
+from src.auth.utils import verify_verification_code, generate_verification_code, get_user_db, redis
 from src.database import get_async_session
+from src.tasks import enqueue_image_variants
+from src.storage.store import blob_store, stage_upload_file, make_blob_ref, parse_blob_ref, BlobTooLarge
+from src.DB_config import AVATAR_MAX_SIZE, BLOB_GC_GRACE_SECONDS
 
-import os
 import logging
 
 user_db = get_user_db()
@@ -28,11 +32,39 @@ user_info_router = APIRouter()
 # Получение текущего пользователя
 current_user = fastapi_users.current_user()
 
-# Укажите путь к директории, где будут храниться загруженные изображения
-AVATARS_DIRECTORY = "static/avatars"
+# Аватарки, загруженные пользователем через /upload: ключ живёт, пока сборщик мусора не удалит блоб без ссылок
+AVATAR_UPLOAD_PREFIX = "avatar_upload:"
 
-# Создание директории, если её нет
-os.makedirs(AVATARS_DIRECTORY, exist_ok=True)
+
+def avatar_upload_key(user_id: int, sha256: str) -> str:
+    return f"{AVATAR_UPLOAD_PREFIX}{user_id}:{sha256}"
+
+
+async def check_avatar_ref(user_id: int, ref: Optional[str]):
+    # Ссылку на блоб можно поставить аватаркой, только если этот пользователь сам его загрузил:
+    # иначе любой мог бы закрепить (и не дать удалить) чужое вложение, зная его SHA-256
+    if not ref:
+        return
+    try:
+        sha256, _ = parse_blob_ref(ref)
+    except ValueError:
+        return  # Старые пути в static/ не ссылаются на блобы
+    if not await redis.exists(avatar_upload_key(user_id, sha256)):
+        raise HTTPException(status_code=403, detail="Аватарка должна быть загружена через /upload")
+
+
+async def swap_blob_reference(session: AsyncSession, old_ref: Optional[str], new_ref: Optional[str]):
+    # Счётчики ссылок меняются только для файлов из хранилища блобов; старые пути в static/ пропускаются
+    if old_ref == new_ref:
+        return
+    for ref, change in ((new_ref, blob_store.incref), (old_ref, blob_store.decref)):
+        if not ref:
+            continue
+        try:
+            sha256, _ = parse_blob_ref(ref)
+        except ValueError:
+            continue
+        await change(session, sha256)
 
 # Эндпоинт для получения информации о текущем пользователе
 @user_info_router.get("/user_info_show")
@@ -74,6 +106,7 @@ async def create_or_update_user_info(
     query = select(UserInfo).where(UserInfo.user_id == user.id)
     result = await session.execute(query)
     user_info_record = result.scalars().first()
+    pic_changed = False
 
     if user_info_record:
         # Если информация существует, обновляем только те поля, которые были переданы
@@ -83,10 +116,17 @@ async def create_or_update_user_info(
             user_info_record.sec_name = info.sec_name
         if info.last_name is not None:
             user_info_record.last_name = info.last_name
-        if info.pic_path is not None:
+        if info.pic_path is not None and info.pic_path != user_info_record.pic_path:
+            await check_avatar_ref(user.id, info.pic_path)
+            await swap_blob_reference(session, user_info_record.pic_path, info.pic_path)
+            # Копии старой аватарки больше не нужны, новые создаст Celery
+            await blob_store.release_variants(session, user_info_record.pic_variants)
             user_info_record.pic_path = info.pic_path
+            user_info_record.pic_variants = None
+            pic_changed = True
     else:
         # Если информации нет, создаем новую запись
+        await check_avatar_ref(user.id, info.pic_path)
         user_info_record = UserInfo(
             user_id=user.id,
             first_name=info.first_name,
@@ -95,28 +135,40 @@ async def create_or_update_user_info(
             pic_path=info.pic_path,
         )
         session.add(user_info_record)
+        await swap_blob_reference(session, None, info.pic_path)
+        pic_changed = info.pic_path is not None
 
     await session.commit()
     await session.refresh(user_info_record)
 
+    if pic_changed:
+        await enqueue_image_variants("avatar", user_info_record.id)
+
     return user_info_record
 
 
 @user_info_router.post("/upload")
-async def upload_avatar(file: UploadFile = File(...)):
+async def upload_avatar(
+        file: UploadFile = File(...),
+        session: AsyncSession = Depends(get_async_session),
+        user: User = Depends(current_user),
+):
     # Проверка расширения файла
     if not file.filename.endswith(('.png', '.jpg', '.jpeg', '.gif')):
         raise HTTPException(status_code=400, detail="Некорректный формат файла. Допустимы только PNG и JPG.")
 
-    # Определение пути сохранения
-    file_location = os.path.join(AVATARS_DIRECTORY, file.filename)
-
-    # Сохранение файла
-    with open(file_location, "wb") as file_object:
-        file_object.write(await file.read())
+    # Файл сохраняется в хранилище блобов без ссылок: ссылку добавит /user_info_add,
+    # а неиспользованная аватарка будет удалена сборщиком мусора
+    try:
+        tmp_path, sha256, size = await stage_upload_file(file, AVATAR_MAX_SIZE)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    await blob_store.save_file(session, tmp_path, sha256, size)
+    await session.commit()
+    await redis.set(avatar_upload_key(user.id, sha256), 1, ex=BLOB_GC_GRACE_SECONDS)
 
     # Возврат пути к загруженному файлу
-    return JSONResponse(content={"filename": file.filename, "url": f"/{file_location}"})
+    return JSONResponse(content={"filename": file.filename, "url": f"/{make_blob_ref(sha256, file.filename)}"})
 
 
 @user_info_router.post("/verify")
@@ -143,6 +195,7 @@ async def verify_user(data: TokenSchema, session: AsyncSession = Depends(get_asy
             if user:
                 user.is_active = True  # Активируем пользователя
                 await session.commit()  # Сохраняем изменения в базе данных
+                await user_cache.invalidate(user.id)  # Сбрасываем закэшированного неактивного пользователя
                 return {"success": True, "message": "Пользователь успешно активирован!"}
             else:
                 raise HTTPException(status_code=404, detail="Пользователь не найден.")
@@ -161,9 +214,12 @@ async def change_password(
         user: User = Depends(current_user),
         user_manager: UserManager = Depends(get_user_manager)
 ):
+    # Хэш пароля не хранится в кэше пользователей, поэтому строка читается из Postgres
+    db_user = await user_manager.get(user.id)
+
     # Проверяем старый пароль с помощью password_helper.verify_and_update
     valid_password, _ = user_manager.password_helper.verify_and_update(
-        change_password_data.old_password, user.hashed_password
+        change_password_data.old_password, db_user.hashed_password
     )
 
     if not valid_password:
@@ -171,11 +227,10 @@ async def change_password(
 
     # Хэшируем новый пароль с помощью password_helper.hash
     hashed_new_password = user_manager.password_helper.hash(change_password_data.new_password)
-    user.hashed_password = hashed_new_password
+    await user_manager.user_db.update(db_user, {"hashed_password": hashed_new_password})
 
-    async for session in get_async_session():
-        await session.merge(user)  # Объединяем изменения
-        await session.commit()
+    # Старый хэш пароля не должен оставаться в кэше пользователей
+    await user_cache.invalidate(user.id)
 
     return {"status": "Password changed successfully"}
 
@@ -1,11 +1,29 @@
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from src.DB_config import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME
+from src.DB_config import DB_USER, DB_PASS, DB_HOST, DB_PORT, DB_NAME, DB_POOL_SIZE, DB_MAX_OVERFLOW, \
+    DB_POOL_TIMEOUT, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_STATEMENT_CACHE_SIZE
 from sqlalchemy.orm import DeclarativeBase
+from src.metrics import instrument_engine
+from src.query_debug import install_query_log
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={
+        # Кэш asyncpg и кэш подготовленных выражений диалекта SQLAlchemy
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+)
+# Время и число SQL-запросов для /metrics
+instrument_engine(engine.sync_engine)
+install_query_log(engine.sync_engine)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
@@ -1,43 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, update, delete
+from sqlalchemy import or_, delete
 
 from src.auth.models import User, UserInfo
 from src.database import get_async_session
-from src.friends.models import Friends, FriendRequest
+from src.friends.models import FriendRequest, Friendship
 from src.friends.schemas import FriendRequestCreate, FriendRequestData
+from src.storage.store import small_variant
+from src.friends.utils import are_friends, add_friendship, remove_friendship, search_cache_key, \
+    get_cached_search, set_cached_search, build_user_search_query, SEARCH_MIN_LENGTH
 from src.auth.auth_cookie import fastapi_users
+from src.query_debug import query_budget
 
 current_user = fastapi_users.current_user()
 friend_router = APIRouter()
 
-# Роут поиска пользователей по username
+# Роут поиска пользователей по username (и, по желанию, по имени и фамилии)
 @friend_router.get("/search_users")
-async def search_users(username: str, session: AsyncSession = Depends(get_async_session)):
-    query = select(User).options(joinedload(User.user_info)).where(User.username.ilike(f"%{username}%"))
-    result = await session.execute(query)
-    users = result.scalars().all()
+@query_budget(2)
+async def search_users(
+    response: Response,
+    username: str = Query(..., min_length=SEARCH_MIN_LENGTH),
+    include_names: bool = False,
+    cursor: Optional[str] = None,  # "<score>_<id>" последнего результата предыдущей страницы
+    limit: int = Query(20, ge=1, le=50),
+    session: AsyncSession = Depends(get_async_session)
+):
+    cache_key = search_cache_key(username, include_names, limit, cursor)
+    page = await get_cached_search(cache_key)
+
+    if page is None:
+        after = None
+        if cursor:
+            try:
+                last_score, last_id = cursor.rsplit("_", 1)
+                after = (float(last_score), int(last_id))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        result = await session.execute(build_user_search_query(username, include_names, limit, after))
+        rows = result.all()
+
+        page = {
+            "users": [
+                {
+                    "id": user.id,
+                    "username": user.username,
+                    "first_name": user_info.first_name if user_info else None,
+                    "sec_name": user_info.sec_name if user_info else None,
+                    "last_name": user_info.last_name if user_info else None,
+                    "pic_path": small_variant(user_info.pic_path, user_info.pic_variants) if user_info else None
+                }
+                for user, user_info, _ in rows
+            ],
+            "next_cursor": f"{rows[-1].score!r}_{rows[-1].User.id}" if len(rows) == limit else None,
+        }
+        await set_cached_search(cache_key, page)
 
-    if not users:
+    if not page["users"]:
         raise HTTPException(status_code=404, detail="No users found")
 
-    return [
-        {
-            "id": user.id,
-            "username": user.username,
-            "first_name": user.user_info.first_name,
-            "sec_name": user.user_info.sec_name,
-            "last_name": user.user_info.last_name,
-            "pic_path": user.user_info.pic_path
-        }
-        for user in users
-    ]
+    # Тело ответа остаётся списком, курсор следующей страницы передаётся в заголовке
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["users"]
 
 # Роут отправки запроса в друзья
 
 @friend_router.post("/add_friend")
+@query_budget(5)
 async def add_friend(
     friend_request: FriendRequestCreate,
     session: AsyncSession = Depends(get_async_session),
@@ -69,11 +103,7 @@ async def add_friend(
         raise HTTPException(status_code=400, detail="Friend request already exists")
 
     # Проверка, являются ли уже друзьями
-    friends_query = select(Friends).where(Friends.owner_id == user.id)
-    friend_result = await session.execute(friends_query)
-    user_friends = friend_result.scalars().first()
-
-    if user_friends and friend_request.receiver_id in user_friends.friend_with:
+    if await are_friends(session, user.id, friend_request.receiver_id):
         raise HTTPException(status_code=400, detail="You are already friends")
 
     # Создание нового запроса в друзья
@@ -83,6 +113,7 @@ async def add_friend(
     return {"status": "Friend request sent"}
 
 @friend_router.post("/accept_friend_request")
+@query_budget(4)
 async def accept_friend_request(
     request_data: FriendRequestData,
     session: AsyncSession = Depends(get_async_session),
@@ -111,16 +142,8 @@ async def accept_friend_request(
         raise HTTPException(status_code=400, detail="You are not authorized to accept this friend request")
 
     if is_accepted:
-        # Добавление пользователей в списки друзей
-        update_sender_friends_query = update(Friends).where(Friends.owner_id == user.id).values(
-            friend_with=Friends.friend_with + [friend_request.sender_id]
-        )
-        update_receiver_friends_query = update(Friends).where(Friends.owner_id == friend_request.sender_id).values(
-            friend_with=Friends.friend_with + [user.id]
-        )
-
-        await session.execute(update_sender_friends_query)
-        await session.execute(update_receiver_friends_query)
+        # Добавление ребра дружбы в обе стороны
+        await add_friendship(session, user.id, friend_request.sender_id)
 
     # Удаление записи о запросе в друзья
     delete_query = delete(FriendRequest).where(FriendRequest.id == friend_request_id)
@@ -130,31 +153,25 @@ async def accept_friend_request(
     return {"status": "Friend request accepted" if is_accepted else "Friend request deleted"}
 
 @friend_router.get("/show_my_friends")
+@query_budget(2)
 async def show_my_friends(
+    after: Optional[int] = None,  # id последнего друга с предыдущей страницы
+    limit: int = Query(50, ge=1, le=100),
     user: User = Depends(current_user),  # Получаем авторизованного пользователя
     session: AsyncSession = Depends(get_async_session)
 ):
-    # Находим запись о друзьях по owner_id
-    query = select(Friends).where(Friends.owner_id == user.id)
-    result = await session.execute(query)
-    friends_record = result.scalar()
-
-    if not friends_record:
-        return []  # Если друзей нет, возвращаем пустой список
-
-    # Список ID друзей из friend_with
-    friend_ids = friends_record.friend_with  # Предполагается, что это JSONB-список ID
-
-    # Если список друзей пустой
-    if not friend_ids:
-        return []  # Пустой ответ, если у пользователя нет друзей
-
-    # Получаем информацию о друзьях по их ID
+    # Страница друзей по первичному ключу friendships (user_id, friend_id)
     friends_query = (
         select(User, UserInfo)
+        .join(Friendship, Friendship.friend_id == User.id)
         .join(UserInfo, User.id == UserInfo.user_id)  # Присоединяем таблицу user_info
-        .where(User.id.in_(friend_ids))  # Фильтруем по списку ID друзей
+        .where(Friendship.user_id == user.id)
+        .order_by(Friendship.friend_id)
+        .limit(limit)
     )
+    if after is not None:
+        friends_query = friends_query.where(Friendship.friend_id > after)
+
     friends_result = await session.execute(friends_query)
     friends_data = friends_result.all()
 
@@ -166,7 +183,7 @@ async def show_my_friends(
             "first_name": friend_info.first_name,
             "sec_name": friend_info.sec_name,
             "last_name": friend_info.last_name,
-            "pic_path": friend_info.pic_path
+            "pic_path": small_variant(friend_info.pic_path, friend_info.pic_variants)
         }
         for friend_user, friend_info in friends_data
     ]
@@ -174,6 +191,19 @@ async def show_my_friends(
     return friends_list
 
 
+@friend_router.delete("/remove_friend")
+async def remove_friend(
+    friend_id: int,
+    session: AsyncSession = Depends(get_async_session),
+    user: User = Depends(current_user)
+):
+    if not await remove_friendship(session, user.id, friend_id):
+        raise HTTPException(status_code=404, detail="Friend not found")
+
+    await session.commit()
+    return {"status": "Friend removed"}
+
+
 @friend_router.get("/my_friend_requests")
 async def my_friend_requests(
     user: User = Depends(current_user),  # Авторизованный пользователь
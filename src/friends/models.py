@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy import Column, Integer, ForeignKey, DateTime
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from src.database import Base
+from datetime import datetime
 
-# Friends table
+# Friends table (устаревший JSONB-список, источник правды — friendships)
 class Friends(Base):
     __tablename__ = "friends"
 
@@ -20,3 +21,10 @@ class FriendRequest(Base):
     receiver_id = Column(Integer, ForeignKey("user.id"), nullable=False)
     sender = relationship("User", foreign_keys=[sender_id])
     receiver = relationship("User", foreign_keys=[receiver_id])
+
+# Friendship table: ребро графа друзей, хранится в обе стороны (user_id -> friend_id и обратно)
+class Friendship(Base):
+    __tablename__ = "friendships"
+    user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    friend_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
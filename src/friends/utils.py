@@ -0,0 +1,106 @@
+import json
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, select, delete, or_, and_, func, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.models import User, UserInfo
+from src.auth.utils import redis
+from src.DB_config import SEARCH_CACHE_TTL
+from src.friends.models import Friendship
+
+
+async def are_friends(session: AsyncSession, user_id: int, friend_id: int) -> bool:
+    # Точечный запрос по первичному ключу friendships
+    result = await session.execute(
+        select(Friendship.user_id).where(
+            Friendship.user_id == user_id,
+            Friendship.friend_id == friend_id
+        )
+    )
+    return result.first() is not None
+
+
+async def add_friendship(session: AsyncSession, user_id: int, friend_id: int):
+    # Оба ребра одним запросом; ON CONFLICT делает повторное и одновременное принятие безопасным
+    await session.execute(
+        insert(Friendship)
+        .values([
+            {"user_id": user_id, "friend_id": friend_id},
+            {"user_id": friend_id, "friend_id": user_id},
+        ])
+        .on_conflict_do_nothing()
+    )
+
+
+async def remove_friendship(session: AsyncSession, user_id: int, friend_id: int) -> bool:
+    result = await session.execute(
+        delete(Friendship).where(
+            or_(
+                and_(Friendship.user_id == user_id, Friendship.friend_id == friend_id),
+                and_(Friendship.user_id == friend_id, Friendship.friend_id == user_id)
+            )
+        )
+    )
+    return result.rowcount > 0
+
+
+# Индекс pg_trgm ищет подстроки от трёх символов; более короткий запрос — полный просмотр таблицы
+# и сортировка всех совпадений по similarity()
+SEARCH_MIN_LENGTH = 3
+
+
+def build_user_search_query(username: str, include_names: bool, limit: int,
+                            after: Optional[Tuple[float, int]] = None) -> Select:
+    """
+    Запрос /search_users: (User, UserInfo, score) по убыванию сходства, затем по id.
+
+    after — (score, id) последнего результата предыдущей страницы (keyset).
+    """
+    # Экранируем спецсимволы LIKE, поиск по подстроке обслуживается GIN-индексами pg_trgm
+    pattern = "%" + username.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    matches = select(User.id.label("user_id")).where(User.username.ilike(pattern, escape="\\"))
+    score = func.similarity(User.username, username)
+    if include_names:
+        # OR через внешнее соединение user ⟕ user_info индексы не использует: совпадения ищутся
+        # в каждой таблице своим индексом и объединяются, сходство считается только для них
+        matches = union(matches, select(UserInfo.user_id.label("user_id")).where(or_(
+            UserInfo.first_name.ilike(pattern, escape="\\"),
+            UserInfo.last_name.ilike(pattern, escape="\\"),
+        )))
+        score = func.greatest(
+            score,
+            func.similarity(func.coalesce(UserInfo.first_name, ""), username),
+            func.similarity(func.coalesce(UserInfo.last_name, ""), username),
+        )
+    matches = matches.subquery("matches")
+    score = score.label("score")
+
+    query = (
+        select(User, UserInfo, score)
+        .select_from(matches)
+        .join(User, User.id == matches.c.user_id)
+        .outerjoin(UserInfo, User.id == UserInfo.user_id)
+        .order_by(score.desc(), User.id)
+        .limit(limit)
+    )
+    if after is not None:
+        last_score, last_id = after
+        # Keyset по (score desc, id asc)
+        query = query.where(or_(score < last_score, and_(score == last_score, User.id > last_id)))
+    return query
+
+
+def search_cache_key(query: str, include_names: bool, limit: int, cursor: Optional[str]) -> str:
+    return f"search_users:{int(include_names)}:{limit}:{cursor or ''}:{query.lower()}"
+
+
+async def get_cached_search(key: str) -> Optional[dict]:
+    cached = await redis.get(key)
+    return json.loads(cached) if cached else None
+
+
+async def set_cached_search(key: str, page: dict):
+    # Короткий TTL: популярные префиксы не бьют в базу, а новые пользователи появляются быстро
+    await redis.set(key, json.dumps(page), ex=SEARCH_CACHE_TTL)
@@ -0,0 +1,103 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Под gunicorn каждый воркер пишет метрики в файлы каталога PROMETHEUS_MULTIPROC_DIR,
+# а /metrics собирает их через MultiProcessCollector (очистка каталога — в gunicorn.conf.py)
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ["route", "method", "status"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Время выполнения SQL-запроса", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Число SQL-запросов на HTTP-запрос", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Суммарное время SQL-запросов на HTTP-запрос", ["route"]
+)
+
+WS_OPEN_SOCKETS = Gauge(
+    "ws_open_sockets", "Открытые вебсокеты", ["endpoint"], multiprocess_mode="livesum"
+)
+WS_MESSAGES_IN = Counter("ws_messages_in_total", "Кадры, полученные от клиентов", ["endpoint"])
+WS_MESSAGES_OUT = Counter("ws_messages_out_total", "Кадры, отправленные клиентам")
+WS_BROADCAST_LATENCY = Histogram(
+    "ws_broadcast_latency_seconds", "Время от постановки сообщения чата в очередь сокета до отправки",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Время выполнения задачи Celery", ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# Счётчик запросов текущего HTTP-запроса; SQLAlchemy переносит контекст в свои гринлеты
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+def metrics_registry() -> Optional[CollectorRegistry]:
+    if not MULTIPROCESS:
+        return None
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def generate_metrics() -> bytes:
+    registry = metrics_registry()
+    return generate_latest(registry) if registry is not None else generate_latest()
+
+
+def route_template(scope: dict) -> str:
+    # Шаблон пути ("/chats/{chat_id}/messages"), а не сам путь — иначе метки разрастаются
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = statement.lstrip()[:6].upper()
+    if operation not in SQL_OPERATIONS:
+        operation = "OTHER"
+    DB_QUERY_DURATION.labels(operation).observe(duration)
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+
+
+def _handle_error(exception_context):
+    # Запрос с ошибкой не доходит до after_cursor_execute — снимаем его время со стека
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def instrument_engine(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,103 @@
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+
+from src.DB_config import QUERY_BUDGET_STRICT, QUERY_REPEAT_THRESHOLD
+from src.metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+# Параметры asyncpg ($1, $2, ...) и их списки в IN (...) не меняют «форму» запроса.
+# Диалект asyncpg добавляет к параметрам приведение типа: $1::INTEGER, $2::TIMESTAMP WITHOUT TIME ZONE
+_PARAM_RE = re.compile(r"\$\d+(?:::\w+(?:\s+WITH(?:OUT)?\s+TIME\s+ZONE)?(?:\[\])?)?")
+_PARAM_LIST_RE = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit: int) -> Callable:
+    """Объявляет, сколько SQL-запросов может выполнить роут; проверяется в режиме QUERY_DEBUG."""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__query_budget__ = limit
+        return endpoint
+    return decorator
+
+
+def statement_shape(statement: str) -> str:
+    shape = _PARAM_RE.sub("?", " ".join(statement.split()))
+    return _PARAM_LIST_RE.sub("?, ...", shape)
+
+
+# Управление транзакцией не считается запросом: BEGIN и COMMIT asyncpg выполняет мимо курсора,
+# а точки сохранения (в том числе от транзакции теста) — через курсор
+_TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+class QueryLog:
+    def __init__(self, parent: Optional["QueryLog"] = None):
+        self.statements: List[str] = []
+        # Внешний блок count_queries (например, тест вокруг запроса к приложению с QUERY_DEBUG)
+        self.parent = parent
+
+    @property
+    def count(self) -> int:
+        return sum(1 for statement in self.statements if not statement.startswith(_TRANSACTION_CONTROL))
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[tuple]:
+        # Одинаковые по форме запросы, выполненные threshold и более раз, — признак N+1
+        shapes = Counter(statement_shape(statement) for statement in self.statements)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+
+current_query_log: ContextVar[Optional[QueryLog]] = ContextVar("current_query_log", default=None)
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    log = current_query_log.get()
+    while log is not None:
+        log.statements.append(statement)
+        log = log.parent
+
+
+def install_query_log(engine: Engine):
+    event.listen(engine, "after_cursor_execute", _record_statement)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """Записывает SQL-запросы, выполненные внутри блока (в том числе из тестов и скриптов); блоки вкладываются."""
+    log = QueryLog(parent=current_query_log.get())
+    token = current_query_log.set(log)
+    try:
+        yield log
+    finally:
+        current_query_log.reset(token)
+
+
+async def query_debug_middleware(request: Request, call_next):
+    # Подключается в app.py только при QUERY_DEBUG=true
+    with count_queries() as log:
+        response = await call_next(request)
+
+    route = route_template(request.scope)
+    response.headers["X-Query-Count"] = str(log.count)
+    for shape, count in log.repeated():
+        logger.warning(f"Возможный N+1 в {request.method} {route}: {count} раз {shape}")
+
+    endpoint = getattr(request.scope.get("route"), "endpoint", None)
+    budget = getattr(endpoint, "__query_budget__", None)
+    if budget is not None and log.count > budget:
+        message = f"{request.method} {route}: {log.count} SQL-запросов при бюджете {budget}"
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
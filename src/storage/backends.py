@@ -0,0 +1,140 @@
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from src.storage.serving import INLINE_CONTENT_TYPES
+from src.DB_config import BLOB_BACKEND, BLOB_LOCAL_DIRECTORY, S3_ENDPOINT_URL, S3_BUCKET, S3_ACCESS_KEY, \
+    S3_SECRET_KEY, S3_REGION
+
+
+class BlobBackend:
+    """Интерфейс хранилища содержимого блобов; ключ — SHA-256 в hex."""
+
+    async def put_file(self, key: str, source_path: str, content_type: str):
+        # Переносит подготовленный файл в хранилище; source_path после вызова не нужен
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def list_keys(self) -> AsyncIterator[List[Tuple[str, datetime]]]:
+        # Все объекты хранилища пачками: (ключ, время записи в UTC) — для поиска объектов без строки в blobs
+        raise NotImplementedError
+
+    async def download(self, key: str, dest_path: str):
+        # Копия содержимого на локальный диск (для обработки изображений в Celery)
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        # Путь на диске, если бэкенд локальный (файл отдаётся приложением или прокси)
+        return None
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+
+class LocalBlobBackend(BlobBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        # Двухуровневое разбиение, чтобы в одном каталоге не было миллионов файлов
+        return os.path.join(self.root, key[:2], key)
+
+    def _put(self, key: str, source_path: str):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source_path, path)
+
+    async def put_file(self, key: str, source_path: str, content_type: str):
+        # Тип хранится в blobs.content_type, файл на диске его не содержит
+        await run_in_threadpool(self._put, key, source_path)
+
+    def _delete(self, key: str):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._delete, key)
+
+    def _list_directory(self, directory: str) -> List[Tuple[str, datetime]]:
+        with os.scandir(directory) as entries:
+            return [(entry.name, datetime.utcfromtimestamp(entry.stat().st_mtime))
+                    for entry in entries if entry.is_file()]
+
+    async def list_keys(self) -> AsyncIterator[List[Tuple[str, datetime]]]:
+        # Пачка — один каталог первого уровня (не больше 1/256 всех блобов)
+        for directory in sorted(await run_in_threadpool(os.listdir, self.root)):
+            path = os.path.join(self.root, directory)
+            if os.path.isdir(path):
+                yield await run_in_threadpool(self._list_directory, path)
+
+    async def download(self, key: str, dest_path: str):
+        await run_in_threadpool(shutil.copyfile, self.local_path(key), dest_path)
+
+
+class S3BlobBackend(BlobBackend):
+    """S3-совместимое хранилище (AWS S3, MinIO); boto3 нужен только при выборе этого бэкенда."""
+
+    def __init__(self, endpoint_url: Optional[str], bucket: str, access_key: Optional[str],
+                 secret_key: Optional[str], region: str):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("Для BLOB_BACKEND=s3 необходимо установить boto3")
+        if not bucket:
+            raise RuntimeError("Для BLOB_BACKEND=s3 необходимо задать S3_BUCKET")
+        self.bucket = bucket
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+        )
+
+    def _put(self, key: str, source_path: str, content_type: str):
+        # Заголовки, с которыми S3 отдаёт объект по подписанной ссылке
+        extra_args = {"ContentType": content_type}
+        if content_type not in INLINE_CONTENT_TYPES:
+            extra_args["ContentDisposition"] = "attachment"
+        self._client.upload_file(source_path, self.bucket, key, ExtraArgs=extra_args)
+        os.remove(source_path)
+
+    async def put_file(self, key: str, source_path: str, content_type: str):
+        await run_in_threadpool(self._put, key, source_path, content_type)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._client.delete_object, Bucket=self.bucket, Key=key)
+
+    async def list_keys(self) -> AsyncIterator[List[Tuple[str, datetime]]]:
+        # Страницы ListObjectsV2 по 1000 ключей
+        params = {"Bucket": self.bucket}
+        while True:
+            page = await run_in_threadpool(lambda: self._client.list_objects_v2(**params))
+            yield [(item["Key"], item["LastModified"].astimezone(timezone.utc).replace(tzinfo=None))
+                   for item in page.get("Contents", [])]
+            if not page.get("IsTruncated"):
+                return
+            params["ContinuationToken"] = page["NextContinuationToken"]
+
+    async def download(self, key: str, dest_path: str):
+        await run_in_threadpool(self._client.download_file, self.bucket, key, dest_path)
+
+    def url(self, key: str) -> str:
+        return self._client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=3600
+        )
+
+
+def create_blob_backend(name: str = BLOB_BACKEND) -> BlobBackend:
+    if name == "local":
+        return LocalBlobBackend(BLOB_LOCAL_DIRECTORY)
+    if name == "s3":
+        return S3BlobBackend(S3_ENDPOINT_URL, S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION)
+    raise ValueError(f"Неизвестный бэкенд хранилища: {name}")
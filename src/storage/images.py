@@ -0,0 +1,79 @@
+import hashlib
+import os
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from src.storage.store import make_staging_path, remove_staged_file
+
+# Максимальная сторона варианта в пикселях
+AVATAR_VARIANTS = {"small": 128, "medium": 512}
+PICTURE_VARIANTS = {"small": 320, "medium": 1280}
+# Формат Pillow -> расширение файла; WebP для браузеров, JPEG как запасной вариант
+VARIANT_FORMATS = {"WEBP": "webp", "JPEG": "jpg"}
+VARIANT_QUALITY = 80
+
+# {"small": {"webp": (временный путь, sha256, размер, имя файла), ...}, ...}
+RenderedVariants = Dict[str, Dict[str, Tuple[str, str, int, str]]]
+
+
+def _file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _prepare(image: Image.Image, image_format: str) -> Image.Image:
+    if image_format == "JPEG":
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            # JPEG не поддерживает прозрачность — подкладываем белый фон
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            return background
+        return image.convert("RGB")
+    if image.mode not in ("RGB", "RGBA"):
+        return image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    return image
+
+
+def render_variants(source_path: str, filename: str, sizes: Dict[str, int]) -> RenderedVariants:
+    """
+    Уменьшенные копии изображения без метаданных (EXIF, ICC, комментарии).
+    Для файлов, которые не являются изображениями, возвращает пустой словарь.
+    """
+    try:
+        with Image.open(source_path) as opened:
+            # Для анимаций берётся первый кадр; поворот из EXIF применяется до удаления метаданных
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return {}
+
+    stem = os.path.splitext(os.path.basename(filename))[0] or "image"
+    rendered: RenderedVariants = {}
+    try:
+        for name, max_side in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((max_side, max_side), Image.LANCZOS)
+            for image_format, extension in VARIANT_FORMATS.items():
+                prepared = _prepare(variant, image_format)
+                prepared.info = {}  # Без info Pillow не переносит EXIF и ICC в новый файл
+                path = make_staging_path()
+                prepared.save(path, format=image_format, quality=VARIANT_QUALITY)
+                rendered.setdefault(name, {})[extension] = (
+                    path, _file_sha256(path), os.path.getsize(path), f"{stem}_{name}.{extension}"
+                )
+    except Exception:
+        discard_variants(rendered)
+        raise
+    return rendered
+
+
+def discard_variants(rendered: RenderedVariants):
+    for formats in rendered.values():
+        for path, _, _, _ in formats.values():
+            remove_staged_file(path)
+
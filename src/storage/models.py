@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Index, text
+from src.database import Base
+from datetime import datetime
+
+# Blob table: содержимое вложения, адресуемое по SHA-256, со счётчиком ссылок
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    # Тип, определённый по содержимому при загрузке (src/storage/store.py), а не по имени файла от клиента
+    content_type = Column(String(100), nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Сборщик мусора просматривает только блобы без ссылок
+        Index("ix_blobs_orphans", "last_used_at", postgresql_where=text("ref_count = 0")),
+    )
@@ -0,0 +1,160 @@
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from src.DB_config import STATIC_ACCEL_REDIRECT_PREFIX, STATIC_MAX_AGE
+
+# Имена с адресацией по содержимому (блобы, файлы с uuid) никогда не меняют содержимое
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+READ_CHUNK_SIZE = 64 * 1024
+# Загрузки пользователей показываются в браузере, только если это растровые изображения;
+# остальное (HTML, SVG, скрипты) скачивается как вложение и не исполняется в origin приложения
+INLINE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    # Для файлов, которые могут быть перезаписаны: меняется вместе с размером и временем изменения
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def content_headers(media_type: str, filename: str) -> dict:
+    headers = {"x-content-type-options": "nosniff"}
+    if media_type not in INLINE_CONTENT_TYPES:
+        headers["content-disposition"] = f"attachment; filename*=UTF-8''{quote(filename or 'file')}"
+    return headers
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон "bytes=start-end" -> (start, end) включительно.
+    None — заголовок не поддерживается (несколько диапазонов), и отдаётся весь файл;
+    ValueError — диапазон за пределами файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        start = int(start) if start else None
+        end = int(end) if end else None
+    except ValueError:
+        return None
+    if start is None:  # Последние N байт
+        if not end or size == 0:
+            raise ValueError("Range Not Satisfiable")
+        return max(size - end, 0), size - 1
+    if end is None:
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError("Range Not Satisfiable")
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """
+    Отдача файла с диапазонами. Если сервер поддерживает расширения ASGI zerocopysend/pathsend,
+    байты копирует сам сервер (sendfile), иначе файл читается кусками в пуле потоков.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.full = status_code == 200
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        extensions = scope.get("extensions") or {}
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if self.full and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": file.wrapped,
+                            "offset": self.start, "count": self.count})
+                return
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:  # Файл укоротился во время отдачи
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def serve_file(request: Request, path: str, etag: Optional[str], media_type: str, immutable: bool,
+                     extra_headers: Optional[dict] = None) -> Response:
+    """
+    Ответ на GET/HEAD для загруженного файла: ETag, Last-Modified, условные запросы (304),
+    Range (206/416) и, если задан STATIC_ACCEL_REDIRECT_PREFIX, передача отдачи фронт-прокси.
+    etag=None — ETag по размеру и времени изменения файла (file_etag).
+    Вызывающий код гарантирует, что path находится внутри каталога с загрузками.
+    """
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        return Response(status_code=404)
+    if not stat.S_ISREG(stat_result.st_mode):
+        return Response(status_code=404)
+    if etag is None:
+        etag = file_etag(stat_result)
+
+    headers = {
+        **(extra_headers or {}),
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else f"public, max-age={STATIC_MAX_AGE}",
+        "accept-ranges": "bytes",
+    }
+
+    # Условные запросы: If-None-Match важнее If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags or f"W/{etag}" in tags:
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and int(stat_result.st_mtime) <= since:
+            return Response(status_code=304, headers=headers)
+
+    if STATIC_ACCEL_REDIRECT_PREFIX:
+        # Байты, диапазоны и sendfile обслуживает nginx (location с internal и alias на корень приложения)
+        headers["x-accel-redirect"] = STATIC_ACCEL_REDIRECT_PREFIX + os.path.relpath(path).replace(os.sep, "/")
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    size = stat_result.st_size
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: диапазон отдаётся, только если у клиента та же версия файла
+    if range_header and (if_range is None or if_range == etag or if_range == headers["last-modified"]):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    headers["content-length"] = str(end - start + 1)
+    headers["content-type"] = media_type
+    return RangeFileResponse(path, start, end, status_code, headers)
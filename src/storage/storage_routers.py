@@ -0,0 +1,54 @@
+import mimetypes
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_session
+from src.storage.serving import serve_file, content_headers
+from src.storage.store import blob_store, parse_blob_ref, BLOB_NAME_SEPARATOR
+
+storage_router = APIRouter()
+
+STATIC_DIRECTORY = os.path.realpath("static")
+
+
+def _media_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+@storage_router.api_route("/blobs/{ref:path}", methods=["GET", "HEAD"])
+async def get_blob(ref: str, request: Request, session: AsyncSession = Depends(get_async_session)):
+    # ref совпадает со ссылкой из Message.text / UserInfo.pic_path: "<sha256>__$__<имя файла>"
+    try:
+        sha256, filename = parse_blob_ref(ref)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="File not found")
+    # Тип — из метаданных блоба (кэшируется процессом), имя файла в ссылке выбирает клиент
+    content_type = await blob_store.content_type(session, sha256)
+    if content_type is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    path = blob_store.backend.local_path(sha256)
+    if path is None:
+        # Внешнее хранилище отдаёт файл само по подписанной ссылке
+        return RedirectResponse(blob_store.backend.url(sha256))
+    # Содержимое блоба определяется его хэшем, поэтому ETag сильный и кэш бессрочный
+    return await serve_file(request, path, f'"{sha256}"', content_type, immutable=True,
+                            extra_headers=content_headers(content_type, filename))
+
+
+@storage_router.api_route("/static/{file_path:path}", methods=["GET", "HEAD"])
+async def get_static(file_path: str, request: Request):
+    # Старые загрузки (static/avatars, static/chat_pic) и статика приложения
+    path = os.path.realpath(os.path.join(STATIC_DIRECTORY, file_path))
+    if not path.startswith(STATIC_DIRECTORY + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
+    # Файлы чатов с uuid в имени (<uuid>__$__<имя>) не перезаписываются, аватарки — могут.
+    # Отсутствующий файл даёт 404 в serve_file, os.stat выполняется там же в пуле потоков
+    filename = os.path.basename(path)
+    immutable = BLOB_NAME_SEPARATOR in filename
+    media_type = _media_type(path)
+    return await serve_file(request, path, None, media_type, immutable=immutable,
+                            extra_headers=content_headers(media_type, filename.split(BLOB_NAME_SEPARATOR)[-1]))
@@ -0,0 +1,233 @@
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.DB_config import BLOB_TMP_DIRECTORY
+from src.storage.backends import BlobBackend, create_blob_backend
+from src.storage.models import Blob
+
+os.makedirs(BLOB_TMP_DIRECTORY, exist_ok=True)
+
+# Ссылка на блоб в Message.text и UserInfo.pic_path: "blobs/<sha256>__$__<имя файла>"
+BLOB_REF_PREFIX = "blobs/"
+BLOB_NAME_SEPARATOR = "__$__"
+STAGE_CHUNK_SIZE = 1024 * 1024
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# Сигнатуры форматов, которые отдаются как изображения; всё остальное — application/octet-stream
+CONTENT_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+# Типы блобов, запомненные процессом: содержимое блоба неизменно, поэтому без TTL
+CONTENT_TYPE_CACHE_SIZE = 10000
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+def safe_filename(filename: str) -> str:
+    # basename отсекает попытки передать путь вместо имени файла
+    return os.path.basename(filename or "") or "file"
+
+
+def make_staging_path() -> str:
+    return os.path.join(BLOB_TMP_DIRECTORY, str(uuid.uuid4()) + ".part")
+
+
+def make_blob_ref(sha256: str, filename: str) -> str:
+    return BLOB_REF_PREFIX + sha256 + BLOB_NAME_SEPARATOR + safe_filename(filename)
+
+
+def parse_blob_ref(ref: str) -> Tuple[str, str]:
+    """Возвращает (sha256, имя файла); ValueError, если это не ссылка на блоб (например, старый путь в static/)."""
+    ref = (ref or "").lstrip("/")
+    if ref.startswith(BLOB_REF_PREFIX):
+        ref = ref[len(BLOB_REF_PREFIX):]
+    sha256, _, filename = ref.partition(BLOB_NAME_SEPARATOR)
+    if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+        raise ValueError("Некорректная ссылка на файл")
+    return sha256, filename
+
+
+def small_variant(original: Optional[str], variants: Optional[dict]) -> Optional[str]:
+    # Списки (друзья, поиск, чаты) показывают маленькую WebP-копию, пока её нет — оригинал
+    if variants:
+        return variants.get("small", {}).get("webp") or original
+    return original
+
+
+def sniff_content_type(head: bytes) -> str:
+    for signature, content_type in CONTENT_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return DEFAULT_CONTENT_TYPE
+
+
+def detect_content_type(path: str) -> str:
+    with open(path, "rb") as file:
+        return sniff_content_type(file.read(16))
+
+
+def remove_staged_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def stage_upload_file(file: UploadFile, max_size: int) -> Tuple[str, str, int]:
+    """Потоково копирует загруженный файл во временный каталог; возвращает (путь, sha256, размер)."""
+    path = make_staging_path()
+    sha = hashlib.sha256()
+    size = 0
+    target = await run_in_threadpool(open, path, "wb")
+    try:
+        while True:
+            chunk = await file.read(STAGE_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise BlobTooLarge(f"Файл больше {max_size} байт")
+            sha.update(chunk)
+            await run_in_threadpool(target.write, chunk)
+    except BaseException:
+        await run_in_threadpool(target.close)
+        await run_in_threadpool(remove_staged_file, path)
+        raise
+    await run_in_threadpool(target.close)
+    return path, sha.hexdigest(), size
+
+
+class BlobStore:
+    """
+    Хранилище вложений с дедупликацией по SHA-256.
+
+    Строка в blobs создаётся или блокируется до записи содержимого в бэкенд, а сборщик мусора
+    удаляет содержимое до фиксации удаления строк, поэтому параллельная загрузка того же файла
+    либо ждёт сборщика и записывает файл заново, либо пропускается им (SKIP LOCKED).
+    """
+
+    def __init__(self, backend: BlobBackend):
+        self.backend = backend
+        self._content_types: "OrderedDict[str, str]" = OrderedDict()
+
+    async def save_file(self, session: AsyncSession, tmp_path: str, sha256: str, size: int,
+                        refs: int = 0, content_type: Optional[str] = None) -> bool:
+        # Транзакцию фиксирует вызывающий код вместе с записью, ссылающейся на блоб.
+        # content_type передаётся, если вызывающий код уже определил тип файла.
+        # Возвращает True, если содержимое было записано впервые
+        now = datetime.utcnow()
+        try:
+            if content_type is None:
+                content_type = await run_in_threadpool(detect_content_type, tmp_path)
+            stmt = insert(Blob).values(sha256=sha256, size=size, content_type=content_type, ref_count=refs,
+                                       created_at=now, last_used_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Blob.sha256],
+                set_={"ref_count": Blob.ref_count + refs, "last_used_at": now,
+                      "content_type": func.coalesce(Blob.content_type, stmt.excluded.content_type)},
+            ).returning(literal_column("xmax = 0"))  # xmax = 0 только у только что вставленной строки
+            created = (await session.execute(stmt)).scalar()
+            if created:
+                await self.backend.put_file(sha256, tmp_path, content_type)
+            return bool(created)
+        finally:
+            # Дубликат (или неудавшаяся запись) не нужен — содержимое уже в хранилище
+            await run_in_threadpool(remove_staged_file, tmp_path)
+
+    async def content_type(self, session: AsyncSession, sha256: str) -> Optional[str]:
+        """Тип содержимого блоба из его метаданных; None — блоба нет."""
+        content_type = self._content_types.get(sha256)
+        if content_type is not None:
+            self._content_types.move_to_end(sha256)
+            return content_type
+        row = (await session.execute(select(Blob.content_type).where(Blob.sha256 == sha256))).first()
+        if row is None:
+            return None
+        content_type = row.content_type
+        if content_type is None:
+            # Блоб загружен до появления столбца content_type — определяем тип по содержимому
+            path = self.backend.local_path(sha256)
+            try:
+                content_type = await run_in_threadpool(detect_content_type, path) if path else DEFAULT_CONTENT_TYPE
+            except OSError:
+                return None
+        self._content_types[sha256] = content_type
+        while len(self._content_types) > CONTENT_TYPE_CACHE_SIZE:
+            self._content_types.popitem(last=False)
+        return content_type
+
+    async def incref(self, session: AsyncSession, sha256: str):
+        await session.execute(
+            update(Blob).where(Blob.sha256 == sha256)
+            .values(ref_count=Blob.ref_count + 1, last_used_at=datetime.utcnow())
+        )
+
+    async def decref(self, session: AsyncSession, sha256: str):
+        # last_used_at отсчитывает период ожидания перед удалением осиротевшего блоба
+        await session.execute(
+            update(Blob).where(Blob.sha256 == sha256, Blob.ref_count > 0)
+            .values(ref_count=Blob.ref_count - 1, last_used_at=datetime.utcnow())
+        )
+
+    async def release_variants(self, session: AsyncSession, variants: Optional[dict]):
+        # variants: {"small": {"webp": ссылка, "jpg": ссылка}, ...}
+        for formats in (variants or {}).values():
+            for ref in formats.values():
+                await self.decref(session, parse_blob_ref(ref)[0])
+
+    async def collect_garbage(self, session: AsyncSession, grace: timedelta, batch_size: int = 500) -> int:
+        """Удаляет блобы без ссылок, не использовавшиеся дольше grace; возвращает число удалённых."""
+        result = await session.execute(
+            select(Blob.sha256)
+            .where(Blob.ref_count == 0, Blob.last_used_at < datetime.utcnow() - grace)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        keys: List[str] = list(result.scalars().all())
+        if not keys:
+            return 0
+        await session.execute(delete(Blob).where(Blob.sha256.in_(keys)))
+        # Содержимое удаляется, пока строки ещё заблокированы этой транзакцией
+        for key in keys:
+            await self.backend.delete(key)
+        await session.commit()
+        return len(keys)
+
+    async def collect_orphan_objects(self, session: AsyncSession, grace: timedelta) -> int:
+        """
+        Удаляет из хранилища объекты, для которых нет строки в blobs и которые записаны раньше grace.
+
+        save_file кладёт содержимое до COMMIT транзакции вызывающего кода; если она откатилась,
+        объект остаётся без строки. Объекты моложе grace не трогаются — их транзакция ещё может идти.
+        """
+        deadline = datetime.utcnow() - grace
+        deleted = 0
+        async for objects in self.backend.list_keys():
+            candidates = [key for key, written_at in objects if written_at < deadline]
+            if not candidates:
+                continue
+            known = set((await session.execute(
+                select(Blob.sha256).where(Blob.sha256.in_(candidates))
+            )).scalars().all())
+            for key in candidates:
+                if key not in known:
+                    await self.backend.delete(key)
+                    deleted += 1
+        return deleted
+
+
+blob_store = BlobStore(create_blob_backend())
@@ -1,17 +1,30 @@
 import asyncio
+import time
 from datetime import datetime, timedelta
 
 import jwt
 from celery import Celery, shared_task
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
 from asgiref.sync import async_to_sync
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import select, delete
 from celery.schedules import crontab
+from celery.signals import task_prerun, task_postrun, worker_init
+from prometheus_client import start_http_server
 
+from src.auth.cache import user_cache
 from src.auth.models import User, UserInfo
+from src.Chat.models import Message
+from src.Chat.unread import flush_unread_counts
+from src.Chat.partitions import ensure_partitions, archive_partitions
+from src.Chat.recent import invalidate_recent
 from src.database import get_async_session
-from src.friends.models import Friends
-from src.DB_config import SECRET_KEY, MAIL_USERNAME, MAIL_PASSWORD, REDIS_PORT, REDIS_HOST
+from src.storage.images import AVATAR_VARIANTS, PICTURE_VARIANTS, render_variants, discard_variants
+from src.storage.store import blob_store, parse_blob_ref, make_blob_ref, make_staging_path, remove_staged_file
+from src.friends.models import Friends, Friendship
+from src.DB_config import SECRET_KEY, MAIL_USERNAME, MAIL_PASSWORD, REDIS_PORT, REDIS_HOST, BLOB_GC_GRACE_SECONDS, \
+    CELERY_METRICS_PORT, UNREAD_FLUSH_INTERVAL, MESSAGE_ARCHIVE
+from src.metrics import CELERY_TASK_DURATION, metrics_registry
 
 celery_app = Celery(
     "my_project",
@@ -26,6 +39,27 @@ celery_app.conf.update(
 
 celery_app.conf.timezone = 'UTC'
 
+# Метрики задач: воркер отдаёт их на отдельном порту (Prometheus, job "celery")
+_task_started = {}
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    registry = metrics_registry()
+    if registry is not None:
+        start_http_server(CELERY_METRICS_PORT, registry=registry)
+    else:
+        start_http_server(CELERY_METRICS_PORT)
+
+@task_prerun.connect
+def track_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def track_task_end(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
 # Конфигурация для отправки почты
 conf = ConnectionConfig(
     MAIL_USERNAME=MAIL_USERNAME,
@@ -91,7 +125,24 @@ celery_app.conf.beat_schedule = {
         'task': 'schedule_user_deletion',
         'schedule': crontab(minute='*/5'),  # Каждые 10 минут
     },
+    'flush-unread-counters': {
+        'task': 'flush_unread_counters',
+        'schedule': timedelta(seconds=UNREAD_FLUSH_INTERVAL),
+    },
+    'collect-orphan-blobs-every-hour': {
+        'task': 'collect_orphan_blobs',
+        'schedule': crontab(minute=0),
+    },
+    'create-message-partitions-daily': {
+        'task': 'create_message_partitions',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
+if MESSAGE_ARCHIVE:
+    celery_app.conf.beat_schedule['archive-message-partitions-monthly'] = {
+        'task': 'archive_message_partitions',
+        'schedule': crontab(day_of_month=1, hour=4, minute=0),
+    }
 DELETION_PERIOD = timedelta(minutes=3)
 @celery_app.task(name="schedule_user_deletion", ignore_result=True)
 def delete_inactive_users():
@@ -127,6 +178,9 @@ async def delete_inactive_users_async():
 
             # Удаляем связанные записи из friends и user_info
             await session.execute(delete(Friends).where(Friends.owner_id == user_id))
+            await session.execute(delete(Friendship).where(
+                (Friendship.user_id == user_id) | (Friendship.friend_id == user_id)
+            ))
             await session.execute(delete(UserInfo).where(UserInfo.user_id == user_id))
 
             # Удаляем самого пользователя
@@ -135,7 +189,109 @@ async def delete_inactive_users_async():
         # Подтверждаем изменения
         await session.commit()
 
+        # Удалённые пользователи не должны аутентифицироваться из кэша
+        for user in inactive_users:
+            await user_cache.invalidate(user.id)
+
         print(f"Удалены {len(inactive_users)} неактивных пользователей.")
+@celery_app.task(name="collect_orphan_blobs", ignore_result=True)
+def collect_orphan_blobs():
+    """Удаление вложений, на которые больше не ссылаются сообщения и профили."""
+    asyncio.get_event_loop().run_until_complete(collect_orphan_blobs_async())
+
+async def collect_orphan_blobs_async():
+    grace = timedelta(seconds=BLOB_GC_GRACE_SECONDS)
+    total = 0
+    async for session in get_async_session():
+        # Пачками, чтобы не держать блокировки на всех осиротевших блобах сразу
+        while True:
+            deleted = await blob_store.collect_garbage(session, grace)
+            total += deleted
+            if not deleted:
+                break
+        # Содержимое, записанное транзакциями, которые потом откатились
+        total += await blob_store.collect_orphan_objects(session, grace)
+    print(f"Удалено {total} неиспользуемых файлов.")
+@celery_app.task(name="flush_unread_counters", ignore_result=True)
+def flush_unread_counters():
+    """Запись счётчиков непрочитанных из Redis в chat_participants."""
+    asyncio.get_event_loop().run_until_complete(flush_unread_counts())
+@celery_app.task(name="create_message_partitions", ignore_result=True)
+def create_message_partitions():
+    """Создание месячных секций messages на несколько месяцев вперёд."""
+    asyncio.get_event_loop().run_until_complete(create_message_partitions_async())
+
+async def create_message_partitions_async():
+    async for session in get_async_session():
+        created = await ensure_partitions(session)
+        if created:
+            print(f"Созданы секции сообщений: {', '.join(created)}")
+@celery_app.task(name="archive_message_partitions", ignore_result=True)
+def archive_message_partitions():
+    """Выгрузка старых секций messages в сжатые файлы и их отсоединение."""
+    asyncio.get_event_loop().run_until_complete(archive_message_partitions_async())
+
+async def archive_message_partitions_async():
+    async for session in get_async_session():
+        archived = await archive_partitions(session)
+        print(f"Архивировано секций сообщений: {len(archived)}")
+# Тип записи -> (модель, колонка с оригиналом, колонка с вариантами, размеры)
+IMAGE_VARIANT_TARGETS = {
+    "avatar": (UserInfo, "pic_path", "pic_variants", AVATAR_VARIANTS),
+    "message": (Message, "text", "variants", PICTURE_VARIANTS),
+}
+@celery_app.task(name="generate_image_variants", ignore_result=True)
+def generate_image_variants(kind: str, record_id: int):
+    """Уменьшенные WebP/JPEG-копии загруженной аватарки или картинки из чата."""
+    asyncio.get_event_loop().run_until_complete(generate_image_variants_async(kind, record_id))
+
+async def generate_image_variants_async(kind: str, record_id: int):
+    model, source_column, variants_column, sizes = IMAGE_VARIANT_TARGETS[kind]
+    async for session in get_async_session():
+        record = await session.get(model, record_id)
+        if record is None:
+            return
+        ref = getattr(record, source_column)
+        try:
+            sha256, filename = parse_blob_ref(ref)
+        except ValueError:
+            return  # Старые файлы из static/ и обычный текст не обрабатываются
+        # Не держим транзакцию открытой, пока обрабатывается изображение
+        await session.rollback()
+
+        source_path = make_staging_path()
+        try:
+            await blob_store.backend.download(sha256, source_path)
+            rendered = render_variants(source_path, filename, sizes)
+        finally:
+            remove_staged_file(source_path)
+
+        try:
+            # Блокировка строки: аватарку могли сменить, пока создавались копии
+            record = await session.get(model, record_id, with_for_update=True, populate_existing=True)
+            if record is None or getattr(record, source_column) != ref:
+                await session.rollback()
+                return
+            # Ссылки хранятся в том же виде, что и оригинал (pic_path аватарки начинается с "/")
+            prefix = "/" if ref.startswith("/") else ""
+            variants = {}
+            for name, formats in rendered.items():
+                for extension, (tmp_path, variant_sha, size, variant_name) in formats.items():
+                    await blob_store.save_file(session, tmp_path, variant_sha, size, refs=1)
+                    variants.setdefault(name, {})[extension] = prefix + make_blob_ref(variant_sha, variant_name)
+            await blob_store.release_variants(session, getattr(record, variants_column))
+            setattr(record, variants_column, variants)
+            await session.commit()
+            if kind == "message":
+                # В кэшированных кадрах последних сообщений ещё нет preview
+                await invalidate_recent(record.chat_id)
+        finally:
+            discard_variants(rendered)
+
+
+async def enqueue_image_variants(kind: str, record_id: int):
+    # delay() синхронно пишет в брокер — из обработчиков запросов вызываем его в пуле потоков
+    await run_in_threadpool(generate_image_variants.delay, kind, record_id)
 @celery_app.task
 def send_reset_password_email(email: str, reset_code: str):
     message = MessageSchema(
@@ -0,0 +1,152 @@
+"""
+Общие фикстуры тестов.
+
+Тестам нужен Postgres (как в docker-compose, параметры — те же переменные DB_*, что у приложения);
+если он недоступен, тесты с базой пропускаются. Каждый тест работает в транзакции,
+которая откатывается в конце, — COMMIT внутри кода приложения фиксирует только точку сохранения.
+Redis заменён на fakeredis в памяти процесса.
+
+    DB_HOST=localhost DB_PORT=5432 DB_NAME=postgres DB_USER=postgres DB_PASS=postgres python -m pytest tests
+"""
+import os
+import uuid
+
+# Модули src читают настройки при импорте
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("DB_NAME", "postgres")
+os.environ.setdefault("DB_USER", "postgres")
+os.environ.setdefault("DB_PASS", "postgres")
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("MAIL_USERNAME", "test@example.com")
+os.environ.setdefault("MAIL_PASSWORD", "test")
+# Бюджеты @query_budget проверяются в каждом HTTP-запросе тестов: превышение — исключение QueryBudgetExceeded
+os.environ.setdefault("QUERY_DEBUG", "true")
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
+
+import aioredis
+import fakeredis
+import fakeredis.aioredis
+
+# Все клиенты Redis (src/auth/utils.py, RedisBroadcastBackend) создаются через aioredis.from_url
+# и в тестах подключаются к одному общему серверу fakeredis — как процессы к одному Redis
+FAKE_REDIS_SERVER = fakeredis.FakeServer()
+aioredis.from_url = lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=FAKE_REDIS_SERVER, **kwargs)
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src import app as app_module
+from src.app import app  # Импорт приложения регистрирует все модели в Base.metadata
+from src.auth import user_routers
+from src.auth.models import User
+from src.auth.utils import redis
+from src.Chat import chat_routers
+from src.Chat.models import Chat, ChatParticipant
+from src.Chat.partitions import ensure_partitions
+from src.database import Base, engine, get_async_session
+from src.friends import friends_routers
+from src.query_debug import QueryLog, count_queries
+
+# У каждого модуля с роутами свой экземпляр зависимости fastapi_users.current_user()
+CURRENT_USER_DEPENDENCIES = [module.current_user for module in (app_module, chat_routers, user_routers, friends_routers)]
+
+_schema_ready = False
+
+
+async def _create_schema():
+    async with engine.begin() as connection:
+        # База, подготовленная alembic upgrade head, используется как есть
+        if not await connection.run_sync(lambda sync: inspect(sync).has_table("messages")):
+            await connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await connection.run_sync(Base.metadata.create_all)
+        await ensure_partitions(AsyncSession(bind=connection))
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def _reset_clients():
+    yield
+    # Соединения пула и клиентов Redis принадлежат циклу событий завершившегося теста
+    await engine.dispose()
+    await redis.flushall()
+    await redis.connection_pool.disconnect()
+
+
+@pytest_asyncio.fixture
+async def db_session():
+    global _schema_ready
+    try:
+        if not _schema_ready:
+            await _create_schema()
+            _schema_ready = True
+        connection = await engine.connect()
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Postgres недоступен: {e!r}")
+    transaction = await connection.begin()
+    session = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        await session.close()
+        await transaction.rollback()
+        await connection.close()
+
+
+@pytest.fixture
+def session_maker(db_session) -> async_sessionmaker:
+    """Фабрика сессий для кода, открывающего сессии сам (async_session_maker): работает в транзакции теста."""
+    return async_sessionmaker(bind=db_session.bind, join_transaction_mode="create_savepoint",
+                              expire_on_commit=False)
+
+
+@pytest.fixture
+def make_user(db_session):
+    async def make(**fields) -> User:
+        name = f"test_{uuid.uuid4().hex[:12]}"
+        user = User(**{"email": f"{name}@example.com", "username": name, "hashed_password": "!",
+                       "is_active": True, "is_verified": True, **fields})
+        db_session.add(user)
+        await db_session.flush()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_chat(db_session):
+    async def make(*users: User) -> Chat:
+        chat = Chat(participants=[user.id for user in users])
+        db_session.add(chat)
+        await db_session.flush()
+        db_session.add_all([ChatParticipant(chat_id=chat.id, user_id=user.id) for user in users])
+        await db_session.flush()
+        return chat
+    return make
+
+
+@pytest.fixture
+def client(db_session):
+    """HTTP-клиент приложения; роуты работают в сессии теста. login(user) — запросы от имени пользователя."""
+    async def session_override():
+        yield db_session
+
+    def login(user: User):
+        for dependency in CURRENT_USER_DEPENDENCIES:
+            app.dependency_overrides[dependency] = lambda: user
+
+    app.dependency_overrides[get_async_session] = session_override
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    client.login = login
+    yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def query_counter() -> QueryLog:
+    """SQL-запросы, выполненные в тесте; бюджет роута — endpoint.__query_budget__ (@query_budget)."""
+    with count_queries() as log:
+        yield log
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from fastapi_users.password import PasswordHelper
+
+from src.auth.auth_cookie import cookie_transport, get_jwt_strategy
+from src.auth.cache import CachedUser, UserCache, _dump_user, _load_user, user_cache
+from src.auth.utils import redis
+
+
+async def until(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_redis", [False, True])
+async def test_invalidation_reaches_other_processes(make_user, use_redis):
+    user = await make_user()
+    # Два воркера с собственными кэшами, общий только Redis
+    first, second = UserCache(100, 60, use_redis), UserCache(100, 60, use_redis)
+    try:
+        for cache in (first, second):
+            await cache.set(user)
+            await until(lambda: cache._subscribed)
+            await cache.set(user)
+        assert await first.get(user.id) is not None
+
+        await second.invalidate(user.id)
+
+        await until(lambda: user.id not in first._entries)
+        assert await first.get(user.id) is None
+    finally:
+        await first.close()
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_password_hash_is_not_cached(make_user):
+    user = await make_user()
+    cache = UserCache(100, 60, use_redis=True)
+    try:
+        await cache.set(user)
+        payload = json.loads(await redis.get(f"{UserCache.REDIS_PREFIX}{user.id}"))
+    finally:
+        await cache.close()
+    assert "hashed_password" not in payload
+    assert payload["email"] == user.email
+
+
+@pytest.mark.asyncio
+async def test_change_password_with_cached_user(client, db_session, make_user):
+    helper = PasswordHelper()
+    user = await make_user()
+    user.hashed_password = helper.hash("old-password")
+    await db_session.flush()
+    # Пользователь из кэша, как его получает current_user: без хэша пароля
+    client.login(_load_user(_dump_user(user)))
+
+    async with client:
+        wrong = await client.post("/change-password", json={"old_password": "nope", "new_password": "new-password"})
+        changed = await client.post("/change-password",
+                                    json={"old_password": "old-password", "new_password": "new-password"})
+
+    assert wrong.status_code == 400
+    assert changed.status_code == 200
+    await db_session.refresh(user)
+    assert helper.verify_and_update("new-password", user.hashed_password)[0]
+
+
+@pytest.mark.asyncio
+async def test_change_password_through_token_cache(client, db_session, make_user):
+    helper = PasswordHelper()
+    user = await make_user(hashed_password=helper.hash("old-password"))
+    token = await get_jwt_strategy().write_token(user)
+    # Запрос идёт через cookie и CachedJWTStrategy, пользователь берётся из кэша процесса
+    await user_cache.set(user)
+    await until(lambda: user_cache._subscribed)
+    await user_cache.set(user)
+    cached = await user_cache.get(user.id)
+    try:
+        async with client:
+            client.cookies.set(cookie_transport.cookie_name, token)
+            changed = await client.post("/change-password",
+                                        json={"old_password": "old-password", "new_password": "new-password"})
+        # Смена пароля сбрасывает запись в кэше
+        assert user.id not in user_cache._entries
+    finally:
+        await user_cache.close()
+
+    assert isinstance(cached, CachedUser)
+    with pytest.raises(AttributeError):
+        cached.hashed_password
+    with pytest.raises(AttributeError):
+        cached.is_active = False
+    assert changed.status_code == 200
+    await db_session.refresh(user)
+    assert helper.verify_and_update("new-password", user.hashed_password)[0]
@@ -0,0 +1,50 @@
+import hashlib
+
+import pytest
+
+from src.auth import user_routers
+from src.storage.store import blob_store
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def user_info(first_name: str, pic_path: str) -> dict:
+    return {"first_name": first_name, "sec_name": None, "last_name": None, "pic_path": pic_path}
+
+
+async def upload(client, content: bytes):
+    return await client.post("/upload", files={"file": ("avatar.png", content, "image/png")})
+
+
+@pytest.mark.asyncio
+async def test_avatar_ref_must_be_own_upload(client, make_user, monkeypatch):
+    async def no_variants(kind, record_id):
+        pass
+
+    monkeypatch.setattr(user_routers, "enqueue_image_variants", no_variants)
+    owner, other = await make_user(), await make_user()
+    try:
+        async with client:
+            client.login(owner)
+            url = (await upload(client, PNG)).json()["url"]
+            # Чужую ссылку на блоб нельзя поставить аватаркой
+            client.login(other)
+            rejected = await client.post("/user_info_add", json=user_info("B", url))
+            client.login(owner)
+            accepted = await client.post("/user_info_add", json=user_info("A", url))
+    finally:
+        sha256 = hashlib.sha256(PNG).hexdigest()
+        blob_store._content_types.pop(sha256, None)
+        await blob_store.backend.delete(sha256)
+    assert rejected.status_code == 403
+    assert accepted.status_code == 200
+    assert accepted.json()["pic_path"] == url
+
+
+@pytest.mark.asyncio
+async def test_avatar_size_limit(client, make_user, monkeypatch):
+    monkeypatch.setattr(user_routers, "AVATAR_MAX_SIZE", len(PNG) - 1)
+    async with client:
+        client.login(await make_user())
+        response = await upload(client, PNG)
+    assert response.status_code == 413
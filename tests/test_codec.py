@@ -0,0 +1,83 @@
+import asyncio
+from types import SimpleNamespace
+
+import msgpack
+import orjson
+import pytest
+
+from src.Chat.codec import ENCODING_JSON, ENCODING_MSGPACK, EncodedMessage, Frame, history_frame, \
+    negotiate_encoding
+from src.Chat.manager import ConnectionManager
+
+
+def handshake(*subprotocols: str):
+    return SimpleNamespace(scope={"subprotocols": list(subprotocols)})
+
+
+@pytest.mark.parametrize("offered, expected", [
+    ((), (None, ENCODING_JSON)),
+    (("chat.v1",), (None, ENCODING_JSON)),
+    (("chat.v2.json",), ("chat.v2.json", ENCODING_JSON)),
+    (("chat.v2.msgpack",), ("chat.v2.msgpack", ENCODING_MSGPACK)),
+    # Выбирается первый поддерживаемый в порядке предпочтения клиента
+    (("chat.v1", "chat.v2.msgpack", "chat.v2.json"), ("chat.v2.msgpack", ENCODING_MSGPACK)),
+    (("chat.v2.json", "chat.v2.msgpack"), ("chat.v2.json", ENCODING_JSON)),
+])
+def test_negotiate_encoding(offered, expected):
+    assert negotiate_encoding(handshake(*offered)) == expected
+
+
+def test_frame_is_serialized_once_per_encoding():
+    frame = Frame.from_json('{"type":"message","id":1,"text":"привет"}')
+    packed = frame.encode(ENCODING_MSGPACK)
+    assert frame.encode(ENCODING_MSGPACK) is packed
+    assert frame.encode(ENCODING_JSON) is frame.encode(ENCODING_JSON)
+    assert msgpack.unpackb(packed) == orjson.loads(frame.encode(ENCODING_JSON))
+
+
+def test_history_frame_in_both_encodings():
+    messages = [EncodedMessage("2026-10-01T12:00:00_1", '{"type":"message","id":1}'),
+                EncodedMessage("2026-10-01T12:00:01_2", '{"type":"message","id":2}')]
+    frame = history_frame(5, messages, "2026-10-01T12:00:00_1")
+    expected = {"type": "history", "chat_id": 5, "messages": [{"type": "message", "id": 1},
+                                                              {"type": "message", "id": 2}],
+                "next_cursor": "2026-10-01T12:00:00_1"}
+    assert orjson.loads(frame.encode(ENCODING_JSON)) == expected
+    assert msgpack.unpackb(frame.encode(ENCODING_MSGPACK)) == expected
+    assert orjson.loads(history_frame(5, [], None).json())["next_cursor"] is None
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.texts = []
+        self.binaries = []
+
+    async def send_text(self, data: str):
+        self.texts.append(data)
+
+    async def send_bytes(self, data: bytes):
+        self.binaries.append(data)
+
+
+@pytest.mark.asyncio
+async def test_each_socket_gets_its_negotiated_encoding():
+    manager = ConnectionManager()
+    json_socket, msgpack_socket = RecordingWebSocket(), RecordingWebSocket()
+    manager.set_encoding(json_socket, ENCODING_JSON, events=True)
+    manager.set_encoding(msgpack_socket, ENCODING_MSGPACK, events=True)
+    for websocket in (json_socket, msgpack_socket):
+        await manager.connect(1, websocket)
+    try:
+        message = {"type": "message", "chat_id": 1, "id": 3, "text": "привет"}
+        await manager.send_message(1, message)
+        deadline = asyncio.get_running_loop().time() + 1
+        while not (json_socket.texts and msgpack_socket.binaries):
+            assert asyncio.get_running_loop().time() < deadline
+            await asyncio.sleep(0.01)
+    finally:
+        await manager.close()
+
+    # JSON — текстовыми кадрами, MessagePack — бинарными, содержимое одинаковое
+    assert json_socket.binaries == [] and msgpack_socket.texts == []
+    assert orjson.loads(json_socket.texts[0]) == message
+    assert msgpack.unpackb(msgpack_socket.binaries[0]) == message
@@ -0,0 +1,240 @@
+import asyncio
+
+import orjson
+import pytest
+
+from src.auth.utils import redis
+from src.Chat import chat_routers
+from src.Chat.broadcast import RedisBroadcastBackend
+from src.Chat.codec import ENCODING_JSON
+from src.Chat.manager import SLOW_CONSUMER_CLOSE_CODE, ConnectionManager
+from src.Chat.unread import CHAT_MEMBERS_KEY_PREFIX, UNREAD_MARKER_FIELD, mark_unread, unread_key
+from src.DB_config import UNREAD_CACHE_TTL
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, data: str):
+        self.frames.append(orjson.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class StalledWebSocket(FakeWebSocket):
+    """Клиент, который перестал читать: send_text ждёт, пока тест не откроет release."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed_with = None
+
+    async def send_text(self, data: str):
+        await self.release.wait()
+        await super().send_text(data)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def until(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+async def drain(manager: ConnectionManager, timeout: float = 1.0):
+    # Писатели сокетов работают отдельными задачами, отправка идёт через wait_for
+    deadline = asyncio.get_running_loop().time() + timeout
+    while any(not client.queue.empty() for client in manager.clients.values()):
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_read_events_skip_legacy_sockets():
+    manager = ConnectionManager()
+    multiplexed, v2, legacy = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.register(multiplexed, 1)
+    manager.set_encoding(v2, ENCODING_JSON, events=True)
+    manager.set_encoding(legacy, ENCODING_JSON)
+    for websocket in (multiplexed, v2, legacy):
+        await manager.connect(1, websocket)
+
+    await manager.send_event(1, {"type": "read", "chat_id": 1, "user_id": 2, "message_id": 3})
+    await manager.send_message(1, {"type": "message", "chat_id": 1, "id": 4})
+    await drain(manager)
+
+    read = {"type": "read", "chat_id": 1, "user_id": 2, "message_id": 3}
+    message = {"type": "message", "chat_id": 1, "id": 4}
+    assert multiplexed.frames == [read, message]
+    assert v2.frames == [read, message]
+    assert legacy.frames == [message]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_mark_unread_refreshes_ttl():
+    await redis.sadd(f"{CHAT_MEMBERS_KEY_PREFIX}7", 1, 2)
+    # Хэш загружен давно: без продления TTL он истёк бы вместе с ещё не записанными в Postgres счётчиками
+    await redis.hset(unread_key(2), mapping={UNREAD_MARKER_FIELD: 0, 7: 1})
+    await redis.expire(unread_key(2), 5)
+
+    await mark_unread(7, sender=1)
+
+    assert int(await redis.hget(unread_key(2), 7)) == 2
+    assert await redis.ttl(unread_key(2)) > UNREAD_CACHE_TTL - 5
+
+
+@pytest.mark.asyncio
+async def test_new_chat_subscribes_open_sockets():
+    manager = ConnectionManager()
+    first, second, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.register(first, 1)
+    await manager.register(second, 1)
+    await manager.register(other, 2)
+
+    await manager.notify_chat_joined(5, [1])
+    await manager.send_message(5, {"type": "message", "chat_id": 5, "id": 1})
+    await drain(manager)
+
+    joined = {"type": "chat_joined", "chat_id": 5}
+    message = {"type": "message", "chat_id": 5, "id": 1}
+    assert first.frames == [joined, message]
+    assert second.frames == [joined, message]
+    assert other.frames == []
+
+    await manager.disconnect_all(first)
+    await manager.disconnect_all(second)
+    assert 1 not in manager.user_sockets
+    assert 5 not in manager.active_connections
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_create_chat_notifies_both_users(client, make_user, monkeypatch):
+    alice, bob = await make_user(), await make_user()
+    joined = []
+
+    async def notify(chat_id, user_ids):
+        joined.append((chat_id, set(user_ids)))
+
+    monkeypatch.setattr(chat_routers.manager, "notify_chat_joined", notify)
+    client.login(alice)
+    async with client:
+        created = (await client.post("/create_chat", params={"second_user_id": bob.id})).json()
+        again = (await client.post("/create_chat", params={"second_user_id": bob.id})).json()
+
+    assert joined == [(created["chat_id"], {alice.id, bob.id})]
+    assert again["chat_id"] == created["chat_id"]
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_delivers_across_managers():
+    # Два процесса приложения с общим Redis (fakeredis): сокеты чата подключены к разным менеджерам
+    first, second = ConnectionManager(RedisBroadcastBackend("redis://test")), \
+        ConnectionManager(RedisBroadcastBackend("redis://test"))
+    here, there, elsewhere = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await first.connect(1, here)
+    await second.connect(1, there)
+    await second.connect(2, elsewhere)
+    try:
+        await first.send_message(1, {"type": "message", "chat_id": 1, "id": 10})
+        await second.send_message(1, {"type": "message", "chat_id": 1, "id": 11})
+        await until(lambda: len(here.frames) == 2 and len(there.frames) == 2)
+
+        ids = [{frame["id"] for frame in socket.frames} for socket in (here, there)]
+        assert ids == [{10, 11}, {10, 11}]
+        assert elsewhere.frames == []
+
+        # После отключения последнего сокета процесс отписывается от канала чата
+        await first.disconnect(1, here)
+        await second.send_message(1, {"type": "message", "chat_id": 1, "id": 12})
+        await until(lambda: len(there.frames) == 3)
+        assert len(here.frames) == 2
+    finally:
+        await first.close()
+        await second.close()
+
+
+def chat_message(message_id: int) -> dict:
+    return {"type": "message", "chat_id": 1, "id": message_id}
+
+
+async def send_paced(manager: ConnectionManager, message_ids):
+    # Между сообщениями писатели успевают разобрать очереди — переполняется только зависший сокет
+    for message_id in message_ids:
+        await manager.send_message(1, chat_message(message_id))
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_stalled_socket_does_not_block_broadcast():
+    manager = ConnectionManager(max_queue=2, send_timeout=10, slow_consumer_policy="drop")
+    stalled, fast = StalledWebSocket(), FakeWebSocket()
+    await manager.connect(1, stalled)
+    await manager.connect(1, fast)
+    try:
+        await send_paced(manager, range(1, 6))
+        # Рассылка не ждёт зависший сокет: остальные участники получают всё сразу
+        await until(lambda: len(fast.frames) == 5)
+        assert [frame["id"] for frame in fast.frames] == [1, 2, 3, 4, 5]
+
+        # Первый кадр у писателя, очередь ограничена max_queue, остальные отброшены
+        client = manager.clients[stalled]
+        assert client.queue.qsize() == 2
+        assert not client.evicted
+        assert stalled in manager.active_connections[1]
+
+        stalled.release.set()
+        await until(lambda: len(stalled.frames) == 3)
+        assert [frame["id"] for frame in stalled.frames] == [1, 2, 3]
+        # С политикой drop клиент продолжает получать новые сообщения
+        await manager.send_message(1, chat_message(6))
+        await until(lambda: len(stalled.frames) == 4)
+    finally:
+        stalled.release.set()
+        await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_queue_overflow_evicts_slow_consumer():
+    manager = ConnectionManager(max_queue=2, send_timeout=10, slow_consumer_policy="disconnect")
+    stalled, fast = StalledWebSocket(), FakeWebSocket()
+    await manager.connect(1, stalled)
+    await manager.connect(1, fast)
+    try:
+        await send_paced(manager, range(1, 5))
+        await until(lambda: stalled.closed_with is not None)
+
+        assert stalled.closed_with == SLOW_CONSUMER_CLOSE_CODE
+        assert stalled not in manager.clients
+        assert list(manager.active_connections[1]) == [fast]
+        await manager.send_message(1, chat_message(5))
+        await until(lambda: len(fast.frames) == 5)
+    finally:
+        stalled.release.set()
+        await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_send_timeout_evicts_stalled_socket():
+    # Очередь не переполнена, но сокет не принимает кадр дольше send_timeout
+    manager = ConnectionManager(max_queue=100, send_timeout=0.05, slow_consumer_policy="drop")
+    stalled = StalledWebSocket()
+    await manager.connect(1, stalled)
+    try:
+        await manager.send_message(1, chat_message(1))
+        await until(lambda: stalled.closed_with is not None)
+        assert stalled.closed_with == SLOW_CONSUMER_CLOSE_CODE
+        assert 1 not in manager.active_connections
+    finally:
+        stalled.release.set()
+        await manager.close()
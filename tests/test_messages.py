@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from src.Chat.chat_routers import save_message
+from src.Chat.history import encode_cursor, fetch_history
+from src.Chat.models import Message
+
+
+@pytest.mark.asyncio
+async def test_orm_insert_assigns_id_from_sequence(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+
+    first = Message(chat_id=chat.id, sender=user.id, text="первое")
+    second = Message(chat_id=chat.id, sender=user.id, text="второе")
+    db_session.add_all([first, second])
+    await db_session.flush()
+
+    assert first.id is not None and second.id > first.id
+    assert first.created_at is not None
+    stored = (await db_session.execute(select(Message).where(Message.chat_id == chat.id))).scalars().all()
+    assert {message.id for message in stored} == {first.id, second.id}
+
+
+@pytest.mark.asyncio
+async def test_save_message_updates_summary_and_recent(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    await save_message(db_session, chat.id, user.id, "привет")
+    message = await save_message(db_session, chat.id, user.id, "как дела?")
+
+    await db_session.refresh(chat)
+    assert chat.last_message_id == message.id
+    assert chat.last_message_preview == "как дела?"
+    assert chat.message_count == 2
+    assert await db_session.get(Message, message.id) is message
+
+
+async def add_messages(db_session, chat_id: int, sender: int, count: int, created_at: datetime):
+    messages = [Message(chat_id=chat_id, sender=sender, text=str(i), created_at=created_at) for i in range(count)]
+    db_session.add_all(messages)
+    await db_session.flush()
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_history_pages_tie_break_on_id(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    # Одинаковое время у всех сообщений: порядок и курсор держатся на id
+    messages = await add_messages(db_session, chat.id, user.id, 5, datetime.utcnow().replace(microsecond=0))
+
+    seen, before = [], None
+    while True:
+        page = await fetch_history(db_session, chat.id, before=before, limit=2)
+        if not page:
+            break
+        seen.extend(message.id for message in page)
+        before = (page[-1].created_at, page[-1].id)
+
+    assert seen == sorted((message.id for message in messages), reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_history_route_cursor(client, db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    messages = await add_messages(db_session, chat.id, user.id, 3, datetime.utcnow())
+
+    client.login(user)
+    async with client:
+        first = (await client.get(f"/chats/{chat.id}/messages", params={"limit": 2})).json()
+        last = (await client.get(f"/chats/{chat.id}/messages",
+                                 params={"limit": 2, "cursor": first["next_cursor"]})).json()
+        malformed = [
+            await client.get(f"/chats/{chat.id}/messages", params={"cursor": cursor})
+            for cursor in ("not-a-cursor", "2024-01-01T00:00:00_abc", "yesterday_5")
+        ]
+
+    assert [message["id"] for message in first["messages"]] == [messages[1].id, messages[2].id]
+    assert first["next_cursor"] == encode_cursor(messages[1])
+    assert [message["id"] for message in last["messages"]] == [messages[0].id]
+    # Неполная последняя страница не предлагает следующую
+    assert last["next_cursor"] is None
+    assert [response.status_code for response in malformed] == [400, 400, 400]
@@ -0,0 +1,28 @@
+import pytest
+
+from src.Chat.chat_routers import my_chats, save_message
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chats", [1, 10])
+async def test_my_chats_within_query_budget(client, db_session, make_user, make_chat, query_counter, chats):
+    user = await make_user()
+    for _ in range(chats):
+        chat = await make_chat(user, await make_user())
+        await save_message(db_session, chat.id, user.id, "привет")
+    client.login(user)
+
+    async with client:
+        start = query_counter.count
+        cold = await client.get("/my_chats")
+        middle = query_counter.count
+        warm = await client.get("/my_chats")
+        # Точки сохранения транзакции теста QueryLog.count не учитывает
+        cold_count = middle - start
+        warm_count = query_counter.count - middle
+
+    assert len(cold.json()["chats"]) == chats
+    assert warm.json() == cold.json()
+    # Число запросов не зависит от числа чатов: чаты одним запросом, непрочитанные — из Redis
+    assert cold_count == 2 and cold_count <= my_chats.__query_budget__
+    assert warm_count == 1
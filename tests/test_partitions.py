@@ -0,0 +1,55 @@
+import csv
+import gzip
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+
+from src.Chat.models import Message
+from src.Chat.partitions import add_months, archive_partitions, create_partition_sql, list_partitions, \
+    month_start, partition_name
+
+
+@pytest.mark.parametrize("start, months, expected", [
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 11, 1), 1, date(2026, 12, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 12, 1), 13, date(2028, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), -14, date(2025, 1, 1)),
+    (date(2026, 5, 1), 0, date(2026, 5, 1)),
+])
+def test_add_months_crosses_year_boundaries(start, months, expected):
+    assert add_months(start, months) == expected
+
+
+def test_partition_bounds_cover_whole_month():
+    # Последняя микросекунда месяца попадает в его секцию, полночь первого числа — уже в следующую
+    last_moment = datetime(2026, 12, 31, 23, 59, 59, 999999)
+    assert partition_name(month_start(last_moment)) == "messages_y2026m12"
+    assert partition_name(month_start(datetime(2027, 1, 1))) == "messages_y2027m01"
+    assert create_partition_sql(date(2026, 12, 1)).endswith(
+        "PARTITION OF messages FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')"
+    )
+
+
+@pytest.mark.asyncio
+async def test_archive_exports_and_detaches_old_partition(db_session, make_user, make_chat, tmp_path):
+    user = await make_user()
+    chat = await make_chat(user)
+    old_month = date(2001, 12, 1)
+    await db_session.execute(text(create_partition_sql(old_month)))
+    message = Message(chat_id=chat.id, sender=user.id, text="старое", created_at=datetime(2001, 12, 31, 23, 59))
+    db_session.add(message)
+    await db_session.flush()
+    assert (partition_name(old_month), date(2002, 1, 1)) in await list_partitions(db_session)
+
+    archived = await archive_partitions(db_session, after_months=1, directory=str(tmp_path), drop=False)
+
+    assert partition_name(old_month) in archived
+    # Секции текущего месяца и следующих не трогаются
+    assert partition_name(month_start(datetime.utcnow())) not in archived
+    assert partition_name(old_month) not in {name for name, _ in await list_partitions(db_session)}
+    with gzip.open(tmp_path / f"{partition_name(old_month)}.csv.gz", "rt") as archive:
+        rows = list(csv.DictReader(archive))
+    assert [(int(row["id"]), row["text"]) for row in rows] == [(message.id, "старое")]
@@ -0,0 +1,27 @@
+import pytest
+
+from src.Chat.chat_routers import my_chats
+from src.query_debug import QueryBudgetExceeded, QueryLog, statement_shape
+
+
+def test_in_lists_of_any_length_have_one_shape():
+    # Так диалект asyncpg отображает IN с расширяемыми параметрами
+    short = "SELECT chats.id FROM chats WHERE chats.id IN ($1::INTEGER, $2::INTEGER)"
+    long = "SELECT chats.id FROM chats WHERE chats.id IN ($1::INTEGER, $2::INTEGER, $3::INTEGER, $4::INTEGER)"
+    assert statement_shape(short) == statement_shape(long) == "SELECT chats.id FROM chats WHERE chats.id IN (?, ...)"
+    assert statement_shape("SELECT $1::TIMESTAMP WITHOUT TIME ZONE AND x = $2::VARCHAR[]") == \
+        "SELECT ? AND x = ?"
+
+    log = QueryLog()
+    log.statements = [short, long, short.replace("$2::INTEGER", "$2::INTEGER, $3::INTEGER")]
+    assert log.repeated(threshold=3) == [("SELECT chats.id FROM chats WHERE chats.id IN (?, ...)", 3)]
+
+
+@pytest.mark.asyncio
+async def test_budget_is_enforced_in_tests(client, make_user, monkeypatch):
+    # conftest включает QUERY_DEBUG и QUERY_BUDGET_STRICT: превышение бюджета роута роняет запрос
+    client.login(await make_user())
+    monkeypatch.setattr(my_chats, "__query_budget__", 0)
+    async with client:
+        with pytest.raises(QueryBudgetExceeded):
+            await client.get("/my_chats")
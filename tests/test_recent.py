@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.auth.utils import redis
+from src.Chat import recent
+from src.Chat.models import Message
+from src.Chat.recent import fill_recent, parse_ring_entry, push_recent, recent_key, _generation
+
+CHAT_ID = 1
+STARTED = datetime(2026, 10, 1, 12, 0, 0)
+
+
+def message(message_id: int, seconds: float = None) -> Message:
+    # По умолчанию время растёт вместе с id; seconds задаёт его явно
+    offset = message_id if seconds is None else seconds
+    return Message(id=message_id, chat_id=CHAT_ID, sender=1, text=str(message_id), is_picture=False,
+                   created_at=STARTED + timedelta(seconds=offset))
+
+
+async def ring_ids() -> list:
+    entries = await redis.lrange(recent_key(CHAT_ID), 0, -1)
+    return [int(parse_ring_entry(entry).cursor.rsplit("_", 1)[1]) for entry in entries]
+
+
+async def fill(*message_ids: int):
+    # Заполнение из Postgres: сообщения от новых к старым
+    await fill_recent(CHAT_ID, await _generation(CHAT_ID),
+                      [message(message_id) for message_id in sorted(message_ids, reverse=True)])
+
+
+@pytest.mark.asyncio
+async def test_push_skips_list_that_was_not_filled():
+    await push_recent([message(1)])
+    assert await redis.exists(recent_key(CHAT_ID)) == 0
+    # Счётчик поколений растёт, чтобы заполнение, начатое раньше, не записало устаревший список
+    assert await _generation(CHAT_ID) == "1"
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_pushes_keep_list_sorted():
+    await fill(1, 2, 3)
+    # Воркеры фиксируют сообщения 5 и 4 в обратном порядке, 4 приходит последним
+    await push_recent([message(5)])
+    await push_recent([message(4)])
+    # Пачка с перемешанным порядком и повтор уже добавленного сообщения
+    await push_recent([message(7), message(6), message(5)])
+    assert await ring_ids() == [7, 6, 5, 4, 3, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_equal_created_at_sorted_by_id():
+    await fill_recent(CHAT_ID, await _generation(CHAT_ID), [message(10, seconds=0)])
+    await push_recent([message(12, seconds=0)])
+    await push_recent([message(11, seconds=0)])
+    assert await ring_ids() == [12, 11, 10]
+
+
+@pytest.mark.asyncio
+async def test_late_message_older_than_full_list_is_dropped(monkeypatch):
+    monkeypatch.setattr(recent, "RECENT_MESSAGES_SIZE", 3)
+    await fill(3, 4, 5)
+    await push_recent([message(6)])
+    assert await ring_ids() == [6, 5, 4]
+    # Старше всех сообщений полного списка: остаётся только в Postgres
+    await push_recent([message(2)])
+    assert await ring_ids() == [6, 5, 4]
+    await push_recent([message(1, seconds=4.5)])
+    assert await ring_ids() == [6, 5, 1]
+
+
+@pytest.mark.asyncio
+async def test_fill_is_discarded_after_concurrent_push():
+    generation = await _generation(CHAT_ID)
+    # Пока читалась история, в чат записали новое сообщение
+    await push_recent([message(3)])
+    await fill_recent(CHAT_ID, generation, [message(2), message(1)])
+    assert await redis.exists(recent_key(CHAT_ID)) == 0
@@ -0,0 +1,23 @@
+import pytest
+
+from src.Chat.chat_routers import search_chat_messages
+from src.Chat.models import Message
+
+
+@pytest.mark.asyncio
+async def test_highlight_escapes_message_html(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    db_session.add(Message(chat_id=chat.id, sender=user.id,
+                           text="привет <svg/onload=alert(1)> \x02мир\x03 & всем"))
+    await db_session.flush()
+
+    result = await search_chat_messages(q="привет", chat_id=chat.id, cursor=None, limit=20,
+                                        user=user, session=db_session)
+
+    [found] = result["messages"]
+    highlight = found["highlight"]
+    assert "<mark>привет</mark>" in highlight
+    # Единственная разметка во фрагменте — <mark>
+    assert highlight.replace("<mark>", "").replace("</mark>", "").count("<") == 0
+    assert "&amp;" in highlight and "\x02" not in highlight
@@ -0,0 +1,144 @@
+import hashlib
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from moto import mock_aws
+
+from src.Chat import chat_routers
+from src.storage.backends import LocalBlobBackend, S3BlobBackend
+from src.storage.store import BlobStore, blob_store, make_blob_ref, make_staging_path
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+HTML = b"<html><script>alert(document.cookie)</script></html>"
+
+
+@pytest_asyncio.fixture
+async def save_blob(db_session):
+    saved = []
+
+    async def save(content: bytes) -> str:
+        path = make_staging_path()
+        with open(path, "wb") as file:
+            file.write(content)
+        sha256 = hashlib.sha256(content).hexdigest()
+        await blob_store.save_file(db_session, path, sha256, len(content))
+        saved.append(sha256)
+        return sha256
+
+    yield save
+    # Строки blobs откатываются вместе с транзакцией теста, файлы удаляются явно
+    for sha256 in saved:
+        blob_store._content_types.pop(sha256, None)
+        await blob_store.backend.delete(sha256)
+
+
+@pytest.mark.asyncio
+async def test_blob_type_comes_from_content_not_name(client, save_blob):
+    # Имя файла в ссылке выбирает загрузивший, тип — только по содержимому блоба
+    sha256 = await save_blob(HTML)
+    async with client:
+        response = await client.get("/" + make_blob_ref(sha256, "avatar.png"))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-disposition"] == "attachment; filename*=UTF-8''avatar.png"
+
+
+@pytest.mark.asyncio
+async def test_image_blob_is_inline(client, save_blob):
+    sha256 = await save_blob(PNG)
+    async with client:
+        response = await client.get("/" + make_blob_ref(sha256, "page.html"))
+        cached = await client.get("/" + make_blob_ref(sha256, "page.html"),
+                                  headers={"if-none-match": f'"{sha256}"'})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert "content-disposition" not in response.headers
+    assert response.content == PNG
+    assert cached.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_unknown_blob_is_not_found(client):
+    async with client:
+        response = await client.get("/" + make_blob_ref("0" * 64, "a.png"))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_variants_are_queued_only_for_images(db_session, make_user, make_chat, monkeypatch):
+    queued = []
+
+    async def enqueue(kind, record_id):
+        queued.append((kind, record_id))
+
+    async def no_unread(chat_id, sender):
+        pass
+
+    monkeypatch.setattr(chat_routers, "enqueue_image_variants", enqueue)
+    monkeypatch.setattr(chat_routers, "mark_unread", no_unread)
+    user = await make_user()
+    chat = await make_chat(user)
+    picture = await chat_routers.save_file_message(db_session, chat.id, user.id, "a.png", stage(PNG),
+                                                   hashlib.sha256(PNG).hexdigest(), len(PNG))
+    # Расширение ничего не решает: тип определяется по содержимому
+    await chat_routers.save_file_message(db_session, chat.id, user.id, "b.png", stage(HTML),
+                                         hashlib.sha256(HTML).hexdigest(), len(HTML))
+    for content in (PNG, HTML):
+        await blob_store.backend.delete(hashlib.sha256(content).hexdigest())
+    assert queued == [("message", picture.id)]
+
+
+@pytest.fixture
+def s3_backend():
+    # Стенд S3 в памяти процесса (moto) вместо MinIO
+    with mock_aws():
+        backend = S3BlobBackend(None, "blobs-test", "test", "test", "us-east-1")
+        backend._client.create_bucket(Bucket="blobs-test")
+        yield backend
+
+
+def stage(content: bytes) -> str:
+    path = make_staging_path()
+    with open(path, "wb") as file:
+        file.write(content)
+    return path
+
+
+@pytest.mark.asyncio
+async def test_s3_backend_roundtrip(s3_backend, tmp_path):
+    png_key, html_key = hashlib.sha256(PNG).hexdigest(), hashlib.sha256(HTML).hexdigest()
+    await s3_backend.put_file(png_key, stage(PNG), "image/png")
+    await s3_backend.put_file(html_key, stage(HTML), "application/octet-stream")
+
+    png = s3_backend._client.head_object(Bucket="blobs-test", Key=png_key)
+    html = s3_backend._client.head_object(Bucket="blobs-test", Key=html_key)
+    assert png["ContentType"] == "image/png" and "ContentDisposition" not in png
+    assert html["ContentDisposition"] == "attachment"
+
+    await s3_backend.download(png_key, str(tmp_path / "copy"))
+    assert (tmp_path / "copy").read_bytes() == PNG
+    assert png_key in s3_backend.url(png_key)
+
+    listed = [key async for page in s3_backend.list_keys() for key, _ in page]
+    assert sorted(listed) == sorted([png_key, html_key])
+    await s3_backend.delete(html_key)
+    assert [key async for page in s3_backend.list_keys() for key, _ in page] == [png_key]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend_name", ["local", "s3"])
+async def test_gc_removes_objects_without_rows(backend_name, db_session, s3_backend, tmp_path):
+    backend = s3_backend if backend_name == "s3" else LocalBlobBackend(str(tmp_path))
+    store = BlobStore(backend)
+    kept = hashlib.sha256(PNG).hexdigest()
+    await store.save_file(db_session, stage(PNG), kept, len(PNG))
+    # Содержимое записано, а транзакция загрузки откатилась — строки в blobs нет
+    orphan = hashlib.sha256(HTML).hexdigest()
+    await backend.put_file(orphan, stage(HTML), "application/octet-stream")
+
+    assert await store.collect_orphan_objects(db_session, grace=timedelta(hours=1)) == 0
+    assert await store.collect_orphan_objects(db_session, grace=timedelta(0)) == 1
+    assert [key async for page in backend.list_keys() for key, _ in page] == [kept]
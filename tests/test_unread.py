@@ -0,0 +1,36 @@
+import pytest
+
+from src.Chat import unread
+from src.Chat.models import ChatParticipant
+from src.Chat.writer import MessageWriter
+
+
+@pytest.mark.asyncio
+async def test_read_cursor_follows_time_across_id_blocks(db_session, session_maker, make_user, make_chat,
+                                                          monkeypatch):
+    monkeypatch.setattr(unread, "async_session_maker", session_maker)
+    reader, sender = await make_user(), await make_user()
+    chat = await make_chat(reader, sender)
+    # Два воркера: первый зарезервировал блок id раньше, поэтому его новые сообщения получают меньшие id
+    low_block = MessageWriter(session_maker=session_maker, flush_interval=60, batch_size=10)
+    high_block = MessageWriter(session_maker=session_maker, flush_interval=60, batch_size=10)
+    first = await low_block.submit(chat.id, sender.id, "первое")
+    second = await high_block.submit(chat.id, sender.id, "второе")
+    third = await low_block.submit(chat.id, sender.id, "третье")
+    await low_block.flush()
+    await high_block.flush()
+    first, second, third = [await pending.durable for pending in (first, second, third)]
+    assert first.id < third.id < second.id
+    assert first.created_at < second.created_at < third.created_at
+
+    assert await unread.mark_read(chat.id, reader.id, second.id) == 1
+    # Более новое сообщение с меньшим id сдвигает курсор
+    assert await unread.mark_read(chat.id, reader.id, third.id) == 0
+    # Более старое — нет, даже если его id больше
+    assert await unread.mark_read(chat.id, reader.id, second.id) is None
+
+    participant = await db_session.get(ChatParticipant, (chat.id, reader.id))
+    await db_session.refresh(participant)
+    assert (participant.last_read_message_id, participant.last_read_at) == (third.id, third.created_at)
+    await low_block.close()
+    await high_block.close()
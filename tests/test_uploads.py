@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import os
+
+import pytest
+
+from src.Chat import uploads
+from src.Chat.uploads import ChunkedUpload, UploadError, save_base64_upload
+
+CONTENT = os.urandom(3 * 1024 + 17)
+
+
+def chunks(data: bytes, size: int):
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+
+@pytest.mark.asyncio
+async def test_chunked_upload_streams_to_staging_file():
+    upload = ChunkedUpload("../../etc/photo.png", len(CONTENT))
+    await upload.open()
+    for chunk in chunks(CONTENT, 1024):
+        await upload.write(chunk)
+    path, sha256 = await upload.finish()
+    try:
+        with open(path, "rb") as file:
+            assert file.read() == CONTENT
+    finally:
+        os.remove(path)
+    assert sha256 == hashlib.sha256(CONTENT).hexdigest()
+    # Путь из имени файла отбрасывается
+    assert upload.filename == "photo.png"
+
+
+@pytest.mark.asyncio
+async def test_chunked_upload_rejects_more_than_declared():
+    upload = ChunkedUpload("a.bin", 10)
+    await upload.open()
+    await upload.write(b"x" * 8)
+    with pytest.raises(UploadError):
+        await upload.write(b"x" * 3)
+    assert upload.received == 8
+    await upload.abort()
+    assert not os.path.exists(upload.path)
+
+
+@pytest.mark.asyncio
+async def test_chunked_upload_incomplete_finish():
+    upload = ChunkedUpload("a.bin", 10)
+    await upload.open()
+    await upload.write(b"x" * 4)
+    with pytest.raises(UploadError):
+        await upload.finish()
+    await upload.abort()
+    assert not os.path.exists(upload.path)
+
+
+@pytest.mark.parametrize("size", [0, -1, "10", None])
+def test_chunked_upload_requires_size(size):
+    with pytest.raises(UploadError):
+        ChunkedUpload("a.bin", size)
+
+
+def test_size_limit_checked_before_first_chunk(monkeypatch):
+    monkeypatch.setattr(uploads, "CHAT_UPLOAD_MAX_SIZE", 1024)
+    ChunkedUpload("a.bin", 1024)
+    with pytest.raises(UploadError):
+        ChunkedUpload("a.bin", 1025)
+
+
+@pytest.mark.asyncio
+async def test_base64_upload(monkeypatch):
+    path, sha256, size = await save_base64_upload("data:image/png;base64," + base64.b64encode(CONTENT).decode())
+    try:
+        with open(path, "rb") as file:
+            assert file.read() == CONTENT
+    finally:
+        os.remove(path)
+    assert (sha256, size) == (hashlib.sha256(CONTENT).hexdigest(), len(CONTENT))
+
+    with pytest.raises(UploadError):
+        await save_base64_upload("не base64")
+    monkeypatch.setattr(uploads, "CHAT_UPLOAD_MAX_SIZE", len(CONTENT) - 1)
+    with pytest.raises(UploadError):
+        await save_base64_upload(base64.b64encode(CONTENT).decode())
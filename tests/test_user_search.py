@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from src.auth.models import UserInfo
+
+
+@pytest_asyncio.fixture
+async def trigram(db_session):
+    # similarity() и индексы *_trgm — из расширения pg_trgm
+    if not (await db_session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))).scalar():
+        pytest.skip("pg_trgm не установлен")
+
+
+async def search_all(client, **params) -> list:
+    # Все страницы по курсору из X-Next-Cursor
+    found, cursor = [], None
+    while True:
+        response = await client.get("/search_users", params={**params, **({"cursor": cursor} if cursor else {})})
+        if response.status_code == 404:
+            return found
+        found.extend(user["id"] for user in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return found
+
+
+@pytest.mark.asyncio
+async def test_include_names_matches_each_table(client, db_session, trigram, make_user):
+    token = f"zq{uuid.uuid4().hex[:8]}"
+    by_username = await make_user(username=f"{token}_nick")
+    by_first_name, by_last_name, unrelated = await make_user(), await make_user(), await make_user()
+    db_session.add_all([
+        UserInfo(user_id=by_username.id, first_name="Анна"),
+        UserInfo(user_id=by_first_name.id, first_name=token.upper()),
+        UserInfo(user_id=by_last_name.id, last_name=f"{token}ова"),
+        UserInfo(user_id=unrelated.id, first_name="Иван"),
+    ])
+    await db_session.flush()
+
+    async with client:
+        usernames = await search_all(client, username=token, limit=1)
+        names = await search_all(client, username=token, include_names=True, limit=1)
+
+    assert usernames == [by_username.id]
+    # Совпадение в нескольких колонках не дублирует пользователя, страницы не пересекаются
+    assert sorted(names) == sorted([by_username.id, by_first_name.id, by_last_name.id])
+
+
+@pytest.mark.asyncio
+async def test_short_query_is_rejected(client):
+    # Одна-две буквы индекс pg_trgm не обслуживает
+    async with client:
+        response = await client.get("/search_users", params={"username": "ab"})
+    assert response.status_code == 422
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import orjson
+import pytest
+from fastapi import status
+
+from src.auth.utils import redis
+from src.Chat import chat_routers, utils
+from src.Chat.manager import ConnectionManager
+from src.Chat.utils import EMPTY_MEMBERSHIP_MARKER, MEMBERSHIP_KEY_PREFIX, get_user_chat_ids
+
+
+class ScriptedWebSocket:
+    """Сокет для прямого вызова обработчиков: кадры клиента отдаются по очереди, затем разрыв."""
+
+    def __init__(self, *frames: dict):
+        self.scope = {"subprotocols": []}
+        self.cookies = {}
+        self.incoming = [{"type": "websocket.receive", "text": json.dumps(frame)} for frame in frames]
+        self.expected_replies = len(frames)
+        self.frames = []
+        self.accepted = False
+        self.closed_with = None
+
+    async def accept(self, subprotocol=None):
+        self.accepted = True
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+    async def receive(self) -> dict:
+        if self.incoming:
+            return self.incoming.pop(0)
+        # Разрыв только после ответа на последний кадр: писатель сокета работает отдельной задачей
+        while len(self.frames) < self.expected_replies:
+            await asyncio.sleep(0.01)
+        return {"type": "websocket.disconnect"}
+
+    async def send_text(self, data: str):
+        self.frames.append(orjson.loads(data))
+
+
+@pytest.fixture
+def ws_manager(monkeypatch, session_maker) -> ConnectionManager:
+    # Свой менеджер на тест; членство читается в транзакции теста
+    manager = ConnectionManager()
+    monkeypatch.setattr(chat_routers, "manager", manager)
+    monkeypatch.setattr(utils, "async_session_maker", session_maker)
+    return manager
+
+
+@pytest.fixture
+def ws_login(monkeypatch):
+    """ws_login(user) — пользователь, которого вернёт проверка JWT из cookie рукопожатия."""
+    def login(user):
+        async def websocket_user(websocket):
+            return user
+        monkeypatch.setattr(chat_routers, "get_websocket_user", websocket_user)
+    return login
+
+
+@pytest.mark.asyncio
+async def test_chat_websocket_rejects_non_member_before_accept(ws_manager, ws_login, make_user, make_chat):
+    member, stranger = await make_user(), await make_user()
+    chat = await make_chat(member)
+    ws_login(stranger)
+    websocket = ScriptedWebSocket()
+
+    await chat_routers.chat_websocket(websocket, chat.id)
+
+    assert websocket.closed_with == status.WS_1008_POLICY_VIOLATION
+    assert not websocket.accepted
+    assert websocket not in ws_manager.clients and chat.id not in ws_manager.active_connections
+    await ws_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_websockets_reject_anonymous_before_accept(ws_manager, ws_login, make_user, make_chat):
+    chat = await make_chat(await make_user())
+    ws_login(None)
+    chat_socket, multiplexed = ScriptedWebSocket(), ScriptedWebSocket()
+
+    await chat_routers.chat_websocket(chat_socket, chat.id)
+    await chat_routers.multiplexed_websocket(multiplexed)
+
+    for websocket in (chat_socket, multiplexed):
+        assert websocket.closed_with == status.WS_1008_POLICY_VIOLATION
+        assert not websocket.accepted
+    assert not ws_manager.clients
+    await ws_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_multiplexed_websocket_rejects_foreign_chat(ws_manager, ws_login, make_user, make_chat):
+    member, stranger = await make_user(), await make_user()
+    chat = await make_chat(member)
+    ws_login(stranger)
+    websocket = ScriptedWebSocket({"type": "subscribe", "chat_id": chat.id})
+
+    await chat_routers.multiplexed_websocket(websocket)
+
+    assert websocket.frames == [{"type": "error", "chat_id": chat.id, "error": "Chat not found"}]
+    assert chat.id not in ws_manager.active_connections
+    await ws_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_create_chat_invalidates_cached_membership(client, make_user, session_maker, monkeypatch):
+    monkeypatch.setattr(utils, "async_session_maker", session_maker)
+    alice, bob = await make_user(), await make_user()
+    # У пользователей ещё нет чатов: в кэше только маркер пустого множества
+    assert await get_user_chat_ids(alice.id) == set()
+    assert await get_user_chat_ids(bob.id) == set()
+    assert await redis.smembers(f"{MEMBERSHIP_KEY_PREFIX}{alice.id}") == {EMPTY_MEMBERSHIP_MARKER.encode()}
+
+    client.login(alice)
+    async with client:
+        chat_id = (await client.post("/create_chat", params={"second_user_id": bob.id})).json()["chat_id"]
+
+    # Новый чат виден обоим сразу, без ожидания CHAT_MEMBERSHIP_CACHE_TTL
+    assert await get_user_chat_ids(alice.id) == {chat_id}
+    assert await get_user_chat_ids(bob.id) == {chat_id}
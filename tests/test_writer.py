@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.auth.utils import redis
+from src.Chat import chat_routers
+from src.Chat.models import Chat, Message
+from src.Chat.writer import JOURNAL_ALIVE_PREFIX, JOURNAL_OWNERS, MessageWriter
+
+
+def make_writer(db_session, **kwargs) -> MessageWriter:
+    # Сессии писателя работают в транзакции теста
+    session_maker = async_sessionmaker(bind=db_session.bind, join_transaction_mode="create_savepoint",
+                                       expire_on_commit=False)
+    return MessageWriter(session_maker=session_maker, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_do_not_block_batch(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    # Длинное окно: пачку записывает сам тест, а не фоновый цикл
+    writer = make_writer(db_session, flush_interval=60)
+    good = await writer.submit(chat.id, user.id, "дошло")
+    bad_text = await writer.submit(chat.id, user.id, "нулевой\x00байт")  # DataError
+    missing_chat = await writer.submit(chat.id + 1_000_000, user.id, "в никуда")  # IntegrityError
+    await writer.flush()
+
+    assert (await good.durable).id == good.message.id
+    for pending in (bad_text, missing_chat):
+        with pytest.raises(DBAPIError):
+            await pending.durable
+    # Отклонённые сообщения не остаются в журнале и не записываются при повторе
+    assert await redis.xlen(writer.journal_stream) == 0
+    stored = (await db_session.execute(select(Message.id).where(Message.sender == user.id))).scalars().all()
+    assert stored == [good.message.id]
+    await db_session.refresh(chat)
+    assert chat.message_count == 1
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_flush_loop_writes_after_interval(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    writer = make_writer(db_session, flush_interval=0.01)
+    pending = await writer.submit(chat.id, user.id, "привет")
+    message = await asyncio.wait_for(pending.durable, 5)
+    assert await db_session.get(Message, message.id) is not None
+    await writer.close()
+
+
+@pytest.mark.asyncio
+async def test_close_during_slow_write_keeps_batch(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    writer = make_writer(db_session, flush_interval=0.01)
+    write = writer._write
+    started = asyncio.Event()
+
+    async def slow_write(batch):
+        # Первая запись зависает, пока её не отменит close()
+        if not started.is_set():
+            started.set()
+            await asyncio.sleep(3600)
+        await write(batch)
+
+    writer._write = slow_write
+    pending = await writer.submit(chat.id, user.id, "при остановке")
+    await asyncio.wait_for(started.wait(), 5)
+    await writer.close()
+
+    assert (await asyncio.wait_for(pending.durable, 1)).id == pending.message.id
+    assert await db_session.get(Message, pending.message.id) is not None
+    assert writer._buffer == []
+
+
+@pytest.mark.asyncio
+async def test_recover_replays_only_stopped_workers(db_session, make_user, make_chat):
+    user = await make_user()
+    chat = await make_chat(user)
+    stopped, alive = make_writer(db_session, flush_interval=60), make_writer(db_session, flush_interval=60)
+    lost = await stopped.submit(chat.id, user.id, "от остановленного воркера")
+    waiting = await alive.submit(chat.id, user.id, "ещё в буфере живого воркера")
+    # Аварийная остановка: ни записи буфера, ни продления отметки
+    stopped._flusher.cancel()
+    stopped._heartbeat.cancel()
+    await redis.delete(f"{JOURNAL_ALIVE_PREFIX}{stopped.worker_id}")
+
+    recovering = make_writer(db_session, flush_interval=60)
+    await recovering.recover()
+
+    assert await db_session.get(Message, lost.message.id) is not None
+    assert await db_session.get(Message, waiting.message.id) is None
+    assert await redis.exists(stopped.journal_stream) == 0
+    assert await redis.hget(JOURNAL_OWNERS, stopped.journal_stream) is None
+    assert await redis.xlen(alive.journal_stream) == 1
+    assert await redis.hget(JOURNAL_OWNERS, alive.journal_stream) == alive.worker_id.encode()
+
+    await alive.close()
+    assert (await waiting.durable).id == waiting.message.id
+    assert await redis.hkeys(JOURNAL_OWNERS) == [recovering.journal_stream.encode()]
+    await recovering.close()
+    assert await redis.hkeys(JOURNAL_OWNERS) == []
+
+
+@pytest.mark.asyncio
+async def test_rejected_message_is_not_delivered(db_session, make_user, make_chat, monkeypatch):
+    user = await make_user()
+    chat = await make_chat(user)
+    writer = make_writer(db_session, flush_interval=60)
+    delivered, personal, unread = [], [], []
+
+    async def send_message(chat_id, message):
+        delivered.append(message)
+
+    async def send_personal(websocket, frame):
+        personal.append(frame)
+
+    async def mark_unread(chat_id, sender):
+        unread.append(chat_id)
+
+    monkeypatch.setattr(chat_routers.manager, "send_message", send_message)
+    monkeypatch.setattr(chat_routers, "mark_unread", mark_unread)
+    monkeypatch.setattr(chat_routers.manager, "send_personal", send_personal)
+    monkeypatch.setattr(chat_routers, "MESSAGE_WRITE_BEHIND", True)
+    monkeypatch.setattr(chat_routers, "message_writer", writer)
+    await chat_routers.post_text_message(None, chat.id + 1_000_000, user.id, "в никуда", "c1")
+    await chat_routers.post_text_message(None, chat.id, user.id, "дошло", "c2")
+    await writer.flush()
+    await asyncio.sleep(0.05)
+
+    assert [message["text"] for message in delivered] == ["дошло"]
+    assert unread == [chat.id]
+    assert [(frame["type"], frame["client_id"]) for frame in personal] == [("error", "c1"), ("ack", "c2")]
+    await writer.close()